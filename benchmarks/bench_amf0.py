@@ -0,0 +1,163 @@
+"""
+connect and onMetaData payloads per second decoded and encoded by the struct based AMF0
+codec against the bitstring codec used up to 0.3.x.
+
+    python -m benchmarks.bench_amf0
+"""
+
+import time
+
+from bitstring import BitArray, BitStream
+
+from pyrtmp.amf.serializers import AMF0Deserializer, AMF0Reader, AMF0Serializer
+
+COUNT = 1000
+
+# as sent by OBS
+CONNECT = [
+    "connect",
+    1,
+    {
+        "app": "live",
+        "type": "nonprivate",
+        "flashVer": "FMLE/3.0 (compatible; FMSc/1.0)",
+        "swfUrl": "rtmp://127.0.0.1:1935/live",
+        "tcUrl": "rtmp://127.0.0.1:1935/live",
+        "fpad": False,
+        "capabilities": 15.0,
+        "audioCodecs": 4071.0,
+        "videoCodecs": 252.0,
+        "videoFunction": 1.0,
+    },
+]
+METADATA = [
+    "@setDataFrame",
+    "onMetaData",
+    [
+        {"duration": 0.0},
+        {"fileSize": 0.0},
+        {"width": 1920.0},
+        {"height": 1080.0},
+        {"videocodecid": 7.0},
+        {"videodatarate": 6000.0},
+        {"framerate": 60.0},
+        {"audiocodecid": 10.0},
+        {"audiodatarate": 160.0},
+        {"audiosamplerate": 48000.0},
+        {"audiosamplesize": 16.0},
+        {"audiochannels": 2.0},
+        {"stereo": True},
+        {"2.1": False},
+        {"3.1": False},
+        {"4.0": False},
+        {"4.1": False},
+        {"5.1": False},
+        {"7.1": False},
+        {"encoder": "obs-output module (libobs version 30.0.0)"},
+        {"title": "stream"},
+        {"comment": "benchmark"},
+        {"profile": "high"},
+        {"level": "4.2"},
+        {"keyframeinterval": 2.0},
+        {"colorspace": "bt709"},
+        {"colorrange": "partial"},
+        {"hdr": False},
+        {"bframes": 2.0},
+        {"rate_control": "CBR"},
+    ],
+]
+
+
+def legacy_encode(data: BitStream, value) -> None:
+    if isinstance(value, str):
+        data.append(BitArray(uint=0x02, length=8))
+        data.append(BitArray(uint=len(value), length=16))
+        data.append(BitArray(bytes=value.encode(), length=len(value) * 8))
+    elif isinstance(value, bool):
+        data.append(BitArray(uint=0x01, length=8))
+        data.append(BitArray(uint=int(value), length=8))
+    elif isinstance(value, (float, int)):
+        data.append(BitArray(uint=0x00, length=8))
+        data.append(BitArray(float=value, length=64))
+    elif isinstance(value, dict):
+        data.append(BitArray(uint=0x03, length=8))
+        for key, item in value.items():
+            data.append(BitArray(uint=len(key), length=16))
+            data.append(BitArray(bytes=key.encode(), length=len(key) * 8))
+            legacy_encode(data, item)
+        data.append(BitArray(uint=0x09, length=24))
+    elif isinstance(value, list):
+        data.append(BitArray(uint=0x08, length=8))
+        data.append(BitArray(uint=len(value), length=32))
+        for item in value:
+            for key in item:
+                data.append(BitArray(uint=len(key), length=16))
+                data.append(BitArray(bytes=key.encode(), length=len(key) * 8))
+                legacy_encode(data, item[key])
+        data.append(BitArray(uint=0x09, length=24))
+
+
+def legacy_decode(data: BitStream):
+    obj_type = data.read("uint:8")
+    if obj_type == 0x02:
+        return data.read(f"bytes:{data.read('uint:16')}").decode()
+    if obj_type == 0x00:
+        return data.read("float:64")
+    if obj_type == 0x01:
+        return data.read("uint:8") != 0
+    if obj_type in (0x03, 0x08):
+        if obj_type == 0x08:
+            data.read("uint:32")
+        values = []
+        while data.peek("bytes:3").hex() != "000009":
+            key = data.read(f"bytes:{data.read('uint:16')}").decode()
+            values.append((key, legacy_decode(data)))
+        data.bytepos += 3
+        return dict(values) if obj_type == 0x03 else [{key: value} for key, value in values]
+    raise NotImplementedError
+
+
+def bench_legacy(values: list) -> tuple[float, float]:
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        data = BitStream()
+        for value in values:
+            legacy_encode(data, value)
+        payload = data.bytes
+    encoding = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        data = BitStream(payload)
+        [legacy_decode(data) for _ in values]
+    return encoding, time.perf_counter() - start
+
+
+def bench_struct(values: list) -> tuple[float, float]:
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        data = bytearray()
+        for value in values:
+            AMF0Serializer.create_object(data, value)
+    encoding = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        reader = AMF0Reader(data)
+        [AMF0Deserializer.from_stream(reader) for _ in values]
+    return encoding, time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'payload':>10} {'bytes':>6} {'':>6} {'legacy/s':>10} {'struct/s':>10} {'speedup':>8}")
+    for name, values in (("connect", CONNECT), ("metadata", METADATA)):
+        data = bytearray()
+        for value in values:
+            AMF0Serializer.create_object(data, value)
+        size = len(data)
+        legacy = bench_legacy(values)
+        current = bench_struct(values)
+        for label, old, new in (("encode", legacy[0], current[0]), ("decode", legacy[1], current[1])):
+            print(f"{name:>10} {size:>6} {label:>6} {COUNT / old:>10.0f} {COUNT / new:>10.0f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Chunks per second decoded by RTMPConnection against the per-field awaited
+BitStreamReader path used up to 0.3.x.
+
+    python -m benchmarks.bench_chunk_decoding
+"""
+
+import asyncio
+import os
+import struct
+import time
+from asyncio import StreamReader
+
+from pyrtmp import BitStreamReader, StreamClosedException
+from pyrtmp.connection import HandshakeState, RTMPConnection
+
+CHUNK_SIZES = (128, 4096, 8192)
+MESSAGE_SIZES = (300, 4000, 20000, 60000)
+TOTAL_BYTES = 4 * 1024 * 1024
+
+
+def build_stream(chunk_size: int) -> tuple[bytes, int]:
+    # video messages on chunk stream 6: a type 0 header first, type 1 headers after,
+    # type 3 headers for the continuation chunks
+    out = bytearray()
+    chunks = 0
+    timestamp = 0
+    i = 0
+    while len(out) < TOTAL_BYTES:
+        payload = os.urandom(MESSAGE_SIZES[i % len(MESSAGE_SIZES)])
+        if i == 0:
+            out += b"\x06" + struct.pack(">I", timestamp)[1:] + struct.pack(">I", len(payload))[1:]
+            out += b"\x09" + struct.pack("<I", 1)
+        else:
+            out += b"\x46" + struct.pack(">I", 33)[1:] + struct.pack(">I", len(payload))[1:] + b"\x09"
+        for pos in range(0, len(payload), chunk_size):
+            if pos > 0:
+                out += b"\xc6"
+            out += payload[pos : pos + chunk_size]
+            chunks += 1
+        timestamp += 33
+        i += 1
+    return bytes(out), chunks
+
+
+def bench_connection(data: bytes, chunk_size: int) -> float:
+    connection = RTMPConnection(reader_chunk_size=chunk_size)
+    connection.handshake_state = HandshakeState.DONE
+    start = time.perf_counter()
+    for pos in range(0, len(data), 65536):
+        connection.receive_bytes(data[pos : pos + 65536])
+    return time.perf_counter() - start
+
+
+async def legacy_read_raw_chunk(stream: BitStreamReader, latest: dict, chunk_size: int) -> None:
+    fmt = await stream.read("uint:2")
+    cs_id = await stream.read("uint:6")
+    if cs_id == 0:
+        cs_id = await stream.read("uint:8") + 64
+    elif cs_id == 1:
+        cs_id = await stream.read("uint:16") + 64
+
+    if fmt == 0:
+        timestamp = await stream.read("uint:24")
+        msg_length = await stream.read("uint:24")
+        await stream.read("uint:8")
+        await stream.read("uintle:32")
+        sequence = 0
+    elif fmt == 1:
+        timestamp = latest[cs_id][0] + await stream.read("uint:24")
+        msg_length = await stream.read("uint:24")
+        await stream.read("uint:8")
+        sequence = 0 if latest[cs_id][3] else latest[cs_id][2] + 1
+    elif fmt == 2:
+        timestamp = latest[cs_id][0] + await stream.read("uint:24")
+        msg_length = latest[cs_id][1]
+        sequence = 0 if latest[cs_id][3] else latest[cs_id][2] + 1
+    else:
+        timestamp, msg_length = latest[cs_id][0], latest[cs_id][1]
+        sequence = 0 if latest[cs_id][3] else latest[cs_id][2] + 1
+
+    if timestamp == 0xFFFFFF:
+        timestamp = await stream.read("uint:32")
+
+    total_read = chunk_size * sequence
+    bytes_length = min(chunk_size, msg_length - total_read)
+    is_eof = (msg_length - total_read - bytes_length) == 0
+    await stream.read(f"bytes:{bytes_length}")
+    latest[cs_id] = (timestamp, msg_length, sequence, is_eof)
+
+
+async def bench_legacy(data: bytes, chunk_size: int, chunks: int) -> float:
+    reader = StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    stream = BitStreamReader(reader)
+    latest = {}
+    start = time.perf_counter()
+    try:
+        for _ in range(chunks):
+            await legacy_read_raw_chunk(stream, latest, chunk_size)
+    except StreamClosedException:
+        pass
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'chunk size':>10} {'chunks':>8} {'legacy chunks/s':>16} {'connection chunks/s':>20} {'speedup':>8}")
+    for chunk_size in CHUNK_SIZES:
+        data, chunks = build_stream(chunk_size)
+        legacy = asyncio.run(bench_legacy(data, chunk_size, chunks))
+        current = bench_connection(data, chunk_size)
+        print(
+            f"{chunk_size:>10} {chunks:>8} {chunks / legacy:>16,.0f} {chunks / current:>20,.0f} "
+            f"{legacy / current:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
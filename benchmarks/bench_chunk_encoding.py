@@ -0,0 +1,80 @@
+"""
+Messages per second serialized by RTMPConnection.encode_message against the
+to_raw_chunks / bitstring RawChunk.to_bytes path used up to 0.3.x.
+
+    python -m benchmarks.bench_chunk_encoding
+"""
+
+import os
+import time
+
+from bitstring import BitArray, BitStream
+
+from pyrtmp.connection import RTMPConnection
+from pyrtmp.messages import Chunk
+
+CHUNK_SIZES = (128, 4096)
+MESSAGE_SIZES = (300, 4000, 60000, 500000)
+TOTAL_BYTES = 8 * 1024 * 1024
+
+
+def legacy_to_bytes(chunk_type: int, chunk_id: int, timestamp: int, message: Chunk, payload: bytes) -> bytes:
+    stream = BitStream()
+    stream.append(BitArray(uint=chunk_type, length=2))
+    stream.append(BitArray(uint=chunk_id, length=6))
+    if chunk_type == 0:
+        stream.append(BitArray(uint=timestamp, length=24))
+        stream.append(BitArray(uint=message.msg_length, length=24))
+        stream.append(BitArray(uint=message.msg_type_id, length=8))
+        stream.append(BitArray(uintle=message.msg_stream_id, length=32))
+    stream.append(payload)
+    return stream.bytes
+
+
+def bench_legacy(message: Chunk, chunk_size: int, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        # payload sliced off the front for every chunk, one write per chunk
+        payload = message.payload
+        chunk_type = 0
+        while len(payload) > 0:
+            bytes_length = min(chunk_size, len(payload))
+            legacy_to_bytes(chunk_type, message.chunk_id, message.timestamp, message, payload[:bytes_length])
+            chunk_type = 3
+            payload = payload[bytes_length:]
+    return time.perf_counter() - start
+
+
+def bench_connection(message: Chunk, chunk_size: int, count: int) -> float:
+    connection = RTMPConnection(writer_chunk_size=chunk_size)
+    start = time.perf_counter()
+    for _ in range(count):
+        connection.encode_message(message)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'chunk size':>10} {'message':>8} {'legacy msg/s':>14} {'connection msg/s':>18} {'speedup':>8}")
+    for chunk_size in CHUNK_SIZES:
+        for size in MESSAGE_SIZES:
+            payload = os.urandom(size)
+            message = Chunk(
+                chunk_type=0,
+                chunk_id=6,
+                timestamp=40,
+                msg_length=size,
+                msg_type_id=0x09,
+                msg_stream_id=1,
+                payload=payload,
+            )
+            count = max(1, TOTAL_BYTES // size // 4)
+            legacy = bench_legacy(message, chunk_size, count)
+            current = bench_connection(message, chunk_size, count)
+            print(
+                f"{chunk_size:>10} {size:>8} {count / legacy:>14,.0f} {count / current:>18,.0f} "
+                f"{legacy / current:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
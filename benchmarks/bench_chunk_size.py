@@ -0,0 +1,79 @@
+"""
+Header overhead and serialization CPU per Mbit of a 30 fps video + 44.1 kHz AAC stream sent
+through RTMPConnection at different writer chunk sizes, and what AdaptiveChunkSizePolicy picks.
+
+    python -m benchmarks.bench_chunk_size
+"""
+
+import os
+import time
+import types
+
+from pyrtmp.chunk_size import AdaptiveChunkSizePolicy
+from pyrtmp.connection import RTMPConnection
+from pyrtmp.messages import Chunk
+
+CHUNK_SIZES = (128, 512, 1024, 4096, 8192, 65536)
+BITRATES = (1_000_000, 6_000_000)
+SECONDS = 10
+
+
+def build_stream(bitrate: int) -> list[Chunk]:
+    # a keyframe every 2 seconds at 8x the size of the other frames, audio frames in between
+    frame = bitrate // 8 // 30
+    keyframe_interval = 60
+    inter = frame * keyframe_interval // (keyframe_interval + 7)
+    messages = []
+    audio_ms = 0.0
+    for i in range(30 * SECONDS):
+        timestamp = i * 1000 // 30
+        size = inter * 8 if i % keyframe_interval == 0 else inter
+        messages.append(media(0x09, timestamp, os.urandom(size)))
+        while audio_ms < timestamp + 33:
+            messages.append(media(0x08, int(audio_ms), os.urandom(360)))
+            audio_ms += 1024 / 44.1
+    return messages
+
+
+def media(msg_type_id: int, timestamp: int, payload: bytes) -> Chunk:
+    return Chunk(
+        chunk_type=0,
+        chunk_id=4 if msg_type_id == 0x08 else 6,
+        timestamp=timestamp,
+        msg_length=len(payload),
+        msg_type_id=msg_type_id,
+        msg_stream_id=1,
+        payload=payload,
+    )
+
+
+def bench(messages: list[Chunk], chunk_size: int) -> tuple[int, float]:
+    connection = RTMPConnection(writer_chunk_size=chunk_size)
+    wire = 0
+    start = time.perf_counter()
+    for message in messages:
+        connection.send_message(message)
+        wire += sum(len(data) for data in connection.buffers_to_send())
+    return wire, time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'bitrate':>8} {'chunk size':>10} {'header bytes':>13} {'overhead':>9} {'CPU ms/Mbit':>12}")
+    for bitrate in BITRATES:
+        messages = build_stream(bitrate)
+        payload = sum(len(message.payload) for message in messages)
+        megabits = payload * 8 / 1_000_000
+        for chunk_size in CHUNK_SIZES:
+            wire, elapsed = bench(messages, chunk_size)
+            print(
+                f"{bitrate // 1_000_000:>6}M {chunk_size:>10} {wire - payload:>13,} "
+                f"{(wire - payload) / payload:>8.2%} {elapsed * 1000 / megabits:>12.3f}"
+            )
+        policy = AdaptiveChunkSizePolicy()
+        session = types.SimpleNamespace(backlog=0)
+        picked = {policy.select(session, message) for message in messages[len(messages) // 2 :]}
+        print(f"{bitrate // 1_000_000:>6}M adaptive policy settles on {sorted(picked)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+MB/s of FLV tags recorded to files by the struct tag writer (header, payload and previous tag
+size handed to os.writev) against the bitstring writer used up to 0.3.x (one joined buffer
+per tag, written and flushed), for a number of concurrent streams.
+
+    python -m benchmarks.bench_flv
+"""
+
+import os
+import tempfile
+import time
+
+from bitstring import BitArray, BitStream
+
+from pyrtmp.flv import FLVMediaType, FLVWriter, write_buffers
+
+STREAMS = 16
+# 6 Mbps video at 60 fps and AAC audio, 2 seconds of each stream
+FRAMES = 120
+VIDEO_SIZE = 12500
+AUDIO_SIZE = 400
+
+
+def legacy_write(timestamp: int, payload: bytes, media_type: FLVMediaType) -> bytes:
+    stream = BitStream()
+    stream.append(BitArray(uint=int(media_type), length=8))
+    stream.append(BitArray(uint=len(payload), length=24))
+    stream.append(BitArray(uint=timestamp & 0x00FFFFFF, length=24))
+    stream.append(BitArray(uint=timestamp >> 24, length=8))
+    stream.append(BitArray(uint=0, length=24))
+    stream.append(payload)
+    stream.append(BitArray(uint=11 + len(payload), length=32))
+    return stream.bytes
+
+
+def tags() -> list[tuple[int, memoryview, FLVMediaType]]:
+    # payloads as handed out by the connection, views into a receive buffer
+    video = memoryview(bytearray(os.urandom(VIDEO_SIZE)))
+    audio = memoryview(bytearray(os.urandom(AUDIO_SIZE)))
+    result = []
+    for frame in range(FRAMES):
+        result.append((frame * 16, video, FLVMediaType.VIDEO))
+        result.append((frame * 16, audio, FLVMediaType.AUDIO))
+    return result
+
+
+def bench_legacy(directory: str, stream_tags: list) -> float:
+    files = [open(os.path.join(directory, f"legacy{index}.flv"), "wb") for index in range(STREAMS)]
+    start = time.perf_counter()
+    for tag in stream_tags:
+        for file in files:
+            file.write(legacy_write(*tag))
+            file.flush()
+    elapsed = time.perf_counter() - start
+    for file in files:
+        file.close()
+    return elapsed
+
+
+def bench_struct(directory: str, stream_tags: list) -> float:
+    files = [open(os.path.join(directory, f"struct{index}.flv"), "wb", buffering=0) for index in range(STREAMS)]
+    writers = [FLVWriter() for _ in range(STREAMS)]
+    start = time.perf_counter()
+    for tag in stream_tags:
+        for file, writer in zip(files, writers):
+            write_buffers(file, writer.write_tag(*tag))
+    elapsed = time.perf_counter() - start
+    for file in files:
+        file.close()
+    return elapsed
+
+
+def main() -> None:
+    stream_tags = tags()
+    size = STREAMS * sum(15 + len(payload) for _, payload, _ in stream_tags) / 1e6
+    with tempfile.TemporaryDirectory() as directory:
+        legacy = bench_legacy(directory, stream_tags)
+        current = bench_struct(directory, stream_tags)
+    print(f"{'streams':>8} {'MB':>8} {'legacy MB/s':>12} {'struct MB/s':>12} {'speedup':>8}")
+    print(f"{STREAMS:>8} {size:>8.1f} {size / legacy:>12.1f} {size / current:>12.1f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
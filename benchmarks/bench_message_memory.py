@@ -0,0 +1,73 @@
+"""
+Per-message memory of the slotted chunk and message classes against the __dict__ based
+BaseChunk of 0.3.x, measured with tracemalloc (payloads excluded).
+
+    python -m benchmarks.bench_message_memory
+"""
+
+import tracemalloc
+
+from pyrtmp.messages import Chunk
+from pyrtmp.messages.command import NSPublish
+from pyrtmp.messages.video import VideoMessage
+
+COUNT = 100_000
+HEADER = {"chunk_type": 0, "chunk_id": 6, "timestamp": 0, "msg_length": 4, "msg_type_id": 0x09, "msg_stream_id": 1}
+PAYLOAD = b"\x17\x01\x00\x00"
+
+
+class LegacyChunk:
+    # BaseChunk up to 0.3.x: fields in the instance __dict__
+    def __init__(self, **kwargs) -> None:
+        self.__dict__.update(kwargs)
+
+
+def measure(factory) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory() for _ in range(COUNT)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # the list of references is not part of the message
+    size = (after - before - objects.__sizeof__()) / COUNT
+    del objects
+    return size
+
+
+def make_publish() -> NSPublish:
+    message = NSPublish.from_header(Chunk(payload=PAYLOAD, **HEADER))
+    message.command_name = "publish"
+    message.transaction_id = 5
+    message.command_object = None
+    message.publishing_name = "live"
+    message.publishing_type = "live"
+    return message
+
+
+def main() -> None:
+    chunk = Chunk(payload=PAYLOAD, **HEADER)
+    cases = (
+        ("dict chunk (0.3.x)", lambda: LegacyChunk(payload=PAYLOAD, **HEADER)),
+        (
+            "dict publish (0.3.x)",
+            lambda: LegacyChunk(
+                payload=PAYLOAD,
+                command_name="publish",
+                transaction_id=5,
+                command_object=None,
+                publishing_name="live",
+                publishing_type="live",
+                **HEADER,
+            ),
+        ),
+        ("Chunk", lambda: Chunk(payload=PAYLOAD, **HEADER)),
+        ("VideoMessage + payload view", lambda: VideoMessage.from_chunk(chunk)),
+        ("NSPublish", make_publish),
+    )
+    print(f"{'message':>28} {'bytes/message':>14}")
+    for name, factory in cases:
+        print(f"{name:>28} {measure(factory):>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
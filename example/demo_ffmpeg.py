@@ -6,7 +6,7 @@ import os
 from asyncio import StreamReader
 
 from pyrtmp import StreamClosedException
-from pyrtmp.flv import FLVMediaType, FLVWriter
+from pyrtmp.flv import FLVMediaType, FLVWriter, MediaSink
 from pyrtmp.rtmp import RTMPProtocol, SimpleRTMPController, SimpleRTMPServer
 from pyrtmp.session_manager import SessionManager
 
@@ -16,6 +16,11 @@ logger.setLevel(logging.DEBUG)
 
 
 class RTMP2SocketController(SimpleRTMPController):
+    # audio, video, data and command messages (AMF0 and AMF3) and aggregates of them, user
+    # control and the rest are skipped (the protocol control messages the connection acts on
+    # are always decoded)
+    message_types = frozenset({0x08, 0x09, 0x0F, 0x11, 0x12, 0x14})
+
     def __init__(self, output_directory: str):
         self.output_directory = output_directory
         super().__init__()
@@ -23,7 +28,7 @@ class RTMP2SocketController(SimpleRTMPController):
     async def on_ns_publish(self, session, message) -> None:
         publishing_name = message.publishing_name
         prefix = os.path.join(self.output_directory, f"{publishing_name}")
-        session.state = RemoteProcessFLVWriter()
+        session.state = session.sink = RemoteProcessFLVWriter()
         logger.debug(f"output to {prefix}.flv")
         await session.state.initialize(
             command=f"ffmpeg -y -i pipe:0 -c:v copy -c:a copy -f flv {prefix}.flv",
@@ -50,12 +55,13 @@ class RTMP2SocketController(SimpleRTMPController):
         await super().on_stream_closed(session, exception)
 
 
-class RemoteProcessFLVWriter:
+class RemoteProcessFLVWriter(MediaSink):
     def __init__(self):
         self.proc = None
         self.stdout = None
         self.stderr = None
         self.writer = FLVWriter()
+        super().__init__()
 
     async def initialize(self, command: str, stdout_log: str, stderr_log: str):
         self.proc = await asyncio.create_subprocess_shell(
@@ -80,8 +86,14 @@ class RemoteProcessFLVWriter:
         self.proc.stdin.write(buffer)
 
     def write(self, timestamp: int, payload: bytes, media_type: FLVMediaType):
-        buffer = self.writer.write(timestamp, payload, media_type)
-        self.proc.stdin.write(buffer)
+        self.proc.stdin.writelines(self.writer.write_tag(timestamp, payload, media_type))
+
+    def write_buffer_size(self) -> int:
+        # bytes ffmpeg has not read from its stdin pipe yet
+        return self.proc.stdin.transport.get_write_buffer_size()
+
+    async def drain(self):
+        await self.proc.stdin.drain()
 
     async def close(self):
         await self.proc.stdin.drain()
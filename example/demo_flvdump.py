@@ -3,7 +3,7 @@ import logging
 import os
 
 from pyrtmp import StreamClosedException
-from pyrtmp.flv import FLVFileWriter, FLVMediaType
+from pyrtmp.flv import AsyncFLVFileWriter, FLVMediaType
 from pyrtmp.rtmp import RTMPProtocol, SimpleRTMPController, SimpleRTMPServer
 from pyrtmp.session_manager import SessionManager
 
@@ -20,7 +20,7 @@ class RTMP2FLVController(SimpleRTMPController):
     async def on_ns_publish(self, session, message) -> None:
         publishing_name = message.publishing_name
         file_path = os.path.join(self.output_directory, f"{publishing_name}.flv")
-        session.state = FLVFileWriter(output=file_path)
+        session.state = session.sink = AsyncFLVFileWriter(output=file_path)
         await super().on_ns_publish(session, message)
 
     async def on_metadata(self, session, message) -> None:
@@ -36,7 +36,7 @@ class RTMP2FLVController(SimpleRTMPController):
         await super().on_audio_message(session, message)
 
     async def on_stream_closed(self, session: SessionManager, exception: StreamClosedException) -> None:
-        session.state.close()
+        await session.state.close()
         await super().on_stream_closed(session, exception)
 
 
@@ -2,16 +2,13 @@ import asyncio
 import logging
 import os
 import uuid
-from asyncio import BaseProtocol, StreamReader, StreamWriter, events
-from io import BytesIO
 
 import quart
-from bitstring import BitArray, BitStream
 from quart import Quart, request
 
 from example.demo_flvdump import RTMP2FLVController
-from pyrtmp import BufferedWriteTransport
 from pyrtmp.rtmp import BaseRTMPController
+from pyrtmp.session_manager import SessionManager
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -22,41 +19,18 @@ session = {}
 config = {}
 
 
-class DummyProtocol(BaseProtocol):
-    async def _drain_helper(self):
-        pass
-
-    async def _get_close_waiter(self, stream: StreamWriter):
-        return asyncio.sleep(0)
-
-
 class RTMPTWrapper:
-    def __init__(
-        self, session_id: str, peer: tuple, controller: BaseRTMPController, loop: events.AbstractEventLoop
-    ) -> None:
+    # the RTMP session behind an RTMPT session id: request bodies go into its connection and every
+    # response carries what the connection has queued for the client
+    def __init__(self, session_id: str, peer: tuple, controller: BaseRTMPController) -> None:
         self.delay = 0
-        self.loop = loop
         self.session_id = session_id
-        self.peer = peer
-        self.controller = controller.client_callback
-        self.stream = BytesIO()
-        self.reader = StreamReader(loop=self.loop)
-        self.writer = StreamWriter(
-            BufferedWriteTransport(
-                self.stream,
-                extra={
-                    "peername": peer,
-                },
-            ),
-            DummyProtocol(),
-            self.reader,
-            self.loop,
-        )
-        self.task = self.loop.create_task(self._dispatcher())
-
-    async def _dispatcher(self):
+        self.session = SessionManager(reader=None, writer=None, peer=peer)
+        self.task = asyncio.get_running_loop().create_task(self._dispatcher(controller))
+
+    async def _dispatcher(self, controller: BaseRTMPController):
         try:
-            await self.controller(self.reader, self.writer)
+            await controller.session_callback(self.session)
         except Exception as ex:
             logger.exception(ex)
             raise ex
@@ -66,29 +40,24 @@ class RTMPTWrapper:
         self.delay = min(self.delay + 10, 255)
         return temp
 
+    def receive_bytes(self, data: bytes):
+        self.session.receive_bytes(data)
+
     def close(self):
-        assert len(self.stream.read()) == 0
-        self.reader.feed_eof()
-        self.writer.close()
-        self.stream.close()
+        self.session.feed_eof()
 
     async def read_from_buffer(self):
-        data = BitStream()
-        data.append(BitArray(uint=self._get_polling_delay(), length=8).bytes)
+        data = bytearray((self._get_polling_delay(),))
         while True:
+            # let the controller handle what was received first
             await asyncio.sleep(0)
-            payload = await self.get_buffered_data()
+            self.session.flush()
+            payload = self.session.connection.data_to_send()
             if len(payload) == 0:
                 break
-            data.append(payload)
+            data += payload
             self.delay = 0
-        return data.bytes
-
-    async def get_buffered_data(self):
-        self.stream.seek(0)
-        buffer = self.stream.read()
-        self.stream.truncate(0)
-        return buffer
+        return bytes(data)
 
 
 @app.route("/open/<int:segment>", methods=["POST"])
@@ -100,7 +69,6 @@ async def open(segment: int):
         session_id=sid,
         peer=request.scope["client"],
         controller=config["controller"],
-        loop=asyncio.get_running_loop(),
     )
     resp = quart.Response(sid)
     resp.headers["Content-Type"] = "application/x-fcs"
@@ -111,7 +79,7 @@ async def open(segment: int):
 @app.route("/send/<string:sid>/<int:segment>", methods=["POST"])
 async def send(sid: str, segment: int):
     body = await request.body
-    session[sid].reader.feed_data(body)
+    session[sid].receive_bytes(body)
     data = await session[sid].read_from_buffer()
     resp = quart.Response(data)
     resp.headers["Content-Type"] = "application/x-fcs"
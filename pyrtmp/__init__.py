@@ -1,4 +1,5 @@
 import os
+import struct
 from asyncio import StreamReader, WriteTransport
 from collections.abc import Mapping
 from io import BytesIO
@@ -21,7 +22,6 @@ class BitStreamReader:
     def __init__(self, reader: StreamReader) -> None:
         self.reader = reader
         self.buffer = BitStream()
-        self.total_bytes = 0
         super().__init__()
 
     async def read(self, fmt) -> int | float | str | Bits | bool | bytes | None:
@@ -38,7 +38,6 @@ class BitStreamReader:
             self._append(new_data)
             bit_needed = int(length) - (self.buffer.length - self.buffer.pos)
 
-        self.total_bytes += length
         value = self.buffer.read(fmt)
         del self.buffer[:length]
         self.buffer.bitpos = 0
@@ -50,6 +49,114 @@ class BitStreamReader:
         self.buffer.pos = pos
 
 
+_U16 = struct.Struct(">H")
+_U16LE = struct.Struct("<H")
+_U32 = struct.Struct(">I")
+_U32LE = struct.Struct("<I")
+
+
+class NotEnoughDataException(Exception):
+    pass
+
+
+class ByteBuffer:
+    """
+    Receive buffer with a read offset, reused for the lifetime of a connection. Once the tail
+    runs out of room the unread bytes are moved back to the front (into a larger bytearray only
+    if they do not fit), so memoryviews returned by read_exact are only valid until the next
+    feed/reserve and callers copy out what they keep.
+    """
+
+    def __init__(self, capacity: int = 65536) -> None:
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self._end = 0
+        super().__init__()
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def raw(self) -> bytearray:
+        # for decoders that walk [tell(), end) themselves and seek() past what they consumed
+        return self._buffer
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    def tell(self) -> int:
+        # only valid until the next feed/reserve
+        return self._start
+
+    def seek(self, position: int) -> None:
+        assert 0 <= position <= self._end
+        self._start = position
+
+    def reserve(self, size: int) -> None:
+        if self._start == self._end:
+            # everything was consumed, start over at the front
+            self._start = self._end = 0
+        if len(self._buffer) - self._end >= size:
+            return
+        remaining = self._end - self._start
+        if len(self._buffer) >= remaining + size:
+            # slicing copies first, a view of the same buffer may overlap the destination
+            self._buffer[:remaining] = self._buffer[self._start : self._end]
+        else:
+            buffer = bytearray(max(self.capacity, remaining + size))
+            buffer[:remaining] = memoryview(self._buffer)[self._start : self._end]
+            self._buffer = buffer
+        self._start = 0
+        self._end = remaining
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        # hand out the whole free tail, but never a sliver of it
+        self.reserve(max(sizehint, self.capacity // 4))
+        return memoryview(self._buffer)[self._end :]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self._end += nbytes
+
+    def feed(self, data: bytes) -> None:
+        size = len(data)
+        self.reserve(size)
+        self._buffer[self._end : self._end + size] = data
+        self._end += size
+
+    def _consume(self, size: int) -> int:
+        start = self._start
+        if self._end - start < size:
+            raise NotEnoughDataException()
+        self._start = start + size
+        return start
+
+    def read_u8(self) -> int:
+        return self._buffer[self._consume(1)]
+
+    def read_u16(self) -> int:
+        return _U16.unpack_from(self._buffer, self._consume(2))[0]
+
+    def read_u16le(self) -> int:
+        return _U16LE.unpack_from(self._buffer, self._consume(2))[0]
+
+    def read_u24(self) -> int:
+        start = self._consume(3)
+        buffer = self._buffer
+        return buffer[start] << 16 | buffer[start + 1] << 8 | buffer[start + 2]
+
+    def read_u32(self) -> int:
+        return _U32.unpack_from(self._buffer, self._consume(4))[0]
+
+    def read_u32le(self) -> int:
+        return _U32LE.unpack_from(self._buffer, self._consume(4))[0]
+
+    def read_exact(self, size: int) -> memoryview:
+        start = self._consume(size)
+        return memoryview(self._buffer)[start : start + size]
+
+
 class BufferedWriteTransport(WriteTransport):
     def __init__(self, buffer: BytesIO, extra: Mapping[Any, Any] | None = ...) -> None:
         self._buffer = buffer
@@ -58,16 +165,18 @@ class BufferedWriteTransport(WriteTransport):
         super().__init__(extra)
 
     def set_write_buffer_limits(self, high: int | None = ..., low: int | None = ...) -> None:
-        raise NotImplementedError
+        # everything is written to the buffer right away, there is nothing to limit
+        pass
 
     def get_write_buffer_size(self) -> int:
-        raise NotImplementedError
+        return 0
 
     def write(self, data: Any) -> None:
         self._buffer.write(data)
 
     def writelines(self, list_of_data: list[Any]) -> None:
-        raise NotImplementedError
+        for data in list_of_data:
+            self._buffer.write(data)
 
     def write_eof(self) -> None:
         raise NotImplementedError
@@ -1,156 +1,511 @@
+from __future__ import annotations
+
+import datetime
+import struct
+from collections.abc import Callable
 from typing import Any
 
-from bitstring import BitArray, BitStream
+from bitstring import BitStream
+
+from pyrtmp.amf.types import AMF0, AMF3
+
+# marker byte and value
+_BOOLEAN = struct.Struct(">BB")
+_STRING = struct.Struct(">BH")
+_NUMBER = struct.Struct(">Bd")
+_ARRAY = struct.Struct(">BI")
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_DOUBLE = struct.Struct(">d")
+_OBJECT_END = b"\x00\x00\x09"
+
+
+class AMF0Reader:
+    """
+    Cursor over an AMF0 payload, values are decoded in place from a memoryview at an integer
+    offset. Passed to AMF0Deserializer.from_stream, which advances pos past the value.
+    """
+
+    __slots__ = ("data", "pos")
+
+    def __init__(self, data: bytes | bytearray | memoryview, pos: int = 0) -> None:
+        self.data = memoryview(data)
+        self.pos = pos
+
+    @property
+    def remaining(self) -> int:
+        return len(self.data) - self.pos
+
+
+def _encode(buffer: bytearray, value: Any) -> None:
+    if isinstance(value, str):
+        _encode_string(buffer, value)
+    elif isinstance(value, bool):
+        buffer += _BOOLEAN.pack(AMF0.BOOLEAN, value)
+    elif isinstance(value, (float, int)):
+        buffer += _NUMBER.pack(AMF0.NUMBER, value)
+    elif isinstance(value, dict):
+        _encode_object(buffer, value)
+    elif isinstance(value, list):
+        _encode_array(buffer, value)
+    elif value is None:
+        buffer.append(AMF0.NULL)
+    else:
+        raise NotImplementedError
+
+
+def _encode_string(buffer: bytearray, value: str) -> None:
+    encoded = value.encode()
+    buffer += _STRING.pack(AMF0.STRING, len(encoded))
+    buffer += encoded
+
+
+def _encode_property(buffer: bytearray, key: str, value: Any) -> None:
+    encoded = key.encode()
+    buffer += _U16.pack(len(encoded))
+    buffer += encoded
+    _encode(buffer, value)
+
+
+def _encode_object(buffer: bytearray, value: dict) -> None:
+    buffer.append(AMF0.OBJECT)
+    for key, item in value.items():
+        _encode_property(buffer, key, item)
+    buffer += _OBJECT_END
+
+
+def _encode_array(buffer: bytearray, value: list) -> None:
+    # ECMA array, a list of single property dicts
+    buffer += _ARRAY.pack(AMF0.ARRAY, len(value))
+    for item in value:
+        for key, property_value in item.items():
+            _encode_property(buffer, key, property_value)
+    buffer += _OBJECT_END
+
+
+def _decode(data: memoryview, pos: int) -> tuple[Any, int]:
+    # the value at pos and the offset following it
+    marker = data[pos]
+    if marker == AMF0.STRING:
+        end = pos + 3 + _U16.unpack_from(data, pos + 1)[0]
+        return str(data[pos + 3 : end], "utf-8"), end
+    if marker == AMF0.NUMBER:
+        return _DOUBLE.unpack_from(data, pos + 1)[0], pos + 9
+    if marker == AMF0.OBJECT:
+        obj = {}
+        pos += 1
+        while True:
+            size = _U16.unpack_from(data, pos)[0]
+            if size == 0 and data[pos + 2] == AMF0.OBJECT_END:
+                return obj, pos + 3
+            key = str(data[pos + 2 : pos + 2 + size], "utf-8")
+            obj[key], pos = _decode(data, pos + 2 + size)
+    if marker == AMF0.NULL:
+        return None, pos + 1
+    if marker == AMF0.ARRAY:
+        count = _U32.unpack_from(data, pos + 1)[0]
+        arr = []
+        pos += 5
+        while True:
+            size = _U16.unpack_from(data, pos)[0]
+            if size == 0 and data[pos + 2] == AMF0.OBJECT_END:
+                assert len(arr) == count
+                return arr, pos + 3
+            key = str(data[pos + 2 : pos + 2 + size], "utf-8")
+            value, pos = _decode(data, pos + 2 + size)
+            arr.append({key: value})
+    if marker == AMF0.BOOLEAN:
+        return data[pos + 1] != 0, pos + 2
+    if marker == AMF0.AVMPLUS_OBJECT:
+        # every switch to AMF3 starts with empty reference tables
+        return AMF3Deserializer().decode(data, pos + 1)
+    raise NotImplementedError
+
 
-from pyrtmp.amf.types import AMF0
+def _encode_avmplus(buffer: bytearray, value: Any) -> None:
+    buffer.append(AMF0.AVMPLUS_OBJECT)
+    AMF3Serializer().create_object(buffer, value)
 
 
 class AMF0Serializer:
-    @classmethod
-    def create_object(cls, data: BitStream, value):
-        if isinstance(value, str):
-            cls.write_string_object(data, value)
-        elif isinstance(value, bool):
-            cls.write_boolean_object(data, value)
-        elif isinstance(value, float):
-            cls.write_number_object(data, value)
-        elif isinstance(value, int):
-            cls.write_number_object(data, value)
-        elif isinstance(value, dict):
-            cls.write_object_object(data, value)
-        elif isinstance(value, list):
-            cls.write_array_object(data, value)
-        elif value is None:
-            cls.write_null_object(data)
-        else:
-            raise NotImplementedError
+    # values are appended to a bytearray, or to a BitStream (whose pos is kept)
 
     @classmethod
-    def write_boolean_object(cls, data: BitStream, value: bool):
+    def _write(cls, data: bytearray | BitStream, encode: Callable[..., None], *args) -> None:
+        if isinstance(data, bytearray):
+            encode(data, *args)
+            return
+        buffer = bytearray()
+        encode(buffer, *args)
         pos = data.pos
-        data.append(BitArray(uint=AMF0.BOOLEAN, length=8))
-        data.append(BitArray(uint=0 if value is False else 1, length=8))
+        data.append(bytes(buffer))
         data.pos = pos
 
     @classmethod
-    def write_string_object(cls, data: BitStream, value: str):
-        pos = data.pos
-        data.append(BitArray(uint=AMF0.STRING, length=8))
-        data.append(BitArray(uint=len(value), length=16))
-        data.append(BitArray(bytes=value.encode(), length=len(value) * 8))
-        data.pos = pos
+    def create_object(cls, data: bytearray | BitStream, value):
+        cls._write(data, _encode, value)
 
     @classmethod
-    def write_number_object(cls, data: BitStream, value: float):
-        pos = data.pos
-        data.append(BitArray(uint=AMF0.NUMBER, length=8))
-        data.append(BitArray(float=value, length=64))
-        data.pos = pos
+    def write_boolean_object(cls, data: bytearray | BitStream, value: bool):
+        cls._write(data, _encode, bool(value))
 
     @classmethod
-    def write_null_object(cls, data: BitStream):
-        pos = data.pos
-        data.append(BitArray(uint=AMF0.NULL, length=8))
-        data.pos = pos
+    def write_string_object(cls, data: bytearray | BitStream, value: str):
+        cls._write(data, _encode_string, value)
 
     @classmethod
-    def write_object_object(cls, data: BitStream, value: dict):
-        pos = data.pos
-        data.append(BitArray(uint=AMF0.OBJECT, length=8))
-        for k, v in value.items():
-            data.append(BitArray(uint=len(k), length=16))
-            data.append(BitArray(bytes=k.encode(), length=len(k) * 8))
-            cls.create_object(data, v)
-        data.append(BitArray(uint=AMF0.OBJECT_END, length=24))
-        data.pos = pos
+    def write_number_object(cls, data: bytearray | BitStream, value: float):
+        cls._write(data, _encode, float(value))
 
     @classmethod
-    def write_array_object(cls, data: BitStream, value: list):
-        pos = data.pos
-        data.append(BitArray(uint=AMF0.ARRAY, length=8))
-        data.append(BitArray(uint=len(value), length=32))
-        for item in value:
-            for key in item:
-                property_key = key.encode()
-                data.append(BitArray(uint=len(property_key), length=16))
-                data.append(BitArray(bytes=property_key, length=len(property_key) * 8))
-                cls.create_object(data, item[key])
-        data.append(BitArray(uint=AMF0.OBJECT_END, length=24))
-        data.pos = pos
+    def write_null_object(cls, data: bytearray | BitStream):
+        cls._write(data, _encode, None)
+
+    @classmethod
+    def write_object_object(cls, data: bytearray | BitStream, value: dict):
+        cls._write(data, _encode_object, value)
+
+    @classmethod
+    def write_array_object(cls, data: bytearray | BitStream, value: list):
+        cls._write(data, _encode_array, value)
+
+    @classmethod
+    def write_avmplus_object(cls, data: bytearray | BitStream, value):
+        # value in AMF3, as carried by AMF3 command (0x11) and data (0x0F) messages
+        cls._write(data, _encode_avmplus, value)
 
 
 class AMF0Deserializer:
+    # values are read from an AMF0Reader, or from a BitStream at a whole byte position
+
     @classmethod
-    def from_stream(cls, data: BitStream) -> Any:
-        # determine object type
-        obj_type = data.peek("uint:8")
-        if obj_type == AMF0.STRING:
-            return cls.to_string_object(data)
-        if obj_type == AMF0.NUMBER:
-            return cls.to_number_object(data)
-        if obj_type == AMF0.OBJECT:
-            return cls.to_object_object(data)
-        if obj_type == AMF0.NULL:
-            return cls.to_null_object(data)
-        if obj_type == AMF0.ARRAY:
-            return cls.to_array_object(data)
-        if obj_type == AMF0.BOOLEAN:
-            return cls.to_boolean_object(data)
-        raise NotImplementedError
+    def from_stream(cls, data: AMF0Reader | BitStream) -> Any:
+        if isinstance(data, AMF0Reader):
+            value, data.pos = _decode(data.data, data.pos)
+            return value
+        value, data.bytepos = _decode(memoryview(data.bytes), data.bytepos)
+        return value
 
     @classmethod
-    def to_boolean_object(cls, data: BitStream):
-        obj_type = data.read("uint:8")
-        assert obj_type == AMF0.BOOLEAN
-        value = data.read("uint:8")
-        return False if value == 0 else True
+    def _read(cls, data: AMF0Reader | BitStream, obj_type: AMF0) -> Any:
+        if isinstance(data, AMF0Reader):
+            marker = data.data[data.pos]
+        else:
+            marker = data.peek("uint:8")
+        assert marker == obj_type
+        return cls.from_stream(data)
 
     @classmethod
-    def to_string_object(cls, data: BitStream):
-        obj_type = data.read("uint:8")
-        assert obj_type == AMF0.STRING
-        obj_length = data.read("uint:16")
-        return data.read(f"bytes:{obj_length}").decode()
+    def to_boolean_object(cls, data: AMF0Reader | BitStream):
+        return cls._read(data, AMF0.BOOLEAN)
 
     @classmethod
-    def to_number_object(cls, data: BitStream):
-        obj_type = data.read("uint:8")
-        assert obj_type == AMF0.NUMBER
-        return data.read("float:64")
+    def to_string_object(cls, data: AMF0Reader | BitStream):
+        return cls._read(data, AMF0.STRING)
 
     @classmethod
-    def to_null_object(cls, data: BitStream):
-        obj_type = data.read("uint:8")
-        assert obj_type == AMF0.NULL
-        return None
+    def to_number_object(cls, data: AMF0Reader | BitStream):
+        return cls._read(data, AMF0.NUMBER)
 
     @classmethod
-    def to_object_object(cls, data: BitStream):
-        obj_type = data.read("uint:8")
-        assert obj_type == AMF0.OBJECT
-        obj = {}
-        ending = f"0000{int(AMF0.OBJECT_END):02x}"
-        while data.peek("bytes:3").hex() != ending:
-            # read property name
-            size = data.read("uint:16")
-            property_name = data.read(f"bytes:{size}").decode()
-            # read object value (AMF0)
-            property_value = cls.from_stream(data)
-            obj[property_name] = property_value
-        return obj
-
-    @classmethod
-    def to_array_object(cls, data: BitStream):
-        obj_type = data.read("uint:8")
-        assert obj_type == AMF0.ARRAY
-        arr = []
-        count = data.read("uint:32")
-        ending = f"0000{int(AMF0.OBJECT_END):02x}"
-        while data.peek("bytes:3").hex() != ending:
-            size = data.read("uint:16")
-            property_name = data.read(f"bytes:{size}").decode()
-            # read object value (AMF0)
-            property_value = cls.from_stream(data)
-            arr.append({property_name: property_value})
-        assert len(arr) == count
-        return arr
+    def to_null_object(cls, data: AMF0Reader | BitStream):
+        return cls._read(data, AMF0.NULL)
+
+    @classmethod
+    def to_object_object(cls, data: AMF0Reader | BitStream):
+        return cls._read(data, AMF0.OBJECT)
+
+    @classmethod
+    def to_array_object(cls, data: AMF0Reader | BitStream):
+        return cls._read(data, AMF0.ARRAY)
+
+
+class TypedObject(dict):
+    """AMF3 object of a named class, its properties are written as the sealed members of its traits."""
+
+    __slots__ = ("class_name",)
+
+    def __init__(self, class_name: str, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.class_name = class_name
+
+
+_AMF3_INTEGER_MIN = -(1 << 28)
+_AMF3_INTEGER_MAX = (1 << 28) - 1
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_VECTORS = {
+    AMF3.VECTOR_INT: ("i", 4),
+    AMF3.VECTOR_UINT: ("I", 4),
+    AMF3.VECTOR_DOUBLE: ("d", 8),
+}
+
+
+def _encode_u29(buffer: bytearray, value: int) -> None:
+    # variable length 29-bit integer, 7 bits per byte and 8 in the fourth
+    if value < 0x80:
+        buffer.append(value)
+    elif value < 0x4000:
+        buffer += bytes((value >> 7 | 0x80, value & 0x7F))
+    elif value < 0x200000:
+        buffer += bytes((value >> 14 | 0x80, value >> 7 & 0x7F | 0x80, value & 0x7F))
+    elif value < 0x20000000:
+        buffer += bytes((value >> 22 | 0x80, value >> 15 & 0x7F | 0x80, value >> 8 & 0x7F | 0x80, value & 0xFF))
+    else:
+        raise OverflowError(value)
+
+
+def _decode_u29(data: memoryview, pos: int) -> tuple[int, int]:
+    value = 0
+    for _ in range(3):
+        byte = data[pos]
+        pos += 1
+        if byte < 0x80:
+            return value << 7 | byte, pos
+        value = value << 7 | byte & 0x7F
+    return value << 8 | data[pos], pos + 1
+
+
+class AMF3Serializer:
+    """
+    AMF3 encoder of one AMF3 context: strings, objects (dicts, lists, dates, byte arrays) and
+    traits already written are sent again as references into its tables.
+    """
+
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        # id() of the objects written -> index, the objects are referenced by the value being written
+        self.objects: dict[int, int] = {}
+        # (class name, dynamic, sealed member names) -> index
+        self.traits: dict[tuple[str, bool, tuple[str, ...]], int] = {}
+        super().__init__()
+
+    def create_object(self, data: bytearray, value: Any) -> None:
+        if value is None:
+            data.append(AMF3.NULL)
+        elif isinstance(value, bool):
+            data.append(AMF3.TRUE if value else AMF3.FALSE)
+        elif isinstance(value, int) and _AMF3_INTEGER_MIN <= value <= _AMF3_INTEGER_MAX:
+            data.append(AMF3.INTEGER)
+            _encode_u29(data, value & 0x1FFFFFFF)
+        elif isinstance(value, (int, float)):
+            data += _NUMBER.pack(AMF3.DOUBLE, value)
+        elif isinstance(value, str):
+            data.append(AMF3.STRING)
+            self.write_string(data, value)
+        elif isinstance(value, dict):
+            data.append(AMF3.OBJECT)
+            if self._write_reference(data, value):
+                self._write_object(data, value)
+        elif isinstance(value, (list, tuple)):
+            data.append(AMF3.ARRAY)
+            if self._write_reference(data, value):
+                _encode_u29(data, len(value) << 1 | 1)
+                # no associative part
+                data.append(0x01)
+                for item in value:
+                    self.create_object(data, item)
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            data.append(AMF3.BYTE_ARRAY)
+            if self._write_reference(data, value):
+                _encode_u29(data, len(value) << 1 | 1)
+                data += value
+        elif isinstance(value, datetime.datetime):
+            data.append(AMF3.DATE)
+            if self._write_reference(data, value):
+                data.append(0x01)
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=datetime.timezone.utc)
+                data += _DOUBLE.pack((value - _EPOCH).total_seconds() * 1000)
+        else:
+            raise NotImplementedError
+
+    def write_string(self, data: bytearray, value: str) -> None:
+        # without marker, as used for the keys and class names as well
+        index = self.strings.get(value)
+        if index is not None:
+            _encode_u29(data, index << 1)
+            return
+        if value:
+            self.strings[value] = len(self.strings)
+        encoded = value.encode()
+        _encode_u29(data, len(encoded) << 1 | 1)
+        data += encoded
+
+    def _write_reference(self, data: bytearray, value: Any) -> bool:
+        # writes the reference to value if it was written before, else adds it to the table
+        index = self.objects.get(id(value))
+        if index is not None:
+            _encode_u29(data, index << 1)
+            return False
+        self.objects[id(value)] = len(self.objects)
+        return True
+
+    def _write_object(self, data: bytearray, value: dict) -> None:
+        if isinstance(value, TypedObject):
+            key = (value.class_name, False, tuple(value))
+        else:
+            # anonymous and dynamic, the properties follow the traits as name/value pairs
+            key = ("", True, ())
+        index = self.traits.get(key)
+        if index is not None:
+            _encode_u29(data, index << 2 | 0x01)
+        else:
+            self.traits[key] = len(self.traits)
+            class_name, dynamic, members = key
+            _encode_u29(data, len(members) << 4 | (0x08 if dynamic else 0) | 0x03)
+            self.write_string(data, class_name)
+            for member in members:
+                self.write_string(data, member)
+        if key[1]:
+            for name, item in value.items():
+                self.write_string(data, name)
+                self.create_object(data, item)
+            data.append(0x01)
+        else:
+            for item in value.values():
+                self.create_object(data, item)
+
+
+class AMF3Deserializer:
+    """
+    AMF3 decoder of one AMF3 context, keeping the strings, objects and traits read so far for
+    the references to them. Objects decode to dicts (TypedObject for a named class), arrays to
+    lists (a dict when they have an associative part), dates to aware datetimes.
+    """
+
+    def __init__(self) -> None:
+        self.strings: list[str] = []
+        self.objects: list[Any] = []
+        # (class name, dynamic, sealed member names)
+        self.traits: list[tuple[str, bool, list[str]]] = []
+        super().__init__()
+
+    def from_stream(self, data: AMF0Reader) -> Any:
+        value, data.pos = self.decode(data.data, data.pos)
+        return value
+
+    def decode(self, data: memoryview, pos: int) -> tuple[Any, int]:
+        # the value at pos and the offset following it
+        marker = data[pos]
+        pos += 1
+        if marker == AMF3.STRING:
+            return self.read_string(data, pos)
+        if marker == AMF3.INTEGER:
+            value, pos = _decode_u29(data, pos)
+            return value - (1 << 29) if value & 0x10000000 else value, pos
+        if marker == AMF3.DOUBLE:
+            return _DOUBLE.unpack_from(data, pos)[0], pos + 8
+        if marker == AMF3.OBJECT:
+            return self._read_object(data, pos)
+        if marker == AMF3.ARRAY:
+            return self._read_array(data, pos)
+        if marker in (AMF3.NULL, AMF3.UNDEFINED):
+            return None, pos
+        if marker == AMF3.FALSE:
+            return False, pos
+        if marker == AMF3.TRUE:
+            return True, pos
+
+        header, pos = _decode_u29(data, pos)
+        if not header & 1:
+            return self.objects[header >> 1], pos
+        length = header >> 1
+        if marker in (AMF3.XML, AMF3.XML_DOC):
+            value = str(data[pos : pos + length], "utf-8")
+            pos += length
+        elif marker == AMF3.BYTE_ARRAY:
+            value = bytes(data[pos : pos + length])
+            pos += length
+        elif marker == AMF3.DATE:
+            milliseconds = _DOUBLE.unpack_from(data, pos)[0]
+            value = _EPOCH + datetime.timedelta(milliseconds=milliseconds)
+            pos += 8
+        elif marker in _VECTORS:
+            # fixed-length flag, then the items
+            code, size = _VECTORS[marker]
+            value = list(struct.unpack_from(f">{length}{code}", data, pos + 1))
+            pos += 1 + length * size
+        elif marker == AMF3.VECTOR_OBJECT:
+            value = []
+            self.objects.append(value)
+            # fixed-length flag and item type name
+            _, pos = self.read_string(data, pos + 1)
+            for _ in range(length):
+                item, pos = self.decode(data, pos)
+                value.append(item)
+            return value, pos
+        elif marker == AMF3.DICTIONARY:
+            value = {}
+            self.objects.append(value)
+            # weak keys flag
+            pos += 1
+            for _ in range(length):
+                key, pos = self.decode(data, pos)
+                value[key], pos = self.decode(data, pos)
+            return value, pos
+        else:
+            raise NotImplementedError
+        self.objects.append(value)
+        return value, pos
+
+    def read_string(self, data: memoryview, pos: int) -> tuple[str, int]:
+        # without marker, as used for the keys and class names as well
+        header, pos = _decode_u29(data, pos)
+        if not header & 1:
+            return self.strings[header >> 1], pos
+        end = pos + (header >> 1)
+        value = str(data[pos:end], "utf-8")
+        if value:
+            self.strings.append(value)
+        return value, end
+
+    def _read_array(self, data: memoryview, pos: int) -> tuple[list | dict, int]:
+        header, pos = _decode_u29(data, pos)
+        if not header & 1:
+            return self.objects[header >> 1], pos
+        count = header >> 1
+        index = len(self.objects)
+        value: list | dict = []
+        self.objects.append(value)
+        key, pos = self.read_string(data, pos)
+        if key:
+            # associative part, the dense items are added under their index
+            value = self.objects[index] = {}
+            while key:
+                value[key], pos = self.decode(data, pos)
+                key, pos = self.read_string(data, pos)
+            for i in range(count):
+                value[i], pos = self.decode(data, pos)
+            return value, pos
+        for _ in range(count):
+            item, pos = self.decode(data, pos)
+            value.append(item)
+        return value, pos
+
+    def _read_object(self, data: memoryview, pos: int) -> tuple[dict, int]:
+        header, pos = _decode_u29(data, pos)
+        if not header & 1:
+            return self.objects[header >> 1], pos
+        if not header & 2:
+            class_name, dynamic, members = self.traits[header >> 2]
+        elif header & 4:
+            # externalizable, the class defines its own encoding
+            raise NotImplementedError
+        else:
+            dynamic = bool(header & 8)
+            class_name, pos = self.read_string(data, pos)
+            members = []
+            for _ in range(header >> 4):
+                member, pos = self.read_string(data, pos)
+                members.append(member)
+            self.traits.append((class_name, dynamic, members))
+        value = TypedObject(class_name) if class_name else {}
+        self.objects.append(value)
+        for member in members:
+            value[member], pos = self.decode(data, pos)
+        if dynamic:
+            key, pos = self.read_string(data, pos)
+            while key:
+                value[key], pos = self.decode(data, pos)
+                key, pos = self.read_string(data, pos)
+        return value, pos
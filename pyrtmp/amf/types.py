@@ -9,3 +9,26 @@ class AMF0(int, Enum):
     NULL = 0x05
     ARRAY = 0x08
     OBJECT_END = 0x09
+    # the following value is AMF3 encoded
+    AVMPLUS_OBJECT = 0x11
+
+
+class AMF3(int, Enum):
+    UNDEFINED = 0x00
+    NULL = 0x01
+    FALSE = 0x02
+    TRUE = 0x03
+    INTEGER = 0x04
+    DOUBLE = 0x05
+    STRING = 0x06
+    XML_DOC = 0x07
+    DATE = 0x08
+    ARRAY = 0x09
+    OBJECT = 0x0A
+    XML = 0x0B
+    BYTE_ARRAY = 0x0C
+    VECTOR_INT = 0x0D
+    VECTOR_UINT = 0x0E
+    VECTOR_DOUBLE = 0x0F
+    VECTOR_OBJECT = 0x10
+    DICTIONARY = 0x11
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import abc
+from collections import deque
+from typing import TYPE_CHECKING
+
+from pyrtmp.messages import Chunk
+
+if TYPE_CHECKING:
+    from pyrtmp.session_manager import SessionManager
+
+
+class ChunkSizePolicy(abc.ABC):
+    """
+    Picks the writer chunk size of a session. select is asked before every outgoing message,
+    and the session sends SetChunkSize ahead of the message whenever the answer changes.
+    """
+
+    @abc.abstractmethod
+    def select(self, session: SessionManager, chunk: Chunk) -> int:
+        raise NotImplementedError()
+
+
+class FixedChunkSizePolicy(ChunkSizePolicy):
+    def __init__(self, chunk_size: int = 8192) -> None:
+        self.chunk_size = chunk_size
+        super().__init__()
+
+    def select(self, session: SessionManager, chunk: Chunk) -> int:
+        return self.chunk_size
+
+
+class AdaptiveChunkSizePolicy(ChunkSizePolicy):
+    """
+    Follows the size of the outgoing audio/video messages: the chunk size is the power of two
+    that fits an average message of the last `window` ones, so most messages go out as a single
+    chunk (one header, one slice). While audio and video are both sent and the session is backed
+    up by more than `congested_bytes`, chunks are capped at `interleave_chunk_size` so audio and
+    control messages can be interleaved between the chunks of large video messages.
+    The size changes at most once per `window` media messages.
+    """
+
+    def __init__(
+        self,
+        initial_chunk_size: int = 4096,
+        min_chunk_size: int = 128,
+        max_chunk_size: int = 65536,
+        interleave_chunk_size: int = 4096,
+        congested_bytes: int = 65536,
+        window: int = 32,
+    ) -> None:
+        self.chunk_size = initial_chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.interleave_chunk_size = interleave_chunk_size
+        self.congested_bytes = congested_bytes
+        self.window = window
+        # sizes of the last media messages, and which of them were audio
+        self._sizes: deque[int] = deque(maxlen=window)
+        self._audio: deque[bool] = deque(maxlen=window)
+        self._since_change = 0
+        super().__init__()
+
+    def select(self, session: SessionManager, chunk: Chunk) -> int:
+        if chunk.msg_type_id not in (0x08, 0x09):
+            return self.chunk_size
+        self._sizes.append(len(chunk.payload))
+        self._audio.append(chunk.msg_type_id == 0x08)
+        self._since_change += 1
+        if self._since_change < self.window:
+            return self.chunk_size
+
+        average = sum(self._sizes) // len(self._sizes)
+        target = self.min_chunk_size
+        while target < average and target < self.max_chunk_size:
+            target *= 2
+        target = min(target, self.max_chunk_size)
+        interleaving = any(self._audio) and not all(self._audio)
+        if interleaving and session.backlog >= self.congested_bytes:
+            target = min(target, self.interleave_chunk_size)
+        if target != self.chunk_size:
+            self.chunk_size = target
+            self._since_change = 0
+        return self.chunk_size
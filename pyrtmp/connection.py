@@ -0,0 +1,682 @@
+from __future__ import annotations
+
+import enum
+import struct
+from collections import deque
+from collections.abc import Callable
+
+from pyrtmp import ByteBuffer, random_byte_array
+from pyrtmp.messages import (
+    EXTENDED_TIMESTAMP,
+    HEADER_FMT1,
+    HEADER_FMT2,
+    STREAM_ID,
+    Chunk,
+    encode_basic_header,
+    encode_message_header,
+)
+from pyrtmp.messages.handshake import C0, C1, C2
+from pyrtmp.messages.protocol_control import Acknowledgement, LimitType, WindowAcknowledgementSize
+
+_U32 = struct.Struct(">I")
+_PEER_BANDWIDTH = struct.Struct(">IB")
+
+# message types the chunk layer acts on (set chunk size, abort, acknowledgement, window
+# acknowledgement size, set peer bandwidth), decoded whatever the interest mask
+PROTOCOL_MESSAGE_TYPES = frozenset({0x01, 0x02, 0x03, 0x05, 0x06})
+# message types an aggregate (0x16) carries (audio, video, AMF0 and AMF3 data), aggregates are
+# decoded whenever any of them is
+AGGREGATED_MESSAGE_TYPES = frozenset({0x08, 0x09, 0x12, 0x0F})
+
+# msg_type_id -> priority of its chunks on the wire, lower goes first and messages of the same
+# priority go in the order they were sent. Control and command messages depend on each other
+# (a StreamBegin follows the createStream result it refers to) and share one priority, only
+# media is demoted behind them
+MESSAGE_PRIORITIES = {
+    # protocol control, user control, command, data, shared object (AMF0 and AMF3)
+    **dict.fromkeys((0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x14, 0x11, 0x12, 0x0F, 0x13, 0x10), 0),
+    # audio
+    0x08: 1,
+    # video, aggregate
+    0x09: 2,
+    0x16: 2,
+}
+_PRIORITIES = bytes(MESSAGE_PRIORITIES.get(msg_type_id, 2) for msg_type_id in range(256))
+
+
+class HandshakeState(int, enum.Enum):
+    UNINITIALIZED = 0
+    ACK_SENT = 1
+    DONE = 2
+
+
+class ChunkStreamState:
+    __slots__ = (
+        "chunk_type",
+        "timestamp",
+        "timestamp_delta",
+        "extended_timestamp",
+        "msg_length",
+        "msg_type_id",
+        "msg_stream_id",
+        "bytes_read",
+        "payload",
+    )
+
+    def __init__(self) -> None:
+        self.chunk_type = 0
+        self.timestamp = 0
+        self.timestamp_delta = 0
+        self.extended_timestamp = False
+        self.msg_length = 0
+        self.msg_type_id = 0
+        self.msg_stream_id = 0
+        # write offset into the message being reassembled, preallocated from msg_length
+        self.bytes_read = 0
+        self.payload: bytearray | None = None
+        super().__init__()
+
+
+class OutgoingMessage:
+    # an encoded message waiting in its chunk stream queue, handed out chunk by chunk
+    __slots__ = (
+        "chunk",
+        "epoch",
+        "priority",
+        "sequence",
+        "msg_stream_id",
+        "data",
+        "msg_length",
+        "header_length",
+        "continuation_length",
+        "chunk_size",
+        "pos",
+        "payload_pos",
+    )
+
+    def __init__(
+        self,
+        chunk: Chunk,
+        epoch: int,
+        priority: int,
+        sequence: int,
+        msg_stream_id: int,
+        data: bytearray,
+        msg_length: int,
+        header_length: int,
+        continuation_length: int,
+        chunk_size: int,
+    ) -> None:
+        # the message itself, encoded again if a message before it on the chunk stream is dropped
+        self.chunk = chunk
+        self.epoch = epoch
+        self.priority = priority
+        self.sequence = sequence
+        self.msg_stream_id = msg_stream_id
+        self.data = memoryview(data)
+        self.msg_length = msg_length
+        self.header_length = header_length
+        self.continuation_length = continuation_length
+        self.chunk_size = chunk_size
+        # bytes of data and of the payload handed out so far
+        self.pos = 0
+        self.payload_pos = 0
+        super().__init__()
+
+    @property
+    def done(self) -> bool:
+        return self.pos == len(self.data)
+
+    def take(self, max_bytes: int | None = None) -> memoryview:
+        # the following whole chunks, at least one and up to max_bytes (None for all of them)
+        start = end = self.pos
+        if max_bytes is None:
+            end = len(self.data)
+            self.payload_pos = self.msg_length
+        while end < len(self.data) and (end == start or end - start < max_bytes):
+            end += self.header_length if end == 0 else self.continuation_length
+            bytes_length = min(self.chunk_size, self.msg_length - self.payload_pos)
+            end += bytes_length
+            self.payload_pos += bytes_length
+        self.pos = end
+        return self.data[start:end]
+
+
+class RTMPConnection:
+    """
+    Sans-IO RTMP connection (server side). Bytes from the peer go in through receive_bytes,
+    which returns every message they complete. Bytes for the peer (handshake replies and
+    messages queued with send_message) are collected with data_to_send.
+    """
+
+    def __init__(
+        self,
+        reader_chunk_size: int = 128,
+        writer_chunk_size: int = 128,
+        max_chunk_streams: int = 64,
+        max_reassembly_bytes: int = 32 * 1024 * 1024,
+    ) -> None:
+        self.reader_chunk_size = reader_chunk_size
+        self.writer_chunk_size = writer_chunk_size
+        self.handshake_state = HandshakeState.UNINITIALIZED
+        self.total_read_bytes = 0
+        # bytes handed out by buffers_to_send
+        self.total_sent_bytes = 0
+        # window the peer asked to be acknowledged with (WindowAcknowledgementSize received), an
+        # Acknowledgement is queued every time that many bytes were read since the last one
+        self.peer_ack_window_size: int | None = None
+        self.acknowledgements_sent = 0
+        self._acknowledged_read_bytes = 0
+        # window advertised to the peer (WindowAcknowledgementSize sent)
+        self.ack_window_size: int | None = None
+        # bytes the peer reported as received with its last Acknowledgement
+        self.acknowledged_bytes = 0
+        # SetPeerBandwidth received: bytes that may be sent and not acknowledged yet, and the limit
+        # type it was set with, see apply_peer_bandwidth
+        self.peer_bandwidth: int | None = None
+        self.peer_limit_type: LimitType | None = None
+        # msg_type_id -> 1 if the message is reassembled and returned, see message_types
+        self._interest = bytes([1]) * 256
+        self._message_types: frozenset[int] | None = None
+        self.skipped_messages = 0
+        # indexed by chunk stream id, ids from 64 up (two and three byte basic headers) are kept
+        # in extended_chunk_streams; the peer may open at most max_chunk_streams of them
+        self.chunk_streams: list[ChunkStreamState | None] = [None] * 64
+        self.extended_chunk_streams: dict[int, ChunkStreamState] = {}
+        self.max_chunk_streams = max_chunk_streams
+        # payload bytes of the messages being reassembled, over all chunk streams
+        self.reassembly_bytes = 0
+        self.max_reassembly_bytes = max_reassembly_bytes
+        # chunk stream id -> header state of the last message sent on it
+        self.writer_chunk_streams: dict[int, ChunkStreamState] = {}
+        # chunk stream id -> type 3 basic header, prefixing every continuation chunk
+        self._continuation_headers: dict[int, bytes] = {}
+        self._buffer = ByteBuffer()
+        # handshake replies, sent ahead of any message
+        self._outgoing: list[bytes | bytearray] = []
+        # chunk stream id -> messages not handed out yet, in the order they were sent
+        self._writer_queues: dict[int, deque[OutgoingMessage]] = {}
+        # bumped by every SetChunkSize sent while messages are queued, a message never overtakes
+        # one of an earlier epoch (the chunk size it was split with must still be in effect)
+        self._writer_epoch = 0
+        # messages sent so far, orders the messages of one priority
+        self._writer_sequence = 0
+        self._outgoing_bytes = 0
+        super().__init__()
+
+    @property
+    def handshake_done(self) -> bool:
+        return self.handshake_state == HandshakeState.DONE
+
+    @property
+    def message_types(self) -> frozenset[int] | None:
+        return self._message_types
+
+    @message_types.setter
+    def message_types(self, value: frozenset[int] | None) -> None:
+        # messages of other types are skipped chunk by chunk: their payload is never
+        # reassembled and no message is returned for them (None keeps every type)
+        if value is None:
+            self._message_types = None
+            self._interest = bytes([1]) * 256
+            return
+        value = frozenset(value) | PROTOCOL_MESSAGE_TYPES
+        if value & AGGREGATED_MESSAGE_TYPES:
+            value |= {0x16}
+        self._message_types = value
+        self._interest = bytes(1 if msg_type_id in self._message_types else 0 for msg_type_id in range(256))
+
+    def receive_bytes(self, data: bytes) -> list[Chunk]:
+        self.total_read_bytes += len(data)
+        self._buffer.feed(data)
+        return self._receive()
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        # for asyncio.BufferedProtocol: the peer's bytes are read straight into the receive buffer
+        return self._buffer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> list[Chunk]:
+        self.total_read_bytes += nbytes
+        self._buffer.buffer_updated(nbytes)
+        return self._receive()
+
+    def _receive(self) -> list[Chunk]:
+        if self.handshake_state != HandshakeState.DONE:
+            self._receive_handshake()
+            if self.handshake_state != HandshakeState.DONE:
+                return []
+        messages = self._receive_chunks()
+        window = self.peer_ack_window_size
+        if window and self.total_read_bytes - self._acknowledged_read_bytes >= window:
+            # one acknowledgement for all the bytes read so far, however many windows they span
+            self._acknowledged_read_bytes = self.total_read_bytes
+            self.send_message(Acknowledgement(seq_number=self.total_read_bytes & 0xFFFFFFFF))
+            self.acknowledgements_sent += 1
+        return messages
+
+    @property
+    def unacknowledged_bytes(self) -> int:
+        # bytes sent the peer has not acknowledged yet (how far it lags behind), only meaningful
+        # once the peer acknowledges, see ack_window_size
+        return self.total_sent_bytes - self.acknowledged_bytes
+
+    def apply_peer_bandwidth(self, window_size: int, limit_type: int) -> None:
+        # hard: use the window, soft: the smaller of the window and the limit in effect,
+        # dynamic: hard if the previous limit was hard, else ignored. Unknown types are ignored.
+        # A window other than the one last advertised is advertised back with a
+        # WindowAcknowledgementSize, so the peer acknowledges before it runs out
+        if limit_type not in LimitType.__members__.values():
+            return
+        if limit_type == LimitType.DYNAMIC:
+            if self.peer_limit_type != LimitType.HARD:
+                return
+            limit_type = LimitType.HARD
+        if limit_type == LimitType.SOFT and self.peer_bandwidth is not None:
+            window_size = min(window_size, self.peer_bandwidth)
+        self.peer_bandwidth = window_size
+        self.peer_limit_type = LimitType(limit_type)
+        if window_size != self.ack_window_size:
+            self.send_message(WindowAcknowledgementSize(ack_window_size=window_size))
+
+    @property
+    def send_window(self) -> int | None:
+        # bytes that may still be handed out before the peer acknowledges more, None if unlimited.
+        # Only applies once the peer was asked to acknowledge (ack_window_size), and never below
+        # that window, the peer would not acknowledge before receiving it
+        if self.peer_bandwidth is None or self.ack_window_size is None:
+            return None
+        return max(self.peer_bandwidth, self.ack_window_size) - self.unacknowledged_bytes
+
+    def send_message(self, chunk: Chunk) -> None:
+        # queued on its chunk stream, chunks of different chunk streams are interleaved by
+        # priority when handed out with buffers_to_send
+        if chunk.msg_type_id == 0x01 and self._outgoing_bytes:
+            self._writer_epoch += 1
+        data, header_length, continuation_length = self._encode_message(chunk)
+        message = OutgoingMessage(
+            chunk=chunk,
+            epoch=self._writer_epoch,
+            priority=_PRIORITIES[chunk.msg_type_id],
+            sequence=self._writer_sequence,
+            msg_stream_id=chunk.msg_stream_id,
+            data=data,
+            msg_length=len(chunk.payload),
+            header_length=header_length,
+            continuation_length=continuation_length,
+            chunk_size=self.writer_chunk_size,
+        )
+        self._writer_sequence += 1
+        queue = self._writer_queues.get(chunk.chunk_id)
+        if queue is None:
+            queue = self._writer_queues[chunk.chunk_id] = deque()
+        queue.append(message)
+        self._outgoing_bytes += len(data)
+        if chunk.msg_type_id == 0x01:
+            # protocol control: the peer reads the following chunks with the new size
+            self.writer_chunk_size = _U32.unpack_from(chunk.payload)[0] & 0x7FFFFFFF
+        elif chunk.msg_type_id == 0x05:
+            self.ack_window_size = _U32.unpack_from(chunk.payload)[0]
+
+    def encode_message(self, chunk: Chunk) -> bytearray:
+        # the whole message, split into writer_chunk_size chunks, as one preallocated buffer
+        return self._encode_message(chunk)[0]
+
+    def _encode_message(self, chunk: Chunk) -> tuple[bytearray, int, int]:
+        payload = memoryview(chunk.payload)
+        msg_length = len(payload)
+        chunk_size = self.writer_chunk_size
+        chunk_id = chunk.chunk_id
+        timestamp = chunk.timestamp
+
+        # the smallest header the previous message on this chunk stream allows
+        stream = self.writer_chunk_streams.get(chunk_id)
+        if stream is None:
+            stream = self.writer_chunk_streams[chunk_id] = ChunkStreamState()
+            chunk_type = 0
+        elif stream.msg_stream_id != chunk.msg_stream_id or timestamp < stream.timestamp:
+            chunk_type = 0
+        elif stream.msg_length != msg_length or stream.msg_type_id != chunk.msg_type_id:
+            chunk_type = 1
+        elif stream.chunk_type == 0 or timestamp - stream.timestamp != stream.timestamp_delta:
+            # a type 3 header repeats the delta of the last type 1 or 2 header, peers disagree
+            # on what it means after a type 0 header
+            chunk_type = 2
+        else:
+            chunk_type = 3
+
+        if chunk_type == 0:
+            field = timestamp
+            stream.timestamp_delta = 0
+        else:
+            field = timestamp - stream.timestamp
+            stream.timestamp_delta = field
+        if chunk_type != 3:
+            stream.chunk_type = chunk_type
+            stream.extended_timestamp = field >= 0xFFFFFF
+        stream.timestamp = timestamp
+        stream.msg_length = msg_length
+        stream.msg_type_id = chunk.msg_type_id
+        stream.msg_stream_id = chunk.msg_stream_id
+
+        header = encode_basic_header(chunk_type, chunk_id) + encode_message_header(
+            chunk_type,
+            field,
+            msg_length,
+            chunk.msg_type_id,
+            chunk.msg_stream_id,
+        )
+        continuation = self._continuation_headers.get(chunk_id)
+        if continuation is None:
+            continuation = self._continuation_headers[chunk_id] = encode_basic_header(3, chunk_id)
+        if stream.extended_timestamp:
+            # every chunk of the message repeats the extended timestamp
+            continuation += encode_message_header(3, field)
+
+        continuations = (msg_length - 1) // chunk_size if msg_length else 0
+        data = bytearray(len(header) + msg_length + continuations * len(continuation))
+        pos = len(header)
+        data[:pos] = header
+        for offset in range(0, msg_length, chunk_size):
+            if offset:
+                data[pos : pos + len(continuation)] = continuation
+                pos += len(continuation)
+            bytes_length = min(chunk_size, msg_length - offset)
+            data[pos : pos + bytes_length] = payload[offset : offset + bytes_length]
+            pos += bytes_length
+        return data, len(header), len(continuation)
+
+    @property
+    def outgoing_bytes(self) -> int:
+        # bytes waiting to be collected with data_to_send or buffers_to_send
+        return self._outgoing_bytes
+
+    def data_to_send(self) -> bytes:
+        return b"".join(self.buffers_to_send())
+
+    def buffers_to_send(
+        self,
+        max_bytes: int | None = None,
+        stream_budgets: dict[int, float] | None = None,
+    ) -> list[bytes | bytearray | memoryview]:
+        # queued bytes for transport.writelines, by priority: the chunk stream whose next message
+        # has the highest priority (within the oldest epoch, then the earliest sent) goes first,
+        # whole chunks at a time.
+        # With max_bytes, about that many bytes are handed out (ending on a chunk boundary) and
+        # the rest stays queued, so messages sent in the meantime can still overtake it.
+        # stream_budgets (msg_stream_id -> bytes) likewise limits the audio and video of a message
+        # stream, and is decreased by what was handed out.
+        buffers = self._outgoing
+        self._outgoing = []
+        total = sum(len(data) for data in buffers)
+        queues = self._writer_queues
+        while queues and (max_bytes is None or total < max_bytes):
+            chunk_id = None
+            key = None
+            held_epoch = None
+            for candidate, queue in queues.items():
+                head = queue[0]
+                if stream_budgets is not None and head.priority and stream_budgets.get(head.msg_stream_id, 1) <= 0:
+                    if held_epoch is None or head.epoch < held_epoch:
+                        held_epoch = head.epoch
+                    continue
+                if key is None or (head.epoch, head.priority, head.sequence) < key:
+                    chunk_id = candidate
+                    key = (head.epoch, head.priority, head.sequence)
+            # a held message keeps the messages of later epochs (another chunk size) back as well
+            if chunk_id is None or (held_epoch is not None and key[0] > held_epoch):
+                break
+            queue = queues[chunk_id]
+            message = queue[0]
+            limit = None if max_bytes is None else max_bytes - total
+            budgeted = stream_budgets is not None and message.priority and message.msg_stream_id in stream_budgets
+            if budgeted:
+                budget = stream_budgets[message.msg_stream_id]
+                limit = budget if limit is None else min(limit, budget)
+            data = message.take(limit)
+            buffers.append(data)
+            total += len(data)
+            if budgeted:
+                stream_budgets[message.msg_stream_id] -= len(data)
+            if message.done:
+                queue.popleft()
+                if not queue:
+                    del queues[chunk_id]
+        self._outgoing_bytes -= total
+        self.total_sent_bytes += total
+        return buffers
+
+    def discard_queued(self, select: Callable[[OutgoingMessage], bool]) -> list[OutgoingMessage]:
+        # drops the queued messages select returns True for, except those partly handed out already.
+        # The headers of the messages after a dropped one on its chunk stream may be relative to it,
+        # they are encoded again starting with a type 0 header.
+        dropped = []
+        writer_chunk_size = self.writer_chunk_size
+        for chunk_id, queue in list(self._writer_queues.items()):
+            kept: deque[OutgoingMessage] = deque()
+            reencode = False
+            for message in queue:
+                if message.pos == 0 and select(message):
+                    dropped.append(message)
+                    self._outgoing_bytes -= len(message.data)
+                    if not reencode:
+                        # the next message on this chunk stream (queued or sent later) starts over
+                        self.writer_chunk_streams.pop(chunk_id, None)
+                        reencode = True
+                    continue
+                if reencode:
+                    self.writer_chunk_size = message.chunk_size
+                    data, message.header_length, message.continuation_length = self._encode_message(message.chunk)
+                    self._outgoing_bytes += len(data) - len(message.data)
+                    message.data = memoryview(data)
+                kept.append(message)
+            if not kept:
+                del self._writer_queues[chunk_id]
+            elif reencode:
+                self._writer_queues[chunk_id] = kept
+        self.writer_chunk_size = writer_chunk_size
+        return dropped
+
+    def queued_stream_ids(self) -> list[int]:
+        # message stream ids of the messages at the head of the chunk stream queues
+        return [queue[0].msg_stream_id for queue in self._writer_queues.values()]
+
+    def _receive_handshake(self) -> None:
+        buffer = self._buffer
+        if self.handshake_state == HandshakeState.UNINITIALIZED:
+            # read c0c1
+            if len(buffer) < 1 + 1536:
+                return
+            c0 = C0.from_buffer(buffer)
+            c1 = C1.from_buffer(buffer)
+            s0 = C0(protocol_version=c0.protocol_version)
+            s1 = C1(time=0, zero=0, random=random_byte_array(1528))
+            s2 = C2(time1=c1.time, time2=c1.time, random=c1.random)
+            s0s1s2 = s0.to_bytes() + s1.to_bytes() + s2.to_bytes()
+            self._outgoing.append(s0s1s2)
+            self._outgoing_bytes += len(s0s1s2)
+            self.handshake_state = HandshakeState.ACK_SENT
+
+        if self.handshake_state == HandshakeState.ACK_SENT:
+            # read c2
+            if len(buffer) < 1536:
+                return
+            C2.from_buffer(buffer)
+            self.handshake_state = HandshakeState.DONE
+
+    def _receive_chunks(self) -> list[Chunk]:
+        # decode every complete chunk currently buffered in one pass, a chunk is only
+        # consumed (and its chunk stream state updated) once its payload is fully available
+        buffer = self._buffer
+        data = buffer.raw
+        view = memoryview(data)
+        pos = buffer.tell()
+        end = buffer.end
+        streams = self.chunk_streams
+        extended = self.extended_chunk_streams
+        chunk_size = self.reader_chunk_size
+        interest = self._interest
+        reassembly_bytes = self.reassembly_bytes
+        max_reassembly_bytes = self.max_reassembly_bytes
+        messages = []
+
+        while pos < end:
+            start = pos
+            # basic header
+            fmt = data[pos] >> 6
+            cs_id = data[pos] & 0x3F
+            pos += 1
+            if cs_id > 1:
+                stream = streams[cs_id]
+            else:
+                if cs_id == 0:
+                    if end - pos < 1:
+                        break
+                    cs_id = data[pos] + 64
+                    pos += 1
+                else:
+                    if end - pos < 2:
+                        break
+                    cs_id = (data[pos] | data[pos + 1] << 8) + 64
+                    pos += 2
+                stream = extended.get(cs_id)
+            if stream is None:
+                if fmt != 0:
+                    raise KeyError(cs_id)
+                stream = self._new_chunk_stream(cs_id)
+
+            # message header
+            if fmt == 0:
+                if end - pos < 11:
+                    break
+                high, low, length_high, length_low, msg_type_id = HEADER_FMT1.unpack_from(data, pos)
+                msg_stream_id = STREAM_ID.unpack_from(data, pos + 7)[0]
+                pos += 11
+                timestamp = high << 8 | low
+                msg_length = length_high << 8 | length_low
+            elif fmt == 1:
+                if end - pos < 7:
+                    break
+                high, low, length_high, length_low, msg_type_id = HEADER_FMT1.unpack_from(data, pos)
+                msg_stream_id = stream.msg_stream_id
+                pos += 7
+                timestamp = high << 8 | low
+                msg_length = length_high << 8 | length_low
+            elif fmt == 2:
+                if end - pos < 3:
+                    break
+                high, low = HEADER_FMT2.unpack_from(data, pos)
+                msg_length = stream.msg_length
+                msg_type_id = stream.msg_type_id
+                msg_stream_id = stream.msg_stream_id
+                pos += 3
+                timestamp = high << 8 | low
+            else:
+                msg_length = stream.msg_length
+                msg_type_id = stream.msg_type_id
+                msg_stream_id = stream.msg_stream_id
+                timestamp = 0xFFFFFF if stream.extended_timestamp else 0
+
+            # extended timestamp, repeated by type 3 chunks of an extended header
+            extended_timestamp = timestamp == 0xFFFFFF
+            if extended_timestamp:
+                if end - pos < 4:
+                    break
+                timestamp = EXTENDED_TIMESTAMP.unpack_from(data, pos)[0]
+                pos += 4
+
+            # payload
+            new_message = fmt != 3 or stream.bytes_read == 0
+            bytes_read = 0 if new_message else stream.bytes_read
+            bytes_length = min(chunk_size, msg_length - bytes_read)
+            if end - pos < bytes_length:
+                break
+
+            if new_message:
+                if stream.payload is not None:
+                    # a new message header replaces the one being reassembled
+                    reassembly_bytes -= len(stream.payload)
+                if fmt == 0:
+                    stream.timestamp = timestamp
+                    stream.timestamp_delta = 0
+                elif fmt == 3:
+                    stream.timestamp += stream.timestamp_delta
+                else:
+                    stream.timestamp += timestamp
+                    stream.timestamp_delta = timestamp
+                if fmt != 3:
+                    stream.extended_timestamp = extended_timestamp
+                stream.chunk_type = fmt
+                stream.msg_length = msg_length
+                stream.msg_type_id = msg_type_id
+                stream.msg_stream_id = msg_stream_id
+                if interest[msg_type_id]:
+                    # the whole message counts against the limit from its first chunk on
+                    reassembly_bytes += msg_length
+                    if reassembly_bytes > max_reassembly_bytes:
+                        raise ValueError(f"more than {max_reassembly_bytes} bytes of messages being reassembled")
+                    stream.payload = bytearray(msg_length)
+                else:
+                    stream.payload = None
+
+            if stream.payload is not None:
+                stream.payload[bytes_read : bytes_read + bytes_length] = view[pos : pos + bytes_length]
+            stream.bytes_read = bytes_read + bytes_length
+            pos += bytes_length
+            if stream.bytes_read < msg_length:
+                continue
+            if stream.payload is None:
+                # outside the interest mask
+                stream.bytes_read = 0
+                self.skipped_messages += 1
+                continue
+
+            # message complete
+            message = Chunk(
+                chunk_type=stream.chunk_type,
+                chunk_id=cs_id,
+                timestamp=stream.timestamp,
+                msg_length=msg_length,
+                msg_type_id=msg_type_id,
+                msg_stream_id=msg_stream_id,
+                payload=stream.payload,
+            )
+            stream.payload = None
+            stream.bytes_read = 0
+            reassembly_bytes -= msg_length
+
+            if msg_type_id == 0x01:
+                # protocol control: the following chunks already use the new size
+                chunk_size = self.reader_chunk_size = _U32.unpack_from(message.payload)[0] & 0x7FFFFFFF
+            elif msg_type_id == 0x02:
+                aborted_id = _U32.unpack_from(message.payload)[0]
+                aborted = streams[aborted_id] if aborted_id < 64 else extended.get(aborted_id)
+                if aborted is not None:
+                    if aborted.payload is not None:
+                        reassembly_bytes -= len(aborted.payload)
+                    aborted.payload = None
+                    aborted.bytes_read = 0
+            elif msg_type_id == 0x03:
+                # the sequence number is the peer's 32-bit received byte count, wrapping around
+                sequence = _U32.unpack_from(message.payload)[0]
+                self.acknowledged_bytes = self.total_sent_bytes - ((self.total_sent_bytes - sequence) & 0xFFFFFFFF)
+            elif msg_type_id == 0x05:
+                self.peer_ack_window_size = _U32.unpack_from(message.payload)[0]
+            elif msg_type_id == 0x06:
+                self.apply_peer_bandwidth(*_PEER_BANDWIDTH.unpack_from(message.payload))
+            messages.append(message)
+        else:
+            start = pos
+
+        buffer.seek(start)
+        self.reassembly_bytes = reassembly_bytes
+        return messages
+
+    def _new_chunk_stream(self, cs_id: int) -> ChunkStreamState:
+        if len(self.extended_chunk_streams) + 64 - self.chunk_streams.count(None) >= self.max_chunk_streams:
+            raise ValueError(f"more than {self.max_chunk_streams} chunk streams")
+        stream = ChunkStreamState()
+        if cs_id < 64:
+            self.chunk_streams[cs_id] = stream
+        else:
+            self.extended_chunk_streams[cs_id] = stream
+        return stream
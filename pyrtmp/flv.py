@@ -1,7 +1,24 @@
+from __future__ import annotations
+
+import abc
+import asyncio
 import enum
+import os
+import struct
+from collections.abc import Sequence
+from typing import BinaryIO
 
 from bitstring import BitArray, BitStream
 
+from pyrtmp.messages import TAG_HEADER
+
+# signature, version, flags (audio and video), header size, then the first previous tag size
+_FLV_HEADER = struct.Struct(">3sBBII")
+# previous tag size, following the data
+_TAG_SIZE = struct.Struct(">I")
+# buffers a single os.writev call takes
+_IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") and "SC_IOV_MAX" in os.sysconf_names else 1024
+
 
 class FLVTag:
     def __init__(self, stream: BitStream) -> None:
@@ -48,47 +65,138 @@ class FLVWriter:
         super().__init__()
 
     def write_header(self) -> bytes:
-        stream = BitStream()
-        stream.append(b"FLV")
-        stream.append(BitStream(uint=1, length=8))
-        stream.append(BitStream(uint=5, length=8))
-        stream.append(BitStream(uint=9, length=32))
-        stream.append(BitStream(uint=self.prev_tag_size, length=32))
-        return stream.bytes
+        return _FLV_HEADER.pack(b"FLV", 1, 5, 9, self.prev_tag_size)
 
-    def write(self, timestamp: int, payload: bytes, media_type: FLVMediaType) -> bytes:
-        # preprocess
+    def write_tag(self, timestamp: int, payload: bytes, media_type: FLVMediaType) -> tuple[bytes, bytes, bytes]:
+        # (tag header, payload, previous tag size), the payload is passed through as it is so
+        # writelines or os.writev can write the tag without copying it
         payload_size = len(payload)
         self.prev_tag_size = 11 + payload_size
+        header = TAG_HEADER.pack(
+            int(media_type),
+            payload_size >> 8,
+            payload_size & 0xFF,
+            timestamp >> 8 & 0xFFFF,
+            timestamp & 0xFF,
+            timestamp >> 24 & 0xFF,
+            0,
+            0,
+        )
+        return header, payload, _TAG_SIZE.pack(self.prev_tag_size)
 
-        stream = BitStream()
-        # tag type
-        stream.append(BitArray(uint=int(media_type), length=8))
-        # payload size
-        stream.append(BitArray(uint=payload_size, length=24))
-        # timestamp
-        stream.append(BitArray(uint=timestamp & 0x00FFFFFF, length=24))
-        # timestamp ext
-        stream.append(BitArray(uint=timestamp >> 24, length=8))
-        # stream id
-        stream.append(BitArray(uint=0, length=24))
-        # payload
-        stream.append(payload)
-        # prev tag size
-        stream.append(BitArray(uint=self.prev_tag_size, length=32))
-        return stream.bytes
+    def write(self, timestamp: int, payload: bytes, media_type: FLVMediaType) -> bytes:
+        return b"".join(self.write_tag(timestamp, payload, media_type))
+
+
+def write_buffers(file: BinaryIO, buffers: Sequence[bytes]) -> None:
+    # with os.writev the buffers go to the file descriptor as they are, file must be unbuffered
+    if not hasattr(os, "writev"):
+        file.writelines(buffers)
+        return
+    fd = file.fileno()
+    views = [memoryview(data) for data in buffers]
+    index = 0
+    while index < len(views):
+        written = os.writev(fd, views[index : index + _IOV_MAX])
+        # skip what was written, a partial write resumes in the middle of a buffer
+        while index < len(views) and written >= len(views[index]):
+            written -= len(views[index])
+            index += 1
+        if written:
+            views[index] = views[index][written:]
+
+
+class MediaSink(abc.ABC):
+    """
+    Destination of a published stream. write queues a tag without blocking, write_buffer_size is
+    what was queued but not written out yet and drain waits until the sink can take more.
+    A session with a sink stops reading from the publisher while the sink is backed up, see
+    SessionManager.sink_buffer_limit.
+    """
+
+    @abc.abstractmethod
+    def write(self, timestamp: int, payload: bytes, media_type: FLVMediaType) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def write_buffer_size(self) -> int:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def drain(self) -> None:
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        raise NotImplementedError()
 
 
 class FLVFileWriter:
     def __init__(self, output: str) -> None:
-        self.buffer = open(output, "wb")
+        # unbuffered, the tags are written with write_buffers
+        self.buffer = open(output, "wb", buffering=0)
         self.writer = FLVWriter()
         self.buffer.write(self.writer.write_header())
         super().__init__()
 
-    def write(self, timestamp: int, payload: bytes, media_type: FLVMediaType):
-        self.buffer.write(self.writer.write(timestamp, payload, media_type))
-        self.buffer.flush()
+    def write(self, timestamp: int, payload: bytes, media_type: FLVMediaType) -> None:
+        write_buffers(self.buffer, self.writer.write_tag(timestamp, payload, media_type))
 
-    def close(self):
+    def close(self) -> None:
         self.buffer.close()
+
+
+class AsyncFLVFileWriter(MediaSink):
+    """
+    FLVFileWriter as a MediaSink, the tags are written to the file in the default executor.
+    An error writing them drops the tags still queued and is raised by the following write,
+    drain or close.
+    """
+
+    def __init__(self, output: str) -> None:
+        self.file = FLVFileWriter(output)
+        # header, payload and previous tag size of the tags not written yet
+        self._pending: list[bytes] = []
+        self._pending_bytes = 0
+        self._task: asyncio.Task | None = None
+        self._error: Exception | None = None
+        super().__init__()
+
+    def write(self, timestamp: int, payload: bytes, media_type: FLVMediaType) -> None:
+        self._raise_error()
+        self._pending.extend(self.file.writer.write_tag(timestamp, payload, media_type))
+        self._pending_bytes += 15 + len(payload)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._write_pending())
+
+    def write_buffer_size(self) -> int:
+        return self._pending_bytes
+
+    async def _write_pending(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                buffers, self._pending = self._pending, []
+                await loop.run_in_executor(None, write_buffers, self.file.buffer, buffers)
+                self._pending_bytes -= sum(len(data) for data in buffers)
+        except Exception as ex:
+            self._error = ex
+            self._pending = []
+            self._pending_bytes = 0
+        finally:
+            self._task = None
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    async def drain(self) -> None:
+        while self._task is not None:
+            await self._task
+        self._raise_error()
+
+    async def close(self) -> None:
+        try:
+            await self.drain()
+        finally:
+            self.file.close()
@@ -1,15 +1,70 @@
 from __future__ import annotations
 
 import logging
-from collections.abc import Iterable
-
-from bitstring import BitArray, BitStream
+import struct
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# chunk message headers, the 3-byte fields are split into a 16-bit and an 8-bit half
+HEADER_FMT1 = struct.Struct(">HBHBB")
+HEADER_FMT2 = struct.Struct(">HB")
+STREAM_ID = struct.Struct("<I")
+EXTENDED_TIMESTAMP = struct.Struct(">I")
+# FLV tag header, also the header of an aggregate's sub-messages: type, 24-bit size, 24-bit
+# timestamp and its upper 8 bits, 24-bit stream id (each 3-byte field split as above)
+TAG_HEADER = struct.Struct(">BHBHBBHB")
+
+
+def encode_basic_header(chunk_type: int, chunk_id: int) -> bytes:
+    if chunk_id <= 63:
+        # reserved order 0,1,2 included
+        return bytes((chunk_type << 6 | chunk_id,))
+    if chunk_id <= 319:
+        return bytes((chunk_type << 6, chunk_id - 64))
+    if chunk_id <= 65599:
+        return bytes((chunk_type << 6 | 1, (chunk_id - 64) & 0xFF, (chunk_id - 64) >> 8))
+    raise NotImplementedError
+
+
+def encode_message_header(
+    chunk_type: int,
+    timestamp: int,
+    msg_length: int = 0,
+    msg_type_id: int = 0,
+    msg_stream_id: int = 0,
+) -> bytes:
+    # timestamp is absolute for type 0 and a delta otherwise, type 3 only carries the extended timestamp
+    field = 0xFFFFFF if timestamp >= 0xFFFFFF else timestamp
+    if chunk_type == 0:
+        header = HEADER_FMT1.pack(field >> 8, field & 0xFF, msg_length >> 8, msg_length & 0xFF, msg_type_id)
+        header += STREAM_ID.pack(msg_stream_id)
+    elif chunk_type == 1:
+        header = HEADER_FMT1.pack(field >> 8, field & 0xFF, msg_length >> 8, msg_length & 0xFF, msg_type_id)
+    elif chunk_type == 2:
+        header = HEADER_FMT2.pack(field >> 8, field & 0xFF)
+    elif chunk_type == 3:
+        header = b""
+    else:
+        raise NotImplementedError
+
+    # extend timestamp if needed
+    if field == 0xFFFFFF:
+        header += EXTENDED_TIMESTAMP.pack(timestamp)
+    return header
+
 
 class BaseChunk:
+    __slots__ = (
+        "chunk_type",
+        "chunk_id",
+        "timestamp",
+        "msg_length",
+        "msg_type_id",
+        "msg_stream_id",
+        "payload",
+    )
+
     chunk_type: int
     chunk_id: int
     timestamp: int
@@ -37,6 +92,20 @@ class BaseChunk:
         self.payload = payload
         super().__init__()
 
+    @classmethod
+    def from_header(cls, chunk: BaseChunk, payload: bytes | None = None):
+        # copy the header (and payload) of chunk into a new instance without running __init__,
+        # the caller sets the fields of its own class
+        instance = cls.__new__(cls)
+        instance.chunk_type = chunk.chunk_type
+        instance.chunk_id = chunk.chunk_id
+        instance.timestamp = chunk.timestamp
+        instance.msg_length = chunk.msg_length
+        instance.msg_type_id = chunk.msg_type_id
+        instance.msg_stream_id = chunk.msg_stream_id
+        instance.payload = chunk.payload if payload is None else payload
+        return instance
+
     def __str__(self) -> str:
         buffer = f"{self.__class__.__name__}"
         buffer += f"(chunk_type: {self.chunk_type},"
@@ -49,126 +118,15 @@ class BaseChunk:
         return buffer
 
 
-class RawChunk(BaseChunk):
-    raw_chunk_number: int = (0,)
-    is_eof: bool = (False,)
-
-    def __init__(
-        self,
-        chunk_type: int,
-        chunk_id: int,
-        timestamp: int,
-        msg_length: int,
-        msg_type_id: int,
-        msg_stream_id: int,
-        payload: bytes,
-        raw_chunk_number: int = 0,
-        is_eof: bool = False,
-    ) -> None:
-        super().__init__(
-            chunk_type=chunk_type,
-            chunk_id=chunk_id,
-            timestamp=timestamp,
-            msg_length=msg_length,
-            msg_type_id=msg_type_id,
-            msg_stream_id=msg_stream_id,
-            payload=payload,
-        )
-        self.raw_chunk_number = raw_chunk_number
-        self.is_eof = is_eof
-
-    def to_bytes(self) -> bytes:
-        stream = BitStream()
-
-        # basic header
-        stream.append(BitArray(uint=self.chunk_type, length=2))
-        if self.chunk_id <= 63:
-            # reserved order 0,1,2 included
-            stream.append(BitArray(uint=self.chunk_id, length=6))
-        elif 64 <= self.chunk_id <= 319:
-            stream.append(BitArray(uint=0, length=6))
-            stream.append(BitArray(uint=self.chunk_id - 64, length=8))
-        elif 320 <= self.chunk_id <= 65599:
-            stream.append(BitArray(uint=1, length=6))
-            stream.append(BitArray(uint=self.chunk_id - 64, length=16))
-        else:
-            raise NotImplementedError
-
-        # message header
-        timestamp = 0xFFFFFF if self.timestamp >= 0xFFFFFF else self.timestamp
-
-        if self.chunk_type == 0:
-            # type 0 body
-            stream.append(BitArray(uint=timestamp, length=24))
-            stream.append(BitArray(uint=self.msg_length, length=24))
-            stream.append(BitArray(uint=self.msg_type_id, length=8))
-            stream.append(BitArray(uintle=self.msg_stream_id, length=32))
-        elif self.chunk_type == 1:
-            # type 1 body
-            stream.append(BitArray(uint=timestamp, length=24))
-            stream.append(BitArray(uint=self.msg_length, length=24))
-            stream.append(BitArray(uint=self.msg_type_id, length=8))
-        elif self.chunk_type == 2:
-            # type 2 body
-            stream.append(BitArray(uint=timestamp, length=24))
-        elif self.chunk_type == 3:
-            pass
-        else:
-            raise NotImplementedError
-
-        # extend timestamp if needed
-        if timestamp == 0xFFFFFF:
-            stream.append(BitArray(uint=self.timestamp, length=32))
-
-        stream.append(self.payload)
-
-        return stream.bytes
-
-
 class Chunk(BaseChunk):
+    __slots__ = ()
+
     def print_debug(self):
         logger.debug(f"======{self.__class__}======")
-        for key in self.__dict__.keys():
-            if key.startswith("_"):
-                continue
-
-            value = self.__dict__[key]
-            logger.debug(f"{key} => {value}")
-
-    def to_raw_chunks(self, chunk_size: int, previous: RawChunk = None) -> Iterable[RawChunk]:
-        chunks = []
-        payload = self.payload
-        # timestamp within a chunk must be the same
-        timedelta = 0 if previous is None else self.timestamp - previous.timestamp
-        # chunk_number is message level
-        chunk_number = 0
-        # determine chunk type based on previous raw chunk of another message
-        chunk_type = 0
-        if previous and previous.timestamp > timedelta:
-            raise NotImplementedError
-        if previous and previous.msg_stream_id == self.msg_stream_id:
-            chunk_type = 1
-        if chunk_type == 1 and previous.msg_length == self.msg_length and previous.msg_type_id == self.msg_type_id:
-            chunk_type = 2
-        if chunk_type == 3 and timedelta == 0:
-            chunk_type = 3
-
-        while len(payload) > 0:
-            bytes_length = min(chunk_size, len(payload))
-            is_eof = bytes_length - chunk_size == 0
-            raw_chunk = RawChunk(
-                chunk_type=chunk_type,
-                chunk_id=self.chunk_id,
-                timestamp=timedelta,
-                msg_length=self.msg_length,
-                msg_type_id=self.msg_type_id,
-                msg_stream_id=self.msg_stream_id,
-                payload=payload[:bytes_length],
-                raw_chunk_number=chunk_number,
-                is_eof=is_eof,
-            )
-            chunks.append(raw_chunk)
-            chunk_number += 1
-            chunk_type = 3  # next raw chunk always 3
-            payload = payload[bytes_length:]
-        return chunks
+        for klass in reversed(self.__class__.__mro__):
+            for key in klass.__dict__.get("__slots__", ()):
+                if key.startswith("_") or not hasattr(self, key):
+                    continue
+
+                value = getattr(self, key)
+                logger.debug(f"{key} => {value}")
@@ -1,5 +1,84 @@
-from pyrtmp.messages import Chunk
+from __future__ import annotations
+
+import struct
+from collections.abc import Sequence
+
+from pyrtmp.messages import TAG_HEADER, Chunk
+
+# size of the sub-message header and data, following the data
+_BACK_POINTER = struct.Struct(">I")
 
 
 class AggregateMessage(Chunk):
-    pass
+    __slots__ = ("messages",)
+
+    @classmethod
+    def from_chunk(cls, chunk: Chunk):
+        # the sub-messages are split off in one pass, their payloads are views into the aggregate's.
+        # Their timestamps are moved by the offset between the aggregate and the first one.
+        # A sub-message running past the aggregate or followed by the wrong back pointer raises
+        # ValueError.
+        view = memoryview(chunk.payload)
+        messages = []
+        offset = None
+        pos = 0
+        while pos < len(view):
+            if len(view) - pos < TAG_HEADER.size:
+                raise ValueError("aggregate ends within a sub-message header")
+            msg_type_id, size_high, size_low, ts_high, ts_low, ts_ext, _, _ = TAG_HEADER.unpack_from(view, pos)
+            msg_length = size_high << 8 | size_low
+            timestamp = ts_ext << 24 | ts_high << 8 | ts_low
+            if offset is None:
+                offset = chunk.timestamp - timestamp
+            pos += TAG_HEADER.size
+            if len(view) - pos < msg_length + _BACK_POINTER.size:
+                raise ValueError("sub-message runs past the end of the aggregate")
+            if _BACK_POINTER.unpack_from(view, pos + msg_length)[0] != TAG_HEADER.size + msg_length:
+                raise ValueError("sub-message back pointer does not match its size")
+            messages.append(
+                Chunk(
+                    chunk_type=0,
+                    chunk_id=chunk.chunk_id,
+                    timestamp=timestamp + offset,
+                    msg_length=msg_length,
+                    msg_type_id=msg_type_id,
+                    msg_stream_id=chunk.msg_stream_id,
+                    payload=view[pos : pos + msg_length],
+                )
+            )
+            pos += msg_length + _BACK_POINTER.size
+        instance = cls.from_header(chunk, view)
+        instance.messages = messages
+        return instance
+
+    @classmethod
+    def from_messages(cls, messages: Sequence[Chunk]):
+        # packs messages of one message stream, sent on the chunk stream of the first one with its timestamp
+        first = messages[0]
+        payload = bytearray()
+        for message in messages:
+            msg_length = len(message.payload)
+            timestamp = message.timestamp
+            payload += TAG_HEADER.pack(
+                message.msg_type_id,
+                msg_length >> 8,
+                msg_length & 0xFF,
+                timestamp >> 8 & 0xFFFF,
+                timestamp & 0xFF,
+                timestamp >> 24 & 0xFF,
+                0,
+                0,
+            )
+            payload += message.payload
+            payload += _BACK_POINTER.pack(TAG_HEADER.size + msg_length)
+        instance = cls(
+            chunk_type=0,
+            chunk_id=first.chunk_id,
+            timestamp=first.timestamp,
+            msg_length=len(payload),
+            msg_type_id=0x16,
+            msg_stream_id=first.msg_stream_id,
+            payload=payload,
+        )
+        instance.messages = list(messages)
+        return instance
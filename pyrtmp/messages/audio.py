@@ -1,13 +1,95 @@
-from bitstring import BitStream
+from __future__ import annotations
+
+import enum
 
 from pyrtmp.messages import Chunk
 
 
+class AudioPacketType(int, enum.Enum):
+    # enhanced RTMP, in the low 4 bits of the first byte. Legacy AAC packets use 0-1 as well
+    SEQUENCE_START = 0
+    CODED_FRAMES = 1
+    SEQUENCE_END = 2
+    MULTICHANNEL_CONFIG = 4
+    MULTITRACK = 5
+    MOD_EX = 7
+
+
+# sound format of an enhanced RTMP header
+AUDIO_EX_HEADER = 9
+# legacy sound format -> FourCC of the enhanced RTMP header
+LEGACY_AUDIO_FOURCC = {2: b".mp3", 10: b"mp4a"}
+
+
+def _parse_audio_header(payload: memoryview) -> tuple[int | None, bytes | None, int | None]:
+    # (sound format, FourCC, packet type)
+    if not payload:
+        return None, None, None
+    first = payload[0]
+    sound_format = first >> 4
+    if sound_format == AUDIO_EX_HEADER:
+        # enhanced RTMP: the packet type, then the FourCC (multitrack and ModEx packets wrap
+        # further headers, left to the caller)
+        packet_type = first & 0x0F
+        if packet_type in (AudioPacketType.MULTITRACK, AudioPacketType.MOD_EX) or len(payload) < 5:
+            return sound_format, None, packet_type
+        return sound_format, bytes(payload[1:5]), packet_type
+    fourcc = LEGACY_AUDIO_FOURCC.get(sound_format)
+    if sound_format == 10 and len(payload) > 1:
+        # AAC packet type
+        return sound_format, fourcc, payload[1]
+    return sound_format, fourcc, None
+
+
+def is_sequence_header(payload: bytes) -> bool:
+    # decoder configuration (AAC legacy or enhanced RTMP), needed by every frame that follows
+    return _parse_audio_header(memoryview(payload))[2] == AudioPacketType.SEQUENCE_START
+
+
 class AudioMessage(Chunk):
+    __slots__ = ("_header",)
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
-        instance = cls(**chunk.__dict__)
-        data = BitStream(instance.payload)
-        instance.control = data.read("bytes:1")
-        instance.data = data.read(f"bytes:{instance.msg_length - 1}")
-        return instance
+        # wrap the reassembled payload, nothing is copied
+        return cls.from_header(chunk, memoryview(chunk.payload))
+
+    @property
+    def control(self) -> memoryview:
+        return self.payload[:1]
+
+    @property
+    def data(self) -> memoryview:
+        return self.payload[1:]
+
+    def _parsed_header(self) -> tuple[int | None, bytes | None, int | None]:
+        # parsed on first access and kept, the properties below read from it
+        try:
+            return self._header
+        except AttributeError:
+            self._header = _parse_audio_header(memoryview(self.payload))
+            return self._header
+
+    @property
+    def is_enhanced(self) -> bool:
+        return self._parsed_header()[0] == AUDIO_EX_HEADER
+
+    @property
+    def sound_format(self) -> int | None:
+        # legacy FLV sound format (10 for AAC), AUDIO_EX_HEADER for an enhanced RTMP header
+        return self._parsed_header()[0]
+
+    @property
+    def fourcc(self) -> bytes | None:
+        # b"mp4a", b"Opus", b"fLaC", b"ac-3"... for AAC and MP3 legacy headers as well
+        return self._parsed_header()[1]
+
+    @property
+    def packet_type(self) -> int | None:
+        # AudioPacketType (SEQUENCE_START, CODED_FRAMES for legacy AAC), None for the other
+        # legacy formats
+        return self._parsed_header()[2]
+
+    @property
+    def is_sequence_header(self) -> bool:
+        return self._parsed_header()[2] == AudioPacketType.SEQUENCE_START
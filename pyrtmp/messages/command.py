@@ -1,39 +1,136 @@
 from __future__ import annotations
 
 import logging
+import struct
+from collections.abc import Callable
 
-from bitstring import BitStream
-
-from pyrtmp.amf.serializers import AMF0Deserializer, AMF0Serializer
+from pyrtmp.amf.serializers import AMF0Deserializer, AMF0Reader, AMF0Serializer
 from pyrtmp.messages import Chunk
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+_NUMBER = struct.Struct(">d")
+
+
+def _amf0_payload(*values) -> bytes:
+    data = bytearray()
+    for value in values:
+        AMF0Serializer.create_object(data, value)
+    return bytes(data)
+
+
+def _amf3_payload(*values) -> bytes:
+    # AMF3 command message: a format byte, then AMF0 values with the objects switched to AMF3
+    data = bytearray(b"\x00")
+    for value in values:
+        if isinstance(value, dict):
+            AMF0Serializer.write_avmplus_object(data, value)
+        else:
+            AMF0Serializer.create_object(data, value)
+    return bytes(data)
+
+
+def _payloads(*values) -> dict[int, bytes]:
+    # msg_type_id -> payload, responses are sent with the message type of the request
+    return {0x14: _amf0_payload(*values), 0x11: _amf3_payload(*values)}
+
+
+def _connect_result(object_encoding: int) -> dict[int, bytes]:
+    return _payloads(
+        "_result",
+        1,
+        {
+            "fmsVer": "FMS/3,0,123",
+            "capabilities": 31,
+        },
+        {
+            "level": "status",
+            "code": "NetConnection.Connect.Success",
+            "description": "Connection succeeds",
+            "objectEncoding": object_encoding,
+        },
+    )
+
+
+def _offset(msg_type_id: int) -> int:
+    # the format byte of an AMF3 command message
+    return 1 if msg_type_id == 0x11 else 0
+
+
+def _response(chunk_id: int, msg_type_id: int, msg_stream_id: int, payload: bytes | bytearray) -> Chunk:
+    return Chunk(
+        chunk_type=0,
+        chunk_id=chunk_id,
+        timestamp=0,
+        msg_length=len(payload),
+        msg_type_id=msg_type_id,
+        msg_stream_id=msg_stream_id,
+        payload=payload,
+    )
+
+
+# response payloads serialized once, the numbers are patched in at their offsets: a number
+# object is a marker byte and a double, and follows the "_result" string object (10 bytes)
+_CONNECT_RESULT = {0: _connect_result(0), 3: _connect_result(3)}
+_CREATE_STREAM_RESULT = _payloads("_result", 1, None, 1)
+_RESULT_TRANSACTION_ID = 10 + 1
+_CREATE_STREAM_RESULT_STREAM_ID = 10 + 9 + 1 + 1
+_PUBLISH_START = _payloads(
+    "onStatus",
+    0,
+    None,
+    {"level": "status", "code": "NetStream.Publish.Start", "description": "Start publishing"},
+)
+
+
+# (chunk, payload positioned after the transaction id, command name, transaction id) -> message
+CommandDecoder = Callable[[Chunk, AMF0Reader, str, float], Chunk]
+
 
 class CommandMessage(Chunk):
+    __slots__ = ("command_name", "transaction_id")
+
+    # command name -> decoder, filled at the bottom of this module and by MessageFactory.register_command
+    decoders: dict[str, CommandDecoder] = {}
+
     def __init__(self, command_name: str, **kwargs):
         super().__init__(**kwargs)
         self.command_name = command_name
 
     @classmethod
     def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        signature = AMF0Deserializer.from_stream(data)
-        if signature in NetConnectionCommand.valid_commands:
-            return NetConnectionCommand.from_chunk(chunk)
-        if signature in NetStreamCommand.valid_commands:
-            return NetStreamCommand.from_chunk(chunk)
-
-        logger.warning(f"Unknown CommandMessage '{signature}', use default parser")
-        instance = cls(
-            command_name=signature,
-            **chunk.__dict__,
-        )
+        # the command name and transaction id are read once, the remaining fields are
+        # read by the decoder registered for the command name
+        data = AMF0Reader(chunk.payload)
+        if chunk.msg_type_id == 0x11 and chunk.payload[:1] == b"\x00":
+            # format byte of an AMF3 command message, the values are AMF0 or switch to AMF3
+            data.pos = 1
+        command_name = AMF0Deserializer.from_stream(data)
+        transaction_id = AMF0Deserializer.from_stream(data) if data.remaining else None
+        decoder = CommandMessage.decoders.get(command_name)
+        if decoder is not None:
+            return decoder(chunk, data, command_name, transaction_id)
+
+        logger.warning(f"Unknown CommandMessage '{command_name}', use default parser")
+        return cls.from_command(chunk, command_name, transaction_id)
+
+    @classmethod
+    def from_stream(cls, chunk: Chunk, data: AMF0Reader, command_name: str, transaction_id: float):
+        # the fields following the transaction id are not decoded
+        return cls.from_command(chunk, command_name, transaction_id)
+
+    @classmethod
+    def from_command(cls, chunk: Chunk, command_name: str, transaction_id: float):
+        instance = cls.from_header(chunk)
+        instance.command_name = command_name
+        instance.transaction_id = transaction_id
         return instance
 
 
 class NetConnectionCommand(CommandMessage):
+    __slots__ = ()
+
     valid_commands = [
         "connect",
         "call",
@@ -41,24 +138,10 @@ class NetConnectionCommand(CommandMessage):
         "createStream",
     ]
 
-    @classmethod
-    def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        signature = AMF0Deserializer.from_stream(data)
-        if signature == "connect":
-            return NCConnect.from_chunk(chunk)
-        if signature == "createStream":
-            return NCCreateStream.from_chunk(chunk)
-
-        logger.warning(f"Unknown NetConnectionCommand '{signature}', use default parser")
-        instance = cls(
-            command_name=signature,
-            **chunk.__dict__,
-        )
-        return instance
-
 
 class NCConnect(NetConnectionCommand):
+    __slots__ = ("command_object", "optional_user_arguments")
+
     def __init__(
         self,
         transaction_id: int,
@@ -72,105 +155,60 @@ class NCConnect(NetConnectionCommand):
         self.optional_user_arguments = optional_user_arguments
 
     @classmethod
-    def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        command_name = AMF0Deserializer.from_stream(data)
-        transaction_id = AMF0Deserializer.from_stream(data)
+    def from_stream(cls, chunk: Chunk, data: AMF0Reader, command_name: str, transaction_id: float):
         command_object = AMF0Deserializer.from_stream(data)
-        if data.bytepos - len(data.bytes) > 0:
+        if data.remaining:
             optional_user_arguments = AMF0Deserializer.from_stream(data)
         else:
             optional_user_arguments = None
-        return cls(
-            command_name=command_name,
-            transaction_id=transaction_id,
-            command_object=command_object,
-            optional_user_arguments=optional_user_arguments,
-            **chunk.__dict__,
-        )
+        instance = cls.from_command(chunk, command_name, transaction_id)
+        instance.command_object = command_object
+        instance.optional_user_arguments = optional_user_arguments
+        return instance
 
     def create_response(self) -> Chunk:
-        data = BitStream()
-
-        # payload
-        AMF0Serializer.create_object(data, "_result")
-        AMF0Serializer.create_object(data, 1)
-        AMF0Serializer.create_object(
-            data,
-            {
-                "fmsVer": "FMS/3,0,123",
-                "capabilities": 31,
-            },
-        )
-        AMF0Serializer.create_object(
-            data,
-            {
-                "level": "status",
-                "code": "NetConnection.Connect.Success",
-                "description": "Connection succeeds",
-                "objectEncoding": 0,
-            },
-        )
-
-        return Chunk(
-            chunk_type=0,
-            chunk_id=self.chunk_id,
-            timestamp=0,
-            msg_length=len(data.bytes),
-            msg_type_id=0x14,
-            msg_stream_id=0,
-            payload=data.bytes,
-        )
+        # objectEncoding 3 acknowledges a client that asks for AMF3
+        object_encoding = 3 if self.command_object.get("objectEncoding") == 3 else 0
+        payload = bytearray(_CONNECT_RESULT[object_encoding][self.msg_type_id])
+        offset = _offset(self.msg_type_id)
+        _NUMBER.pack_into(payload, offset + _RESULT_TRANSACTION_ID, self.transaction_id)
+        return _response(self.chunk_id, self.msg_type_id, 0, payload)
 
 
 class NCCall(NetConnectionCommand):
-    pass
+    __slots__ = ()
 
 
 class NCClose(NetConnectionCommand):
-    pass
+    __slots__ = ()
 
 
 class NCCreateStream(NetConnectionCommand):
+    __slots__ = ("command_object",)
+
     def __init__(self, transaction_id: int, command_object: dict, **kwargs):
         super().__init__(**kwargs)
         self.transaction_id = transaction_id
         self.command_object = command_object
 
     @classmethod
-    def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        command_name = AMF0Deserializer.from_stream(data)
-        transaction_id = AMF0Deserializer.from_stream(data)
+    def from_stream(cls, chunk: Chunk, data: AMF0Reader, command_name: str, transaction_id: float):
         command_object = AMF0Deserializer.from_stream(data)
-        return cls(
-            command_name=command_name,
-            transaction_id=transaction_id,
-            command_object=command_object,
-            **chunk.__dict__,
-        )
-
-    def create_response(self) -> Chunk:
-        data = BitStream()
-
-        # payload
-        AMF0Serializer.create_object(data, "_result")
-        AMF0Serializer.create_object(data, self.transaction_id)
-        AMF0Serializer.create_object(data, None)
-        AMF0Serializer.create_object(data, 1)
+        instance = cls.from_command(chunk, command_name, transaction_id)
+        instance.command_object = command_object
+        return instance
 
-        return Chunk(
-            chunk_type=0,
-            chunk_id=self.chunk_id,
-            timestamp=0,
-            msg_length=len(data.bytes),
-            msg_type_id=0x14,
-            msg_stream_id=0,
-            payload=data.bytes,
-        )
+    def create_response(self, stream_id: int = 1) -> Chunk:
+        payload = bytearray(_CREATE_STREAM_RESULT[self.msg_type_id])
+        offset = _offset(self.msg_type_id)
+        _NUMBER.pack_into(payload, offset + _RESULT_TRANSACTION_ID, self.transaction_id)
+        _NUMBER.pack_into(payload, offset + _CREATE_STREAM_RESULT_STREAM_ID, stream_id)
+        return _response(self.chunk_id, self.msg_type_id, 0, payload)
 
 
 class NetStreamCommand(CommandMessage):
+    __slots__ = ()
+
     valid_commands = [
         "play",
         "play2",
@@ -184,33 +222,18 @@ class NetStreamCommand(CommandMessage):
         "onStatus",
     ]
 
-    @classmethod
-    def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        signature = AMF0Deserializer.from_stream(data)
-        if signature == "publish":
-            return NSPublish.from_chunk(chunk)
-        if signature == "closeStream":
-            return NSCloseStream.from_chunk(chunk)
-        if signature == "deleteStream":
-            return NSDeleteStream.from_chunk(chunk)
-
-        logger.warning(f"Unknown NetStreamCommand '{signature}', use default parser")
-        return cls(
-            command_name=signature,
-            **chunk.__dict__,
-        )
-
 
 class NSPlay(NetConnectionCommand):
-    pass
+    __slots__ = ()
 
 
 class NSPlay2(NetConnectionCommand):
-    pass
+    __slots__ = ()
 
 
 class NSDeleteStream(NetConnectionCommand):
+    __slots__ = ("stream_id", "command_object")
+
     def __init__(
         self,
         stream_id: int,
@@ -224,22 +247,18 @@ class NSDeleteStream(NetConnectionCommand):
         self.command_object = command_object
 
     @classmethod
-    def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        command_name = AMF0Deserializer.from_stream(data)
-        transaction_id = AMF0Deserializer.from_stream(data)
+    def from_stream(cls, chunk: Chunk, data: AMF0Reader, command_name: str, transaction_id: float):
         command_object = AMF0Deserializer.from_stream(data)
         stream_id = AMF0Deserializer.from_stream(data)
-        return cls(
-            command_name=command_name,
-            transaction_id=transaction_id,
-            command_object=command_object,
-            stream_id=stream_id,
-            **chunk.__dict__,
-        )
+        instance = cls.from_command(chunk, command_name, transaction_id)
+        instance.command_object = command_object
+        instance.stream_id = stream_id
+        return instance
 
 
 class NSCloseStream(NetConnectionCommand):
+    __slots__ = ("command_object",)
+
     def __init__(
         self,
         transaction_id: int,
@@ -251,28 +270,24 @@ class NSCloseStream(NetConnectionCommand):
         self.command_object = command_object
 
     @classmethod
-    def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        command_name = AMF0Deserializer.from_stream(data)
-        transaction_id = AMF0Deserializer.from_stream(data)
+    def from_stream(cls, chunk: Chunk, data: AMF0Reader, command_name: str, transaction_id: float):
         command_object = AMF0Deserializer.from_stream(data)
-        return cls(
-            command_name=command_name,
-            transaction_id=transaction_id,
-            command_object=command_object,
-            **chunk.__dict__,
-        )
+        instance = cls.from_command(chunk, command_name, transaction_id)
+        instance.command_object = command_object
+        return instance
 
 
 class NSReceiveAudio(NetConnectionCommand):
-    pass
+    __slots__ = ()
 
 
 class NSReceiveVideo(NetConnectionCommand):
-    pass
+    __slots__ = ()
 
 
 class NSPublish(NetConnectionCommand):
+    __slots__ = ("command_object", "publishing_name", "publishing_type")
+
     def __init__(
         self,
         transaction_id: int,
@@ -288,47 +303,37 @@ class NSPublish(NetConnectionCommand):
         self.publishing_type = publishing_type
 
     @classmethod
-    def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        command_name = AMF0Deserializer.from_stream(data)
-        transaction_id = AMF0Deserializer.from_stream(data)
+    def from_stream(cls, chunk: Chunk, data: AMF0Reader, command_name: str, transaction_id: float):
         command_object = AMF0Deserializer.from_stream(data)
         publishing_name = AMF0Deserializer.from_stream(data)
         publishing_type = AMF0Deserializer.from_stream(data)
-        return cls(
-            command_name=command_name,
-            transaction_id=transaction_id,
-            command_object=command_object,
-            publishing_name=publishing_name,
-            publishing_type=publishing_type,
-            **chunk.__dict__,
-        )
+        instance = cls.from_command(chunk, command_name, transaction_id)
+        instance.command_object = command_object
+        instance.publishing_name = publishing_name
+        instance.publishing_type = publishing_type
+        return instance
 
     def create_response(self) -> Chunk:
-        data = BitStream()
-
-        # payload
-        AMF0Serializer.create_object(data, "onStatus")
-        AMF0Serializer.create_object(data, 0)
-        AMF0Serializer.create_object(data, None)
-        AMF0Serializer.create_object(
-            data, {"level": "status", "code": "NetStream.Publish.Start", "description": "Start publishing"}
-        )
-
-        return Chunk(
-            chunk_type=0,
-            chunk_id=3,
-            timestamp=0,
-            msg_length=len(data.bytes),
-            msg_type_id=0x14,
-            msg_stream_id=self.msg_stream_id,
-            payload=data.bytes,
-        )
+        return _response(3, self.msg_type_id, self.msg_stream_id, _PUBLISH_START[self.msg_type_id])
 
 
 class NSSeek(NetConnectionCommand):
-    pass
+    __slots__ = ()
 
 
 class NSPause(NetConnectionCommand):
-    pass
+    __slots__ = ()
+
+
+# the other commands of NetConnection and NetStream are decoded without their fields
+CommandMessage.decoders.update(dict.fromkeys(NetConnectionCommand.valid_commands, NetConnectionCommand.from_stream))
+CommandMessage.decoders.update(dict.fromkeys(NetStreamCommand.valid_commands, NetStreamCommand.from_stream))
+CommandMessage.decoders.update(
+    {
+        "connect": NCConnect.from_stream,
+        "createStream": NCCreateStream.from_stream,
+        "publish": NSPublish.from_stream,
+        "closeStream": NSCloseStream.from_stream,
+        "deleteStream": NSDeleteStream.from_stream,
+    }
+)
@@ -1,42 +1,62 @@
 import logging
+from collections.abc import Callable
 
-from bitstring import BitStream
-
-from pyrtmp.amf.serializers import AMF0Deserializer, AMF0Serializer
+from pyrtmp.amf.serializers import AMF0Deserializer, AMF0Reader, AMF0Serializer
 from pyrtmp.messages import Chunk
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# (chunk, payload positioned after the handler name, handler name) -> message
+DataDecoder = Callable[[Chunk, AMF0Reader, str], Chunk]
+
 
 class DataMessage(Chunk):
+    __slots__ = ("command_name",)
+
     # msg_type_id = 0x12,0x0F
+    # data handler name -> decoder, filled at the bottom of this module and by MessageFactory.register_data
+    decoders: dict[str, DataDecoder] = {}
 
     @classmethod
     def from_chunk(cls, chunk: Chunk):
-        data = BitStream(chunk.payload)
-        signature = AMF0Deserializer.from_stream(data)
-        if signature in "@setDataFrame":
-            return MetaDataMessage.from_chunk(chunk)
-
-        logger.warning(f"Unknown data message '{signature}', use default parser")
-        instance = cls(**chunk.__dict__)
-        instance.command_name = signature
+        # the handler name is read once, the remaining values are read by from_stream
+        # of the class it resolves to
+        data = AMF0Reader(chunk.payload)
+        if chunk.msg_type_id == 0x0F and chunk.payload[:1] == b"\x00":
+            # format byte of an AMF3 data message, the values are AMF0 or switch to AMF3
+            data.pos = 1
+        command_name = AMF0Deserializer.from_stream(data)
+        return cls.from_stream(chunk, data, command_name)
+
+    @classmethod
+    def from_stream(cls, chunk: Chunk, data: AMF0Reader, command_name: str):
+        decoder = DataMessage.decoders.get(command_name)
+        if decoder is not None:
+            return decoder(chunk, data, command_name)
+
+        logger.warning(f"Unknown data message '{command_name}', use default parser")
+        instance = cls.from_header(chunk)
+        instance.command_name = command_name
         return instance
 
 
 class MetaDataMessage(DataMessage):
+    __slots__ = ("event", "meta")
+
     @classmethod
-    def from_chunk(cls, chunk: Chunk):
-        instance = cls(**chunk.__dict__)
-        data = BitStream(instance.payload)
-        instance.command_name = AMF0Deserializer.from_stream(data)
+    def from_stream(cls, chunk: Chunk, data: AMF0Reader, command_name: str):
+        instance = cls.from_header(chunk)
+        instance.command_name = command_name
         instance.event = AMF0Deserializer.from_stream(data)
         instance.meta = AMF0Deserializer.from_stream(data)
         return instance
 
     def to_raw_meta(self):
-        data = BitStream()
+        data = bytearray()
         AMF0Serializer.write_string_object(data, self.event)
         AMF0Serializer.write_array_object(data, self.meta)
-        return data.bytes
+        return bytes(data)
+
+
+DataMessage.decoders["@setDataFrame"] = MetaDataMessage.from_stream
@@ -1,7 +1,10 @@
+from collections.abc import Callable
+
 from pyrtmp.messages import Chunk
+from pyrtmp.messages.aggregate import AggregateMessage
 from pyrtmp.messages.audio import AudioMessage
-from pyrtmp.messages.command import CommandMessage
-from pyrtmp.messages.data import DataMessage
+from pyrtmp.messages.command import CommandDecoder, CommandMessage
+from pyrtmp.messages.data import DataDecoder, DataMessage
 from pyrtmp.messages.protocol_control import (
     AbortMessage,
     Acknowledgement,
@@ -14,39 +17,48 @@ from pyrtmp.messages.video import VideoMessage
 
 
 class MessageFactory:
-    @classmethod
-    def from_chunk(cls, chunk: Chunk):
+    # msg_type_id -> decoder
+    decoders: dict[int, Callable[[Chunk], Chunk]] = {
         # protocol control message
-        if chunk.msg_type_id == 0x01:
-            return SetChunkSize.from_chunk(chunk)
-        if chunk.msg_type_id == 0x02:
-            return AbortMessage.from_chunk(chunk)
-        if chunk.msg_type_id == 0x03:
-            return Acknowledgement.from_chunk(chunk)
-        if chunk.msg_type_id == 0x04:
-            return UserControlMessage.from_chunk(chunk)
-        if chunk.msg_type_id == 0x05:
-            return WindowAcknowledgementSize.from_chunk(chunk)
-        if chunk.msg_type_id == 0x06:
-            return SetPeerBandwidth.from_chunk(chunk)
-
+        0x01: SetChunkSize.from_chunk,
+        0x02: AbortMessage.from_chunk,
+        0x03: Acknowledgement.from_chunk,
+        0x04: UserControlMessage.from_chunk,
+        0x05: WindowAcknowledgementSize.from_chunk,
+        0x06: SetPeerBandwidth.from_chunk,
         # audio message
-        if chunk.msg_type_id == 0x08:
-            return AudioMessage.from_chunk(chunk)
-
+        0x08: AudioMessage.from_chunk,
         # video message
-        if chunk.msg_type_id == 0x09:
-            return VideoMessage.from_chunk(chunk)
-
+        0x09: VideoMessage.from_chunk,
         # AMF Based message
         # ==================
+        # data message, AMF0 and AMF3
+        0x12: DataMessage.from_chunk,
+        0x0F: DataMessage.from_chunk,
+        # command message, AMF0 and AMF3
+        0x14: CommandMessage.from_chunk,
+        0x11: CommandMessage.from_chunk,
+        # aggregate message, its sub-messages are decoded by the caller
+        0x16: AggregateMessage.from_chunk,
+    }
 
-        # data message
-        if chunk.msg_type_id == 0x12:
-            return DataMessage.from_chunk(chunk)
+    @classmethod
+    def register(cls, msg_type_id: int, decoder: Callable[[Chunk], Chunk]) -> None:
+        cls.decoders[msg_type_id] = decoder
+
+    @classmethod
+    def register_command(cls, command_name: str, decoder: CommandDecoder) -> None:
+        # command messages (0x14 and 0x11), the decoder reads the fields following the transaction id
+        CommandMessage.decoders[command_name] = decoder
 
-        # command message
-        if chunk.msg_type_id == 0x14:
-            return CommandMessage.from_chunk(chunk)
+    @classmethod
+    def register_data(cls, handler_name: str, decoder: DataDecoder) -> None:
+        # data messages (0x12 and 0x0F), the decoder reads the values following the handler name
+        DataMessage.decoders[handler_name] = decoder
 
-        raise NotImplementedError
+    @classmethod
+    def from_chunk(cls, chunk: Chunk):
+        decoder = cls.decoders.get(chunk.msg_type_id)
+        if decoder is None:
+            raise NotImplementedError
+        return decoder(chunk)
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
-from bitstring import BitArray, BitStream
+import struct
 
-from pyrtmp import BitStreamReader
+from pyrtmp import ByteBuffer
+
+_TIMES = struct.Struct(">II")
 
 
 class C0:
@@ -11,14 +13,11 @@ class C0:
         super().__init__()
 
     @classmethod
-    async def from_stream(cls, stream: BitStreamReader) -> C0:
-        protocol_version = await stream.read("uint:8")
-        return cls(protocol_version=protocol_version)
+    def from_buffer(cls, buffer: ByteBuffer) -> C0:
+        return cls(protocol_version=buffer.read_u8())
 
     def to_bytes(self) -> bytes:
-        stream = BitStream()
-        stream.append(BitArray(uint=self.protocol_version, length=8))
-        return stream.bytes
+        return bytes((self.protocol_version,))
 
 
 class C1:
@@ -29,18 +28,14 @@ class C1:
         super().__init__()
 
     @classmethod
-    async def from_stream(cls, stream: BitStreamReader) -> C1:
-        time = await stream.read("uint:32")
-        zero = await stream.read("uint:32")
-        rand = await stream.read("bytes:1528")
+    def from_buffer(cls, buffer: ByteBuffer) -> C1:
+        time = buffer.read_u32()
+        zero = buffer.read_u32()
+        rand = bytes(buffer.read_exact(1528))
         return cls(time=time, zero=zero, random=rand)
 
     def to_bytes(self) -> bytes:
-        stream = BitStream()
-        stream.append(BitArray(uint=self.time, length=32))
-        stream.append(BitArray(uint=self.zero, length=32))
-        stream.append(BitArray(bytes=self.random, length=1528 * 8))
-        return stream.bytes
+        return _TIMES.pack(self.time, self.zero) + self.random
 
 
 class C2:
@@ -51,15 +46,11 @@ class C2:
         super().__init__()
 
     @classmethod
-    async def from_stream(cls, stream: BitStreamReader) -> C2:
-        time1 = await stream.read("uint:32")
-        time2 = await stream.read("uint:32")
-        rand = await stream.read("bytes:1528")
+    def from_buffer(cls, buffer: ByteBuffer) -> C2:
+        time1 = buffer.read_u32()
+        time2 = buffer.read_u32()
+        rand = bytes(buffer.read_exact(1528))
         return cls(time1=time1, time2=time2, random=rand)
 
     def to_bytes(self) -> bytes:
-        stream = BitStream()
-        stream.append(BitArray(uint=self.time1, length=32))
-        stream.append(BitArray(uint=self.time2, length=32))
-        stream.append(BitArray(bytes=self.random, length=1528 * 8))
-        return stream.bytes
+        return _TIMES.pack(self.time1, self.time2) + self.random
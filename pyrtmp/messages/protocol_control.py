@@ -1,25 +1,39 @@
-from bitstring import BitArray, BitStream
+import enum
+import struct
+
+from bitstring import BitStream
 
 from pyrtmp.messages import Chunk
 
+_U32 = struct.Struct(">I")
+_PEER_BANDWIDTH = struct.Struct(">IB")
+
+
+class LimitType(int, enum.Enum):
+    # SetPeerBandwidth (0x06) limit types
+    HARD = 0
+    SOFT = 1
+    DYNAMIC = 2
+
 
 class ProtocolControlMessage(Chunk):
-    pass
+    __slots__ = ()
 
 
 class SetChunkSize(ProtocolControlMessage):
+    __slots__ = ("chunk_size",)
+
     def __init__(self, chunk_size: int):
         assert 1 <= chunk_size <= 2147483647
-        payload = BitStream()
-        payload.append(BitArray(uint=chunk_size, length=32))
+        payload = _U32.pack(chunk_size)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x01,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.chunk_size = chunk_size
 
@@ -31,17 +45,18 @@ class SetChunkSize(ProtocolControlMessage):
 
 
 class AbortMessage(ProtocolControlMessage):
+    __slots__ = ("chunk_stream_id",)
+
     def __init__(self, chunk_stream_id: int):
-        payload = BitStream()
-        payload.append(BitArray(uint=chunk_stream_id, length=32))
+        payload = _U32.pack(chunk_stream_id)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x02,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.chunk_stream_id = chunk_stream_id
 
@@ -53,17 +68,18 @@ class AbortMessage(ProtocolControlMessage):
 
 
 class Acknowledgement(ProtocolControlMessage):
+    __slots__ = ("seq_number",)
+
     def __init__(self, seq_number: int):
-        payload = BitStream()
-        payload.append(BitArray(uint=seq_number, length=32))
+        payload = _U32.pack(seq_number)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x03,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.seq_number = seq_number
 
@@ -75,17 +91,18 @@ class Acknowledgement(ProtocolControlMessage):
 
 
 class WindowAcknowledgementSize(ProtocolControlMessage):
+    __slots__ = ("ack_window_size",)
+
     def __init__(self, ack_window_size: int):
-        payload = BitStream()
-        payload.append(BitArray(uint=ack_window_size, length=32))
+        payload = _U32.pack(ack_window_size)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x05,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.ack_window_size = ack_window_size
 
@@ -97,18 +114,18 @@ class WindowAcknowledgementSize(ProtocolControlMessage):
 
 
 class SetPeerBandwidth(ProtocolControlMessage):
+    __slots__ = ("ack_window_size", "limit_type")
+
     def __init__(self, ack_window_size: int, limit_type: int):
-        payload = BitStream()
-        payload.append(BitArray(uint=ack_window_size, length=32))
-        payload.append(BitArray(uint=limit_type, length=8))
+        payload = _PEER_BANDWIDTH.pack(ack_window_size, limit_type)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x06,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.ack_window_size = ack_window_size
         self.limit_type = limit_type
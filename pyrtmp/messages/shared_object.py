@@ -2,4 +2,4 @@ from pyrtmp.messages import Chunk
 
 
 class SharedObjectMessage(Chunk):
-    pass
+    __slots__ = ()
@@ -1,14 +1,21 @@
 import logging
+import struct
 
-from bitstring import BitArray, BitStream
+from bitstring import BitStream
 
 from pyrtmp.messages import Chunk
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# event type, stream id (or timestamp)
+_EVENT = struct.Struct(">HI")
+_SET_BUFFER_LENGTH = struct.Struct(">HII")
+
 
 class UserControlMessage(Chunk):
+    __slots__ = ("event_type",)
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
         data = BitStream(chunk.payload)
@@ -16,112 +23,111 @@ class UserControlMessage(Chunk):
         if signature == 0:
             return StreamBegin.from_chunk(chunk)
         logger.warning(f"Unknown CommandMessage '{signature}', use default parser")
-        instance = cls(**chunk.__dict__)
+        instance = cls.from_header(chunk)
         instance.event_type = signature
         return instance
 
 
 class StreamBegin(UserControlMessage):
+    __slots__ = ("stream_id",)
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
         data = BitStream(chunk.payload)
-        instance = cls(**chunk.__dict__)
+        instance = cls.from_header(chunk)
         instance.event_type = data.read("uint:16")
         instance.stream_id = data.read("uint:32")
         return instance
 
     def __init__(self, stream_id: int) -> bytes:
-        payload = BitStream()
-        payload.append(BitArray(uint=0, length=16))
-        payload.append(BitArray(uint=stream_id, length=32))
+        payload = _EVENT.pack(0, stream_id)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x04,
             msg_stream_id=stream_id,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.event_type = 0
         self.stream_id = stream_id
 
 
 class StreamEOF(UserControlMessage):
+    __slots__ = ("stream_id",)
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
         data = BitStream(chunk.payload)
-        instance = cls(**chunk.__dict__)
+        instance = cls.from_header(chunk)
         instance.event_type = data.read("uint:16")
         instance.stream_id = data.read("uint:32")
         return instance
 
     def __init__(self, stream_id: int) -> bytes:
-        payload = BitStream()
-        payload.append(BitArray(uint=1, length=16))
-        payload.append(BitArray(uint=stream_id, length=32))
+        payload = _EVENT.pack(1, stream_id)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x04,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.event_type = 1
         self.stream_id = stream_id
 
 
 class StreamDry(UserControlMessage):
+    __slots__ = ("stream_id",)
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
         data = BitStream(chunk.payload)
-        instance = cls(**chunk.__dict__)
+        instance = cls.from_header(chunk)
         instance.event_type = data.read("uint:16")
         instance.stream_id = data.read("uint:32")
         return instance
 
     def __init__(self, stream_id: int) -> bytes:
-        payload = BitStream()
-        payload.append(BitArray(uint=2, length=16))
-        payload.append(BitArray(uint=stream_id, length=32))
+        payload = _EVENT.pack(2, stream_id)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x04,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.event_type = 2
         self.stream_id = stream_id
 
 
 class SetBufferLength(UserControlMessage):
+    __slots__ = ("stream_id", "milliseconds")
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
         data = BitStream(chunk.payload)
-        instance = cls(**chunk.__dict__)
+        instance = cls.from_header(chunk)
         instance.event_type = data.read("uint:16")
         instance.stream_id = data.read("uint:32")
         instance.milliseconds = data.read("uint:32")
         return instance
 
     def __init__(self, stream_id: int, milliseconds: int) -> bytes:
-        payload = BitStream()
-        payload.append(BitArray(uint=3, length=16))
-        payload.append(BitArray(uint=stream_id, length=32))
-        payload.append(BitArray(uint=milliseconds, length=32))
+        payload = _SET_BUFFER_LENGTH.pack(3, stream_id, milliseconds)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x04,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.event_type = 3
         self.stream_id = stream_id
@@ -129,78 +135,78 @@ class SetBufferLength(UserControlMessage):
 
 
 class StreamIsRecorded(UserControlMessage):
+    __slots__ = ("stream_id",)
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
         data = BitStream(chunk.payload)
-        instance = cls(**chunk.__dict__)
+        instance = cls.from_header(chunk)
         instance.event_type = data.read("uint:16")
         instance.stream_id = data.read("uint:32")
         return instance
 
     def __init__(self, stream_id: int) -> bytes:
-        payload = BitStream()
-        payload.append(BitArray(uint=4, length=16))
-        payload.append(BitArray(uint=stream_id, length=32))
+        payload = _EVENT.pack(4, stream_id)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x04,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.event_type = 4
         self.stream_id = stream_id
 
 
 class PingRequest(UserControlMessage):
+    __slots__ = ()
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
         data = BitStream(chunk.payload)
-        instance = cls(**chunk.__dict__)
+        instance = cls.from_header(chunk)
         instance.event_type = data.read("uint:16")
         instance.timestamp = data.read("uint:32")
         return instance
 
     def __init__(self, timestamp: int) -> bytes:
-        payload = BitStream()
-        payload.append(BitArray(uint=6, length=16))
-        payload.append(BitArray(uint=timestamp, length=32))
+        payload = _EVENT.pack(6, timestamp)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x04,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.event_type = 6
         self.timestamp = timestamp
 
 
 class PingResponse(UserControlMessage):
+    __slots__ = ()
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
         data = BitStream(chunk.payload)
-        instance = cls(**chunk.__dict__)
+        instance = cls.from_header(chunk)
         instance.event_type = data.read("uint:16")
         instance.timestamp = data.read("uint:32")
         return instance
 
     def __init__(self, timestamp: int) -> bytes:
-        payload = BitStream()
-        payload.append(BitArray(uint=7, length=16))
-        payload.append(BitArray(uint=timestamp, length=32))
+        payload = _EVENT.pack(7, timestamp)
         super().__init__(
             chunk_id=2,
             chunk_type=0,
             timestamp=0,
-            msg_length=len(payload.bytes),
+            msg_length=len(payload),
             msg_type_id=0x04,
             msg_stream_id=0,
-            payload=payload.bytes,
+            payload=payload,
         )
         self.event_type = 7
         self.timestamp = timestamp
@@ -1,13 +1,133 @@
-from bitstring import BitStream
+from __future__ import annotations
+
+import enum
 
 from pyrtmp.messages import Chunk
 
 
+class VideoFrameType(int, enum.Enum):
+    KEY_FRAME = 1
+    INTER_FRAME = 2
+    DISPOSABLE_INTER_FRAME = 3
+    GENERATED_KEY_FRAME = 4
+    COMMAND_FRAME = 5
+
+
+class VideoPacketType(int, enum.Enum):
+    # enhanced RTMP, in the low 4 bits of the first byte. Legacy AVC/HEVC packets use 0-2 as well
+    SEQUENCE_START = 0
+    CODED_FRAMES = 1
+    SEQUENCE_END = 2
+    CODED_FRAMES_X = 3
+    METADATA = 4
+    MPEG2TS_SEQUENCE_START = 5
+    MULTITRACK = 6
+    MOD_EX = 7
+
+
+# legacy codec id -> FourCC of the enhanced RTMP header, 12 is the de facto HEVC id
+LEGACY_VIDEO_FOURCC = {7: b"avc1", 12: b"hvc1"}
+
+
+def is_keyframe(payload: bytes) -> bool:
+    # frame type in bits 4-6 of the first byte (bit 7 flags the enhanced RTMP header)
+    return len(payload) > 0 and (payload[0] >> 4) & 0x07 == 1
+
+
+def is_sequence_header(payload: bytes) -> bool:
+    # decoder configuration (AVC/HEVC legacy or enhanced RTMP), needed by every frame that follows
+    return _parse_video_header(memoryview(payload))[3] in (
+        VideoPacketType.SEQUENCE_START,
+        VideoPacketType.MPEG2TS_SEQUENCE_START,
+    )
+
+
+def _si24(payload: memoryview, pos: int) -> int:
+    value = payload[pos] << 16 | payload[pos + 1] << 8 | payload[pos + 2]
+    return value - 0x1000000 if value & 0x800000 else value
+
+
+def _parse_video_header(payload: memoryview) -> tuple[int, int | None, bytes | None, int | None, int]:
+    # (frame type, legacy codec id, FourCC, packet type, composition time offset)
+    if not payload:
+        return 0, None, None, None, 0
+    first = payload[0]
+    frame_type = first >> 4 & 0x07
+    if first & 0x80:
+        # enhanced RTMP: the packet type, then the FourCC (multitrack and ModEx packets wrap
+        # further headers, left to the caller)
+        packet_type = first & 0x0F
+        if packet_type >= VideoPacketType.MULTITRACK or len(payload) < 5:
+            return frame_type, None, None, packet_type, 0
+        fourcc = bytes(payload[1:5])
+        composition_time = 0
+        if packet_type == VideoPacketType.CODED_FRAMES and fourcc in (b"avc1", b"hvc1") and len(payload) >= 8:
+            composition_time = _si24(payload, 5)
+        return frame_type, None, fourcc, packet_type, composition_time
+    codec_id = first & 0x0F
+    fourcc = LEGACY_VIDEO_FOURCC.get(codec_id)
+    if fourcc is None or len(payload) < 5:
+        return frame_type, codec_id, fourcc, None, 0
+    # AVC/HEVC packet type and composition time offset
+    return frame_type, codec_id, fourcc, payload[1], _si24(payload, 2)
+
+
 class VideoMessage(Chunk):
+    __slots__ = ("_header",)
+
     @classmethod
     def from_chunk(cls, chunk: Chunk):
-        instance = cls(**chunk.__dict__)
-        data = BitStream(instance.payload)
-        instance.control = data.read("bytes:1")
-        instance.data = data.read(f"bytes:{instance.msg_length - 1}")
-        return instance
+        # wrap the reassembled payload, nothing is copied
+        return cls.from_header(chunk, memoryview(chunk.payload))
+
+    @property
+    def control(self) -> memoryview:
+        return self.payload[:1]
+
+    @property
+    def data(self) -> memoryview:
+        return self.payload[1:]
+
+    def _parsed_header(self) -> tuple[int, int | None, bytes | None, int | None, int]:
+        # parsed on first access and kept, the properties below read from it
+        try:
+            return self._header
+        except AttributeError:
+            self._header = _parse_video_header(memoryview(self.payload))
+            return self._header
+
+    @property
+    def is_enhanced(self) -> bool:
+        return len(self.payload) > 0 and self.payload[0] & 0x80 != 0
+
+    @property
+    def frame_type(self) -> int:
+        return self._parsed_header()[0]
+
+    @property
+    def codec_id(self) -> int | None:
+        # legacy FLV codec id, None for an enhanced RTMP header
+        return self._parsed_header()[1]
+
+    @property
+    def fourcc(self) -> bytes | None:
+        # b"avc1", b"hvc1", b"av01", b"vp09"... for AVC and HEVC legacy headers as well
+        return self._parsed_header()[2]
+
+    @property
+    def packet_type(self) -> int | None:
+        # VideoPacketType (SEQUENCE_START, CODED_FRAMES, SEQUENCE_END for legacy AVC/HEVC),
+        # None for the other legacy codecs
+        return self._parsed_header()[3]
+
+    @property
+    def composition_time(self) -> int:
+        return self._parsed_header()[4]
+
+    @property
+    def is_keyframe(self) -> bool:
+        return self._parsed_header()[0] == VideoFrameType.KEY_FRAME
+
+    @property
+    def is_sequence_header(self) -> bool:
+        return self._parsed_header()[3] in (VideoPacketType.SEQUENCE_START, VideoPacketType.MPEG2TS_SEQUENCE_START)
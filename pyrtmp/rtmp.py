@@ -3,27 +3,124 @@ from __future__ import annotations
 import abc
 import asyncio
 import logging
+import types
 from asyncio import StreamReader, StreamWriter, events
+from asyncio.streams import FlowControlMixin
+from collections.abc import Awaitable, Callable
 
 from pyrtmp import StreamClosedException
+from pyrtmp.chunk_size import ChunkSizePolicy, FixedChunkSizePolicy
 from pyrtmp.messages import Chunk
+from pyrtmp.messages.aggregate import AggregateMessage
 from pyrtmp.messages.audio import AudioMessage
 from pyrtmp.messages.command import NCConnect, NCCreateStream, NSCloseStream, NSDeleteStream, NSPublish
 from pyrtmp.messages.data import MetaDataMessage
 from pyrtmp.messages.factory import MessageFactory
-from pyrtmp.messages.protocol_control import SetChunkSize, SetPeerBandwidth, WindowAcknowledgementSize
+from pyrtmp.messages.protocol_control import (
+    Acknowledgement,
+    SetChunkSize,
+    SetPeerBandwidth,
+    WindowAcknowledgementSize,
+)
 from pyrtmp.messages.user_control import StreamBegin
 from pyrtmp.messages.video import VideoMessage
 from pyrtmp.session_manager import SessionManager
+from pyrtmp.shaping import EgressShaper
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 
+MessageHandler = Callable[["BaseRTMPController", SessionManager, Chunk], Awaitable[None]]
+
+
+class MessageHandlers(dict):
+    """
+    Message class -> bound handler. A class without an entry of its own resolves through its
+    base classes (else the default handler) on first sight and is cached.
+    """
+
+    def __init__(self, handlers: dict, default: Callable[[SessionManager, Chunk], Awaitable[None]]) -> None:
+        super().__init__(handlers)
+        self.default = default
+
+    def __missing__(self, message_class: type) -> Callable[[SessionManager, Chunk], Awaitable[None]]:
+        handler = self.default
+        for base in message_class.__mro__[1:]:
+            if base in self:
+                handler = self[base]
+                break
+        self[message_class] = handler
+        return handler
+
+
 class BaseRTMPController(abc.ABC):
+    # message class -> name of the handling method, or an async function (controller, session, message)
+    message_handlers: dict[type, str | MessageHandler] = {
+        NCConnect: "on_nc_connect",
+        WindowAcknowledgementSize: "on_window_acknowledgement_size",
+        Acknowledgement: "on_acknowledgement",
+        NCCreateStream: "on_nc_create_stream",
+        NSPublish: "on_ns_publish",
+        MetaDataMessage: "on_metadata",
+        SetChunkSize: "on_set_chunk_size",
+        SetPeerBandwidth: "on_set_peer_bandwidth",
+        VideoMessage: "on_video_message",
+        AudioMessage: "on_audio_message",
+        NSCloseStream: "on_ns_close_stream",
+        NSDeleteStream: "on_ns_delete_stream",
+    }
+    # msg_type_id of the messages the controller consumes, other messages are skipped at the
+    # chunk layer without being reassembled or decoded (None decodes every message). Aggregates
+    # (0x16) are kept whenever audio, video or data messages are, and split into their
+    # sub-messages, which are filtered the same way
+    message_types: frozenset[int] | None = None
+
+    @classmethod
+    def register_handler(cls, message_class: type, handler: str | MessageHandler) -> None:
+        if "message_handlers" not in cls.__dict__:
+            cls.message_handlers = {}
+        cls.message_handlers[message_class] = handler
+        # drop the merged tables of this class and its subclasses
+        pending = [cls]
+        while pending:
+            klass = pending.pop()
+            if "_resolved_message_handlers" in klass.__dict__:
+                del klass._resolved_message_handlers
+            pending.extend(klass.__subclasses__())
+
+    @classmethod
+    def resolve_message_handlers(cls) -> dict[type, str | MessageHandler]:
+        # merged along the MRO once per controller class, so base class registrations apply to subclasses
+        resolved = cls.__dict__.get("_resolved_message_handlers")
+        if resolved is None:
+            resolved = {}
+            for klass in reversed(cls.__mro__):
+                resolved.update(klass.__dict__.get("message_handlers", {}))
+            cls._resolved_message_handlers = resolved
+        return resolved
+
+    def bind_message_handlers(self) -> MessageHandlers:
+        handlers = {}
+        for message_class, handler in self.resolve_message_handlers().items():
+            if isinstance(handler, str):
+                handlers[message_class] = getattr(self, handler)
+            else:
+                handlers[message_class] = types.MethodType(handler, self)
+        return MessageHandlers(handlers, self.on_unknown_message)
+
     async def client_callback(self, reader: StreamReader, writer: StreamWriter) -> None:
         raise NotImplementedError()
 
+    async def session_callback(self, session: SessionManager) -> None:
+        raise NotImplementedError()
+
+    def create_chunk_size_policy(self) -> ChunkSizePolicy | None:
+        raise NotImplementedError()
+
+    def create_egress_shaper(self) -> EgressShaper | None:
+        raise NotImplementedError()
+
     async def on_handshake(self, session: SessionManager) -> None:
         raise NotImplementedError()
 
@@ -33,6 +130,9 @@ class BaseRTMPController(abc.ABC):
     async def on_window_acknowledgement_size(self, session: SessionManager, message: WindowAcknowledgementSize) -> None:
         raise NotImplementedError()
 
+    async def on_acknowledgement(self, session: SessionManager, message: Acknowledgement) -> None:
+        raise NotImplementedError()
+
     async def on_nc_create_stream(self, session: SessionManager, message: NCCreateStream) -> None:
         raise NotImplementedError()
 
@@ -45,6 +145,9 @@ class BaseRTMPController(abc.ABC):
     async def on_set_chunk_size(self, session: SessionManager, message: SetChunkSize) -> None:
         raise NotImplementedError()
 
+    async def on_set_peer_bandwidth(self, session: SessionManager, message: SetPeerBandwidth) -> None:
+        raise NotImplementedError()
+
     async def on_video_message(self, session: SessionManager, message: VideoMessage) -> None:
         raise NotImplementedError()
 
@@ -68,10 +171,25 @@ class BaseRTMPController(abc.ABC):
 
 
 class SimpleRTMPController(BaseRTMPController):
+    # sent ahead of the connect _result, built once (SetChunkSize comes from the chunk size policy)
+    connect_control_messages = (
+        WindowAcknowledgementSize(ack_window_size=5000000),
+        SetPeerBandwidth(ack_window_size=5000000, limit_type=2),
+        StreamBegin(stream_id=0),
+    )
+    publish_stream_begin = StreamBegin(stream_id=1)
+
     async def client_callback(self, reader: StreamReader, writer: StreamWriter) -> None:
         # create session per client
         session = SessionManager(reader=reader, writer=writer)
+        await self.session_callback(session)
+
+    async def session_callback(self, session: SessionManager) -> None:
         logger.debug(f"Client connected {session.peername}")
+        handlers = self.bind_message_handlers()
+        session.message_types = self.message_types
+        session.chunk_size_policy = self.create_chunk_size_policy()
+        session.shaper = self.create_egress_shaper()
 
         try:
             # do handshake
@@ -82,28 +200,20 @@ class SimpleRTMPController(BaseRTMPController):
             async for chunk in session.read_chunks_from_stream():
                 message = MessageFactory.from_chunk(chunk)
                 # logger.debug(f"Receiving {str(message)} {message.chunk_id}")
-                if isinstance(message, NCConnect):
-                    await self.on_nc_connect(session, message)
-                elif isinstance(message, WindowAcknowledgementSize):
-                    await self.on_window_acknowledgement_size(session, message)
-                elif isinstance(message, NCCreateStream):
-                    await self.on_nc_create_stream(session, message)
-                elif isinstance(message, NSPublish):
-                    await self.on_ns_publish(session, message)
-                elif isinstance(message, MetaDataMessage):
-                    await self.on_metadata(session, message)
-                elif isinstance(message, SetChunkSize):
-                    await self.on_set_chunk_size(session, message)
-                elif isinstance(message, VideoMessage):
-                    await self.on_video_message(session, message)
-                elif isinstance(message, AudioMessage):
-                    await self.on_audio_message(session, message)
-                elif isinstance(message, NSCloseStream):
-                    await self.on_ns_close_stream(session, message)
-                elif isinstance(message, NSDeleteStream):
-                    await self.on_ns_delete_stream(session, message)
+                if message.__class__ is AggregateMessage:
+                    # handled as if its sub-messages were received one by one
+                    for sub_message in message.messages:
+                        if self.message_types is not None and sub_message.msg_type_id not in self.message_types:
+                            continue
+                        if sub_message.msg_type_id not in MessageFactory.decoders:
+                            logger.warning(f"Skipping aggregated message of unknown type {sub_message.msg_type_id}")
+                            continue
+                        sub_message = MessageFactory.from_chunk(sub_message)
+                        await handlers[sub_message.__class__](session, sub_message)
                 else:
-                    await self.on_unknown_message(session, message)
+                    await handlers[message.__class__](session, message)
+                if session.sink is not None:
+                    await session.wait_sink()
 
         except StreamClosedException as ex:
             logger.debug(f"Client disconnected {session.peername}")
@@ -113,21 +223,30 @@ class SimpleRTMPController(BaseRTMPController):
         finally:
             await self.cleanup(session)
 
-        writer.close()
+        session.flush()
+        if session.writer is not None:
+            session.writer.close()
+
+    def create_chunk_size_policy(self) -> ChunkSizePolicy | None:
+        return FixedChunkSizePolicy(chunk_size=8192)
+
+    def create_egress_shaper(self) -> EgressShaper | None:
+        # unshaped, return an EgressShaper (sharing a TokenBucket across sessions for a process wide limit)
+        return None
 
     async def on_handshake(self, session: SessionManager) -> None:
         await session.handshake()
 
     async def on_nc_connect(self, session: SessionManager, message: NCConnect) -> None:
-        session.write_chunk_to_stream(WindowAcknowledgementSize(ack_window_size=5000000))
-        session.write_chunk_to_stream(SetPeerBandwidth(ack_window_size=5000000, limit_type=2))
-        session.write_chunk_to_stream(StreamBegin(stream_id=0))
-        session.write_chunk_to_stream(SetChunkSize(chunk_size=8192))
-        session.writer_chunk_size = 8192
-        session.write_chunk_to_stream(message.create_response())
+        session.write_chunks_to_stream((*self.connect_control_messages, message.create_response()))
         await session.drain()
 
     async def on_window_acknowledgement_size(self, session: SessionManager, message: WindowAcknowledgementSize) -> None:
+        # the connection acknowledges the peer's bytes with this window from now on
+        pass
+
+    async def on_acknowledgement(self, session: SessionManager, message: Acknowledgement) -> None:
+        # already counted by the connection, see session.unacknowledged_bytes
         pass
 
     async def on_nc_create_stream(self, session: SessionManager, message: NCCreateStream) -> None:
@@ -135,15 +254,19 @@ class SimpleRTMPController(BaseRTMPController):
         await session.drain()
 
     async def on_ns_publish(self, session: SessionManager, message: NSPublish) -> None:
-        session.write_chunk_to_stream(StreamBegin(stream_id=1))
-        session.write_chunk_to_stream(message.create_response())
+        session.write_chunks_to_stream((self.publish_stream_begin, message.create_response()))
         await session.drain()
 
     async def on_metadata(self, session: SessionManager, message: MetaDataMessage) -> None:
         pass
 
     async def on_set_chunk_size(self, session: SessionManager, message: SetChunkSize) -> None:
-        session.reader_chunk_size = message.chunk_size
+        # already applied by the connection before the following chunks were parsed
+        pass
+
+    async def on_set_peer_bandwidth(self, session: SessionManager, message: SetPeerBandwidth) -> None:
+        # already applied by the connection, see session.connection.peer_bandwidth
+        pass
 
     async def on_video_message(self, session: SessionManager, message: VideoMessage) -> None:
         pass
@@ -178,6 +301,35 @@ class RTMPProtocol(asyncio.StreamReaderProtocol):
         )
 
 
+class RTMPBufferedProtocol(FlowControlMixin, asyncio.BufferedProtocol):
+    """
+    Alternative to RTMPProtocol: the transport reads straight into the session's receive buffer
+    (get_buffer/buffer_updated), and complete chunks are parsed in place, without a StreamReader.
+    """
+
+    def __init__(self, controller: BaseRTMPController) -> None:
+        self.controller = controller
+        self.loop = events.get_event_loop()
+        self.session: SessionManager | None = None
+        self.task: asyncio.Task | None = None
+        super().__init__(loop=self.loop)
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        writer = StreamWriter(transport, self, None, self.loop)
+        self.session = SessionManager(reader=None, writer=writer)
+        self.task = self.loop.create_task(self.controller.session_callback(self.session))
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.session.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.session.buffer_updated(nbytes)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.session.feed_eof()
+        super().connection_lost(exc)
+
+
 class SimpleRTMPServer:
     def __init__(self) -> None:
         self.server = None
@@ -192,10 +344,15 @@ class SimpleRTMPServer:
         if self.on_stop:
             self.on_stop()
 
-    async def create(self, host: str, port: int) -> None:
+    async def create(
+        self,
+        host: str,
+        port: int,
+        protocol_class: type[RTMPProtocol] | type[RTMPBufferedProtocol] = RTMPProtocol,
+    ) -> None:
         loop = asyncio.get_event_loop()
         self.server = await loop.create_server(
-            lambda: RTMPProtocol(controller=SimpleRTMPController()),
+            lambda: protocol_class(controller=SimpleRTMPController()),
             host=host,
             port=port,
         )
@@ -1,193 +1,491 @@
 from __future__ import annotations
 
+import asyncio
+import enum
+import socket
+import time
 from asyncio import StreamReader, StreamWriter
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Iterable
 
-from bitstring import BitStream
+from pyrtmp import StreamClosedException
+from pyrtmp.chunk_size import ChunkSizePolicy
+from pyrtmp.connection import OutgoingMessage, RTMPConnection
+from pyrtmp.flv import MediaSink
+from pyrtmp.messages import Chunk
+from pyrtmp.messages.aggregate import AggregateMessage
+from pyrtmp.messages.audio import AudioMessage, is_sequence_header as is_audio_sequence_header
+from pyrtmp.messages.protocol_control import SetChunkSize
+from pyrtmp.messages.video import VideoMessage, is_keyframe, is_sequence_header as is_video_sequence_header
+from pyrtmp.shaping import EgressShaper
 
-from pyrtmp import BitStreamReader, random_byte_array
-from pyrtmp.messages import Chunk, RawChunk
-from pyrtmp.messages.handshake import C0, C1, C2
+
+class WriteMode(int, enum.Enum):
+    # every message is written as soon as it is queued, TCP_NODELAY on
+    LOW_LATENCY = 0
+    # messages are collected and written together once per event loop iteration (or after
+    # flush_interval), or as soon as flush_bytes are pending, TCP_NODELAY off
+    THROUGHPUT = 1
 
 
 class SessionManager:
     def __init__(
-        self, reader: StreamReader, writer: StreamWriter, reader_chunk_size: int = 128, writer_chunk_size: int = 128
+        self,
+        reader: StreamReader | None,
+        writer: StreamWriter | None,
+        reader_chunk_size: int = 128,
+        writer_chunk_size: int = 128,
+        read_size: int = 65536,
+        write_mode: WriteMode = WriteMode.LOW_LATENCY,
+        flush_bytes: int = 65536,
+        flush_interval: float = 0.0,
+        write_buffer_limit: int | None = 262144,
+        chunk_size_policy: ChunkSizePolicy | None = None,
+        shaper: EgressShaper | None = None,
+        high_water: int | None = 4194304,
+        low_water: int | None = None,
+        sink_buffer_limit: int = 1048576,
+        aggregate_bytes: int | None = None,
+        read_buffer_limit: int = 131072,
+        peer: tuple[str, int] | None = None,
     ) -> None:
+        # without a writer the session has no transport: its owner feeds the peer's bytes to
+        # receive_bytes and collects the replies with connection.data_to_send (RTMPT), peer is
+        # then the address reported by peername
         self.reader = reader
         self.writer = writer
-        self.reader_chunk_size = reader_chunk_size
-        self.writer_chunk_size = writer_chunk_size
-        self.latest_chunks = {}
-        self.fifo_reader = BitStreamReader(self.reader)
-        self.previous_chunk_for_writing: RawChunk | None = None
+        self.peer = peer
+        self.read_size = read_size
+        self.connection = RTMPConnection(reader_chunk_size=reader_chunk_size, writer_chunk_size=writer_chunk_size)
+        self.pending_chunks: list[Chunk] = []
+        # payload bytes of the messages received but not handled yet. Without a reader (the
+        # transport feeds buffer_updated) reading pauses once they pass read_buffer_limit and
+        # resumes when the handlers have worked them off, as a StreamReader would
+        self.pending_bytes = 0
+        self.read_buffer_limit = read_buffer_limit
+        self.read_buffer_pauses = 0
+        self._read_buffer_full = False
         self.state = {}
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        # bytes the transport may buffer, queued chunks beyond that stay in the connection where
+        # higher priority messages (control, command, audio) can still overtake them
+        self.write_buffer_limit = write_buffer_limit
+        # renegotiates writer_chunk_size as messages are sent, None leaves it to the caller
+        self.chunk_size_policy = chunk_size_policy
+        # rate limits for the bytes handed to the transport, None writes as fast as it drains
+        self.shaper = shaper
+        # once the backlog grows past high_water, queued media is dropped until it is back under
+        # low_water (half of high_water by default), see _shed. None never drops anything
+        self.high_water = high_water
+        self.low_water = low_water
+        self.dropped_video_messages = 0
+        self.dropped_audio_messages = 0
+        self.dropped_bytes = 0
+        # msg_stream_id of the streams whose video is dropped until their next keyframe
+        self._awaiting_keyframe: set[int] = set()
+        # where the published stream goes, once it buffers more than sink_buffer_limit bytes
+        # reading from the publisher pauses until the sink has drained, see wait_sink
+        self.sink: MediaSink | None = None
+        self.sink_buffer_limit = sink_buffer_limit
+        self.reading_pauses = 0
+        self._reading_paused_time = 0.0
+        self._paused_at: float | None = None
+        # audio and video messages smaller than aggregate_bytes are collected until the next flush
+        # (or until aggregate_bytes are collected) and sent as one aggregate message, None sends
+        # each of them on its own. Only THROUGHPUT mode and write_chunks_to_stream collect more
+        # than one message between flushes
+        self.aggregate_bytes = aggregate_bytes
+        self._aggregate: list[Chunk] = []
+        self._aggregate_size = 0
+        self.aggregated_messages = 0
+        if write_buffer_limit is not None and writer is not None:
+            self.writer.transport.set_write_buffer_limits(high=write_buffer_limit)
+        # writer.writelines calls issued by flush and the bytes they carried, the transport may
+        # split or coalesce them into any number of send syscalls
+        self.writelines_calls = 0
+        self.bytes_written = 0
+        self._write_mode = WriteMode.LOW_LATENCY
+        # the last write stopped at the peer's bandwidth, see RTMPConnection.send_window
+        self._window_full = False
+        self._flush_handle: asyncio.Handle | None = None
+        self._pump: asyncio.Task | None = None
+        self._waiter: asyncio.Future | None = None
+        self._eof = False
         super().__init__()
+        self.write_mode = write_mode
+
+    @property
+    def write_mode(self) -> WriteMode:
+        return self._write_mode
+
+    @write_mode.setter
+    def write_mode(self, value: WriteMode) -> None:
+        self._write_mode = value
+        sock = None if self.writer is None else self.writer.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if value == WriteMode.LOW_LATENCY else 0)
+        if value == WriteMode.LOW_LATENCY:
+            self.flush()
+
+    @property
+    def backlog(self) -> int:
+        # bytes sent but not on the wire yet, queued in the connection or buffered by the transport
+        if self.writer is None:
+            return self.connection.outgoing_bytes
+        return self.connection.outgoing_bytes + self.writer.transport.get_write_buffer_size()
+
+    @property
+    def reading_paused(self) -> bool:
+        return self._paused_at is not None
+
+    @property
+    def reading_paused_time(self) -> float:
+        # seconds spent with reading paused for the sink, the current pause included
+        if self._paused_at is None:
+            return self._reading_paused_time
+        return self._reading_paused_time + time.monotonic() - self._paused_at
+
+    @property
+    def bytes_per_writelines(self) -> float:
+        return self.bytes_written / self.writelines_calls if self.writelines_calls else 0.0
+
+    @property
+    def reader_chunk_size(self) -> int:
+        return self.connection.reader_chunk_size
+
+    @reader_chunk_size.setter
+    def reader_chunk_size(self, value: int) -> None:
+        self.connection.reader_chunk_size = value
+
+    @property
+    def writer_chunk_size(self) -> int:
+        return self.connection.writer_chunk_size
+
+    @writer_chunk_size.setter
+    def writer_chunk_size(self, value: int) -> None:
+        self.connection.writer_chunk_size = value
+
+    @property
+    def message_types(self) -> frozenset[int] | None:
+        return self.connection.message_types
+
+    @message_types.setter
+    def message_types(self, value: frozenset[int] | None) -> None:
+        self.connection.message_types = value
 
     @property
     def total_read_bytes(self) -> int:
-        return self.fifo_reader.total_bytes
+        return self.connection.total_read_bytes
+
+    @property
+    def unacknowledged_bytes(self) -> int:
+        # sent but not acknowledged by the peer yet, see RTMPConnection.unacknowledged_bytes
+        return self.connection.unacknowledged_bytes
 
     @property
     def peername(self) -> str:
-        a, b = self.writer.get_extra_info("peername")
+        a, b = self.peer if self.writer is None else self.writer.get_extra_info("peername")
         return f"{a}:{b}"
 
-    def set_latest_chunk(self, chunk: RawChunk) -> None:
-        self.latest_chunks[str(chunk.chunk_id)] = chunk
-        self.latest_chunks["latest"] = chunk
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.connection.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        # bytes were written straight into the connection buffer (reader is None)
+        self._received(self.connection.buffer_updated(nbytes))
+
+    def receive_bytes(self, data: bytes) -> None:
+        # bytes the owner read from elsewhere (reader is None)
+        self._received(self.connection.receive_bytes(data))
+
+    def _received(self, chunks: list[Chunk]) -> None:
+        self.pending_chunks.extend(chunks)
+        self.pending_bytes += sum(len(chunk.payload) for chunk in chunks)
+        if self.pending_bytes > self.read_buffer_limit and not self._read_buffer_full:
+            self._read_buffer_full = True
+            self.read_buffer_pauses += 1
+            self._pause_transport()
+        self.flush()
+        self._wakeup()
+
+    def feed_eof(self) -> None:
+        self._eof = True
+        self._wakeup()
+
+    def _wakeup(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
 
-    def get_previous_chunk(self, chunk_id: int) -> RawChunk:
-        return self.latest_chunks[str(chunk_id)]
+    async def receive(self) -> None:
+        if self.reader is not None:
+            data = await self.reader.read(self.read_size)
+            if len(data) == 0:
+                raise StreamClosedException()
+            self.pending_chunks.extend(self.connection.receive_bytes(data))
+            self.flush()
+            return
+
+        if self._eof:
+            raise StreamClosedException()
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+
+    def pause_reading(self) -> None:
+        # the publisher's bytes stay in the kernel, TCP flow control pushes back on the encoder
+        if self._paused_at is not None:
+            return
+        self._paused_at = time.monotonic()
+        self.reading_pauses += 1
+        self._pause_transport()
+
+    def resume_reading(self) -> None:
+        if self._paused_at is None:
+            return
+        self._reading_paused_time += time.monotonic() - self._paused_at
+        self._paused_at = None
+        self._resume_transport()
+
+    def _pause_transport(self) -> None:
+        if self.writer is None:
+            return
+        transport = self.writer.transport
+        if isinstance(transport, asyncio.ReadTransport) and transport.is_reading():
+            transport.pause_reading()
+
+    def _resume_transport(self) -> None:
+        # only once neither the sink nor the pending messages hold reading back
+        if self._paused_at is not None or self._read_buffer_full or self.writer is None:
+            return
+        transport = self.writer.transport
+        if isinstance(transport, asyncio.ReadTransport) and not transport.is_closing():
+            transport.resume_reading()
+
+    async def wait_sink(self) -> None:
+        # called between messages, returns at once unless the sink is backed up
+        if self.sink is None or self.sink.write_buffer_size() <= self.sink_buffer_limit:
+            return
+        self.pause_reading()
+        try:
+            await self.sink.drain()
+        finally:
+            self.resume_reading()
 
     async def handshake(self) -> None:
-        # read c0c1
-        c0 = await C0.from_stream(self.fifo_reader)
-        c1 = await C1.from_stream(self.fifo_reader)
-        s0 = C0(protocol_version=c0.protocol_version)
-        s1 = C1(time=0, zero=0, random=random_byte_array(1528))
-        s2 = C2(time1=c1.time, time2=c1.time, random=c1.random)
-        s0s1s2 = BitStream()
-        s0s1s2.append(s0.to_bytes())
-        s0s1s2.append(s1.to_bytes())
-        s0s1s2.append(s2.to_bytes())
-        self.writer.write(s0s1s2.bytes)
-        await self.writer.drain()
-        await C2.from_stream(self.fifo_reader)
+        while not self.connection.handshake_done:
+            # clients usually send their first messages along with c2
+            await self.receive()
+        if self.writer is not None:
+            await self.writer.drain()
 
-    async def read_chunks_from_stream(self) -> Generator[Chunk]:
+    async def read_chunks_from_stream(self) -> AsyncGenerator[Chunk, None]:
         # stream contain many messages (full chunk)
-        chunks = {}
-
-        # process chunks
         while True:
-            raw_chunk = await self.read_raw_chunk()
-            if raw_chunk.chunk_id not in chunks:
-                chunks[raw_chunk.chunk_id] = {
-                    "payload_size": raw_chunk.msg_length,
-                    "total_read": 0,
-                    "children": [],
-                }
-
-            chunks[raw_chunk.chunk_id]["total_read"] += len(raw_chunk.payload)
-            chunks[raw_chunk.chunk_id]["children"].append(raw_chunk)
-
-            # check if chunk complete?
-            if chunks[raw_chunk.chunk_id]["total_read"] == chunks[raw_chunk.chunk_id]["payload_size"]:
-                children = chunks[raw_chunk.chunk_id]["children"]
-                del chunks[raw_chunk.chunk_id]
-
-                # de-multiplex message stream id
-                msg_stream = {}
-                for child in children:
-                    if child.msg_stream_id not in msg_stream:
-                        msg_stream[child.msg_stream_id] = []
-                    msg_stream[child.msg_stream_id].append(child)
-
-                for chunk_id in msg_stream:
-                    msg_chunks = msg_stream[chunk_id]
-                    payload = BitStream()
-                    for ch in msg_chunks:
-                        payload.append(ch.payload)
-                    yield Chunk(
-                        chunk_id=msg_chunks[0].chunk_id,
-                        chunk_type=msg_chunks[0].chunk_type,
-                        timestamp=msg_chunks[0].timestamp,
-                        msg_length=msg_chunks[0].msg_length,
-                        msg_type_id=msg_chunks[0].msg_type_id,
-                        msg_stream_id=msg_chunks[0].msg_stream_id,
-                        payload=payload.bytes,
-                    )
+            if not self.pending_chunks:
+                await self.receive()
+            chunks, self.pending_chunks = self.pending_chunks, []
+            for chunk in chunks:
+                yield chunk
+                if self.reader is None:
+                    self.pending_bytes -= len(chunk.payload)
+                    if self._read_buffer_full and self.pending_bytes <= self.read_buffer_limit:
+                        self._read_buffer_full = False
+                        self._resume_transport()
+
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._aggregate:
+            self._send_aggregate()
+        if self.writer is None:
+            # left queued for connection.data_to_send
+            return
+        self._write()
+        if self.connection.outgoing_bytes and self._pump is None and not self.writer.is_closing():
+            # the rest goes out as the transport drains
+            self._pump = asyncio.get_running_loop().create_task(self._pump_writes())
+
+    def _write(self) -> float:
+        # returns the seconds to wait before writing again when the shaper held bytes back
+        self._window_full = False
+        if not self.connection.outgoing_bytes:
+            return 0.0
+        max_bytes = None
+        if self.write_buffer_limit is not None:
+            room = self.write_buffer_limit - self.writer.transport.get_write_buffer_size()
+            if room < 0:
+                return 0.0
+            # cross the limit by up to a chunk so the transport pauses writing
+            max_bytes = room + 1
+        window = self.connection.send_window
+        if window is not None:
+            if window <= 0:
+                # the peer's bandwidth is used up, writing resumes from the flush following
+                # the next Acknowledgement read
+                self._window_full = True
+                return 0.0
+            max_bytes = window if max_bytes is None else min(max_bytes, window)
+        budgets = None
+        if self.shaper is not None:
+            allowance = self.shaper.allowance()
+            if allowance is not None:
+                if allowance <= 0:
+                    return self.shaper.delay(1)
+                # the last chunk may overdraw the buckets, the next write waits for it
+                max_bytes = allowance if max_bytes is None else min(max_bytes, allowance)
+            budgets = self.shaper.stream_budgets(self.connection.queued_stream_ids())
+        initial = None if budgets is None else dict(budgets)
+        buffers = self.connection.buffers_to_send(max_bytes, budgets)
+        nbytes = sum(len(data) for data in buffers)
+        if buffers:
+            self.writer.writelines(buffers)
+            self.writelines_calls += 1
+            self.bytes_written += nbytes
+        if self.shaper is None:
+            return 0.0
+        spent = None if budgets is None else {key: initial[key] - budgets[key] for key in budgets}
+        self.shaper.consume(nbytes, spent)
+        if nbytes or not self.connection.outgoing_bytes:
+            return 0.0
+        # everything queued is held back by the stream buckets
+        return self.shaper.delay(1, self.connection.queued_stream_ids())
 
-    async def read_raw_chunk(self) -> RawChunk:
-        stream = self.fifo_reader
-        chunk_size = self.reader_chunk_size
-
-        fmt = await stream.read("uint:2")
-        cs_id = await stream.read("uint:6")
-        if cs_id == 0:
-            cs_id = await stream.read("uint:8") + 64
-        elif cs_id == 1:
-            cs_id = await stream.read("uint:16") + 64
-        elif cs_id == 2:
+    async def _write_queued(self) -> None:
+        while self.connection.outgoing_bytes and not self.writer.is_closing():
+            await self.writer.drain()
+            wait = self._write()
+            if self._window_full:
+                break
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def _pump_writes(self) -> None:
+        try:
+            await self._write_queued()
+        except ConnectionError:
             pass
+        finally:
+            self._pump = None
+
+    def _send(self, chunk: Chunk) -> None:
+        if chunk.msg_type_id == 0x09 and chunk.msg_stream_id in self._awaiting_keyframe:
+            if _is_sequence_header(chunk):
+                # a new decoder configuration, still no frame to decode from
+                pass
+            elif not _is_keyframe(chunk):
+                # depends on frames that were dropped
+                self.dropped_video_messages += 1
+                self.dropped_bytes += len(chunk.payload)
+                return
+            else:
+                self._awaiting_keyframe.discard(chunk.msg_stream_id)
+        if self.aggregate_bytes is not None:
+            if self._aggregate and chunk.msg_stream_id != self._aggregate[0].msg_stream_id:
+                self._send_aggregate()
+            if chunk.msg_type_id in (0x08, 0x09) and len(chunk.payload) < self.aggregate_bytes:
+                self._aggregate.append(chunk)
+                # the sub-message header and back pointer
+                self._aggregate_size += len(chunk.payload) + 15
+                if self._aggregate_size >= self.aggregate_bytes:
+                    self._send_aggregate()
+                return
+            if self._aggregate:
+                self._send_aggregate()
+        self._queue(chunk)
+
+    def _send_aggregate(self) -> None:
+        messages, self._aggregate = self._aggregate, []
+        self._aggregate_size = 0
+        if len(messages) == 1:
+            self._queue(messages[0])
+            return
+        self.aggregated_messages += len(messages)
+        self._queue(AggregateMessage.from_messages(messages))
 
-        assert fmt is not None and cs_id is not None
-
-        if fmt == 0:
-            # 11 bytes
-            timestamp = await stream.read("uint:24")
-            if timestamp >= 0xFFFFFF:
-                timestamp = 0xFFFFFF
-            msg_length = await stream.read("uint:24")
-            msg_type_id = await stream.read("uint:8")
-            msg_stream_id = await stream.read("uintle:32")
-            sequence = 0
-        elif fmt == 1:
-            # 7 bytes
-            previous_chunk = self.get_previous_chunk(cs_id)
-            assert previous_chunk is not None
-            delta = await stream.read("uint:24")
-            msg_length = await stream.read("uint:24")
-            msg_type_id = await stream.read("uint:8")
-            msg_stream_id = previous_chunk.msg_stream_id
-            timestamp = previous_chunk.timestamp + delta
-            sequence = 0 if previous_chunk.is_eof else previous_chunk.raw_chunk_number + 1
-        elif fmt == 2:
-            # 3 bytes
-            previous_chunk = self.get_previous_chunk(cs_id)
-            assert previous_chunk is not None
-            delta = await stream.read("uint:24")
-            timestamp = previous_chunk.timestamp + delta
-            msg_length = previous_chunk.msg_length
-            msg_type_id = previous_chunk.msg_type_id
-            msg_stream_id = previous_chunk.msg_stream_id
-            sequence = 0 if previous_chunk.is_eof else previous_chunk.raw_chunk_number + 1
-        elif fmt == 3:
-            # 0 bytes
-            # use within same chunk_id
-            previous_chunk = self.get_previous_chunk(cs_id)
-            assert previous_chunk is not None
-            timestamp = previous_chunk.timestamp
-            msg_length = previous_chunk.msg_length
-            msg_type_id = previous_chunk.msg_type_id
-            msg_stream_id = previous_chunk.msg_stream_id
-            sequence = 0 if previous_chunk.is_eof else previous_chunk.raw_chunk_number + 1
-        else:
-            raise NotImplementedError
-
-        if timestamp == 0xFFFFFF:
-            timestamp = await stream.read("uint:32")
-
-        # determine payload size
-        total_read = chunk_size * sequence
-        bytes_length = min(chunk_size, msg_length - total_read)
-        is_eof = (msg_length - total_read - bytes_length) == 0
-        payload = await stream.read(f"bytes:{bytes_length}")
-        instance = RawChunk(
-            chunk_type=fmt,
-            chunk_id=cs_id,
-            timestamp=timestamp,
-            msg_length=msg_length,
-            msg_type_id=msg_type_id,
-            msg_stream_id=msg_stream_id,
-            payload=payload,
-            raw_chunk_number=sequence,
-            is_eof=is_eof,
-        )
-
-        # update latest chunk
-        self.set_latest_chunk(instance)
-
-        # return
-        return instance
+    def _queue(self, chunk: Chunk) -> None:
+        if self.chunk_size_policy is not None and chunk.msg_type_id != 0x01:
+            chunk_size = self.chunk_size_policy.select(self, chunk)
+            if chunk_size != self.connection.writer_chunk_size:
+                # applied by the connection to the messages sent after it
+                self.connection.send_message(SetChunkSize(chunk_size=chunk_size))
+        self.connection.send_message(chunk)
+        if self.high_water is not None and self.backlog > self.high_water:
+            self._shed()
+
+    def _shed(self) -> None:
+        # inter frames first, then audio, then whole GOPs (keyframes included). Control, command and
+        # data messages are never dropped. Video of a stream is held back until its next keyframe
+        # once any of its frames was dropped, the frames after it could not be decoded. Aggregates
+        # go with the whole GOPs, their sub-messages are counted as video. Sequence headers (and
+        # aggregates carrying one) are never dropped.
+        low_water = self.high_water // 2 if self.low_water is None else self.low_water
+        for select in (_is_inter_frame, _is_audio, _is_video):
+            for message in self.connection.discard_queued(select):
+                self.dropped_bytes += message.msg_length
+                if message.chunk.msg_type_id == 0x08:
+                    self.dropped_audio_messages += 1
+                else:
+                    self.dropped_video_messages += (
+                        len(message.chunk.messages) if message.chunk.msg_type_id == 0x16 else 1
+                    )
+                    self._awaiting_keyframe.add(message.msg_stream_id)
+            if self.backlog <= low_water:
+                break
 
     def write_chunk_to_stream(self, chunk: Chunk) -> None:
-        chunks = chunk.to_raw_chunks(self.writer_chunk_size, self.previous_chunk_for_writing)
+        self._send(chunk)
+        if self._write_mode == WriteMode.LOW_LATENCY or self.connection.outgoing_bytes >= self.flush_bytes:
+            self.flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            if self.flush_interval > 0:
+                self._flush_handle = loop.call_later(self.flush_interval, self.flush)
+            else:
+                self._flush_handle = loop.call_soon(self.flush)
+
+    def write_chunks_to_stream(self, chunks: Iterable[Chunk]) -> None:
+        # queued together and flushed once, whatever the write mode
         for chunk in chunks:
-            self.writer.write(chunk.to_bytes())
-            self.previous_chunk_for_writing = chunk
+            self._send(chunk)
+        self.flush()
 
     async def drain(self) -> None:
-        self.previous_chunk_for_writing = None
+        self.flush()
+        if self.writer is None:
+            return
+        await self._write_queued()
         await self.writer.drain()
+
+
+def _is_keyframe(chunk: Chunk) -> bool:
+    # relayed messages keep the frame type they were decoded with
+    return chunk.is_keyframe if isinstance(chunk, VideoMessage) else is_keyframe(chunk.payload)
+
+
+def _is_sequence_header(chunk: Chunk) -> bool:
+    # never dropped, the stream cannot be decoded without it
+    if isinstance(chunk, (VideoMessage, AudioMessage)):
+        return chunk.is_sequence_header
+    if chunk.msg_type_id == 0x09:
+        return is_video_sequence_header(chunk.payload)
+    if chunk.msg_type_id == 0x08:
+        return is_audio_sequence_header(chunk.payload)
+    if chunk.msg_type_id == 0x16:
+        return any(_is_sequence_header(message) for message in chunk.messages)
+    return False
+
+
+def _is_video(message: OutgoingMessage) -> bool:
+    return message.chunk.msg_type_id in (0x09, 0x16) and not _is_sequence_header(message.chunk)
+
+
+def _is_inter_frame(message: OutgoingMessage) -> bool:
+    chunk = message.chunk
+    return chunk.msg_type_id == 0x09 and not _is_keyframe(chunk) and not _is_sequence_header(chunk)
+
+
+def _is_audio(message: OutgoingMessage) -> bool:
+    return message.chunk.msg_type_id == 0x08 and not _is_sequence_header(message.chunk)
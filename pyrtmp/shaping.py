@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Callable, Iterable
+
+
+class TokenBucket:
+    """
+    `rate` bytes per second with bursts of up to `burst` bytes. Consuming more than is available
+    is allowed, the bucket goes negative and refills from there.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+        super().__init__()
+
+    def available(self) -> float:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def consume(self, nbytes: int) -> None:
+        self.available()
+        self.tokens -= nbytes
+
+    def delay(self, nbytes: float = 1) -> float:
+        # seconds until nbytes are available
+        missing = nbytes - self.available()
+        return missing / self.rate if missing > 0 else 0.0
+
+
+class EgressShaper:
+    """
+    Token buckets applied to a session's outgoing bytes: one for the session, one per message
+    stream (media only, control and command messages are not held back by it) and a global one
+    shared by every session it is passed to. Any of them may be None.
+    The peer's SetPeerBandwidth window is not a rate, it caps the unacknowledged bytes and is
+    applied by the connection, see RTMPConnection.peer_bandwidth.
+    """
+
+    def __init__(
+        self,
+        session_rate: float | None = None,
+        stream_rate: float | None = None,
+        global_bucket: TokenBucket | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.clock = clock
+        self.session = None if session_rate is None else TokenBucket(session_rate, clock=clock)
+        self.stream_rate = stream_rate
+        self.streams: dict[int, TokenBucket] = {}
+        self.global_bucket = global_bucket
+        super().__init__()
+
+    def allowance(self) -> float | None:
+        # bytes the session and global buckets let through now, None if neither applies
+        buckets = [bucket for bucket in (self.session, self.global_bucket) if bucket is not None]
+        if not buckets:
+            return None
+        return min(bucket.available() for bucket in buckets)
+
+    def stream_budgets(self, msg_stream_ids: list[int]) -> dict[int, float] | None:
+        if self.stream_rate is None:
+            return None
+        budgets = {}
+        for msg_stream_id in msg_stream_ids:
+            bucket = self.streams.get(msg_stream_id)
+            if bucket is None:
+                bucket = self.streams[msg_stream_id] = TokenBucket(self.stream_rate, clock=self.clock)
+            budgets[msg_stream_id] = bucket.available()
+        return budgets
+
+    def consume(self, nbytes: int, stream_bytes: dict[int, float] | None = None) -> None:
+        for bucket in (self.session, self.global_bucket):
+            if bucket is not None:
+                bucket.consume(nbytes)
+        for msg_stream_id, spent in (stream_bytes or {}).items():
+            self.streams[msg_stream_id].consume(spent)
+
+    def delay(self, nbytes: int, msg_stream_ids: Iterable[int] = ()) -> float:
+        # seconds until nbytes can go out, on at least one of the given message streams
+        wait = max(
+            (bucket.delay(nbytes) for bucket in (self.session, self.global_bucket) if bucket is not None),
+            default=0.0,
+        )
+        streams = [self.streams[msg_stream_id] for msg_stream_id in msg_stream_ids if msg_stream_id in self.streams]
+        if streams:
+            wait = max(wait, min(bucket.delay(nbytes) for bucket in streams))
+        return wait
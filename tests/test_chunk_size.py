@@ -0,0 +1,56 @@
+import types
+import unittest
+
+from pyrtmp.chunk_size import AdaptiveChunkSizePolicy, FixedChunkSizePolicy
+from pyrtmp.messages import Chunk
+
+
+def media(msg_type_id: int, size: int) -> Chunk:
+    return Chunk(
+        chunk_type=0,
+        chunk_id=4 if msg_type_id == 0x08 else 6,
+        timestamp=0,
+        msg_length=size,
+        msg_type_id=msg_type_id,
+        msg_stream_id=1,
+        payload=bytes(size),
+    )
+
+
+class TestChunkSizePolicy(unittest.TestCase):
+    def test_fixed(self):
+        # given
+        policy = FixedChunkSizePolicy(chunk_size=1024)
+
+        # when
+        chunk_size = policy.select(types.SimpleNamespace(backlog=0), media(0x09, 50000))
+
+        # then
+        self.assertEqual(chunk_size, 1024)
+
+    def test_adaptive_follows_message_size(self):
+        # given
+        policy = AdaptiveChunkSizePolicy(initial_chunk_size=4096, window=4)
+        session = types.SimpleNamespace(backlog=0)
+
+        # when
+        sizes = [policy.select(session, media(0x09, 30000)) for _ in range(4)]
+        sizes += [policy.select(session, media(0x08, 300)) for _ in range(3)]
+        sizes += [policy.select(session, media(0x08, 300)) for _ in range(4)]
+
+        # then
+        self.assertEqual(sizes[:3], [4096] * 3)
+        self.assertEqual(sizes[3:7], [32768] * 4)
+        self.assertEqual(sizes[-1], 512)
+
+    def test_adaptive_interleaving(self):
+        # given
+        policy = AdaptiveChunkSizePolicy(window=4, interleave_chunk_size=2048, congested_bytes=1000)
+        session = types.SimpleNamespace(backlog=5000)
+
+        # when
+        for msg_type_id, size in ((0x09, 60000), (0x08, 300), (0x09, 60000), (0x08, 300)):
+            chunk_size = policy.select(session, media(msg_type_id, size))
+
+        # then
+        self.assertEqual(chunk_size, 2048)
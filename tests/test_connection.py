@@ -0,0 +1,714 @@
+import asyncio
+import os
+import unittest
+
+from bitstring import BitStream
+
+from pyrtmp.amf.serializers import AMF0Serializer
+from pyrtmp.connection import HandshakeState, RTMPConnection
+from pyrtmp.messages import Chunk
+from pyrtmp.messages.aggregate import AggregateMessage
+from pyrtmp.messages.handshake import C0, C1, C2
+from pyrtmp.messages.protocol_control import (
+    AbortMessage,
+    Acknowledgement,
+    LimitType,
+    SetChunkSize,
+    SetPeerBandwidth,
+    WindowAcknowledgementSize,
+)
+from pyrtmp.messages.user_control import StreamBegin
+from pyrtmp.rtmp import RTMPBufferedProtocol, SimpleRTMPServer
+
+
+def client_handshake() -> tuple[bytes, bytes]:
+    c1 = C1(time=1234, zero=0, random=os.urandom(1528))
+    c2 = C2(time1=0, time2=0, random=os.urandom(1528))
+    return C0(protocol_version=3).to_bytes() + c1.to_bytes(), c2.to_bytes()
+
+
+def client_message(chunk: Chunk, chunk_size: int = 128) -> bytes:
+    return bytes(RTMPConnection(writer_chunk_size=chunk_size).encode_message(chunk))
+
+
+class TestRTMPConnection(unittest.TestCase):
+    def test_handshake(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+
+        # when
+        messages = connection.receive_bytes(c0c1)
+        s0s1s2 = connection.data_to_send()
+        connection.receive_bytes(c2)
+
+        # then
+        self.assertEqual(messages, [])
+        self.assertEqual(len(s0s1s2), 1 + 1536 + 1536)
+        self.assertEqual(s0s1s2[0], 3)
+        self.assertEqual(s0s1s2[1 + 1536 + 8 :], c0c1[1 + 8 :])
+        self.assertEqual(connection.handshake_state, HandshakeState.DONE)
+        self.assertEqual(connection.data_to_send(), b"")
+
+    def test_receive_byte_by_byte(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        payload = os.urandom(1000)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=40,
+            msg_length=len(payload),
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=payload,
+        )
+        data = c0c1 + c2 + client_message(video)
+
+        # when
+        messages = []
+        for i in range(len(data)):
+            messages += connection.receive_bytes(data[i : i + 1])
+
+        # then
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].chunk_id, 6)
+        self.assertEqual(messages[0].timestamp, 40)
+        self.assertEqual(messages[0].msg_type_id, 0x09)
+        self.assertEqual(messages[0].msg_stream_id, 1)
+        self.assertEqual(bytes(messages[0].payload), payload)
+        self.assertEqual(connection.total_read_bytes, len(data))
+
+    def test_set_chunk_size_applies_to_following_chunks(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        payload = os.urandom(5000)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=len(payload),
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=payload,
+        )
+        data = c0c1 + c2 + client_message(SetChunkSize(4096)) + client_message(video, 4096)
+
+        # when
+        messages = connection.receive_bytes(data)
+
+        # then
+        self.assertEqual(connection.reader_chunk_size, 4096)
+        self.assertEqual([message.msg_type_id for message in messages], [0x01, 0x09])
+        self.assertEqual(bytes(messages[1].payload), payload)
+
+    def test_header_compression(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+        data = (
+            # type 0: timestamp 1000, length 2, audio, stream 1
+            b"\x04\x00\x03\xe8\x00\x00\x02\x08\x01\x00\x00\x00ab"
+            # type 2: delta 20
+            b"\x84\x00\x00\x14cd"
+            # type 3 starting a new message: same delta again
+            b"\xc4ef"
+            # type 1: delta 0x1000000 through the extended timestamp, length 200, video
+            b"\x44\xff\xff\xff\x00\x00\xc8\x09\x01\x00\x00\x00"
+            + b"x" * 128
+            # type 3 continuation repeats the extended timestamp
+            + b"\xc4\x01\x00\x00\x00"
+            + b"y" * 72
+        )
+
+        # when
+        messages = connection.receive_bytes(data)
+
+        # then
+        self.assertEqual([message.timestamp for message in messages], [1000, 1020, 1040, 1040 + 0x1000000])
+        self.assertEqual([bytes(message.payload) for message in messages[:3]], [b"ab", b"cd", b"ef"])
+        self.assertEqual(bytes(messages[3].payload), b"x" * 128 + b"y" * 72)
+        self.assertEqual(messages[3].msg_type_id, 0x09)
+        self.assertEqual(messages[3].msg_stream_id, 1)
+
+    def test_abort_drops_partial_message(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=300,
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=b"v" * 300,
+        )
+        partial = client_message(video)[: 12 + 128]
+        data = partial + client_message(AbortMessage(chunk_stream_id=6)) + client_message(video)
+
+        # when
+        messages = connection.receive_bytes(data)
+
+        # then
+        self.assertEqual([message.msg_type_id for message in messages], [0x02, 0x09])
+        self.assertEqual(connection.reassembly_bytes, 0)
+        self.assertIsInstance(messages[1].payload, bytearray)
+        self.assertEqual(messages[1].payload, b"v" * 300)
+
+    def test_reassembly_limits(self):
+        # given
+        connection = RTMPConnection(max_chunk_streams=2, max_reassembly_bytes=1000)
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+
+        def video(chunk_id: int, size: int) -> Chunk:
+            return Chunk(
+                chunk_type=0,
+                chunk_id=chunk_id,
+                timestamp=0,
+                msg_length=size,
+                msg_type_id=0x09,
+                msg_stream_id=1,
+                payload=b"v" * size,
+            )
+
+        # when
+        partial = connection.receive_bytes(client_message(video(65599, 600))[: 3 + 11 + 128])
+        in_flight = connection.reassembly_bytes
+        messages = connection.receive_bytes(client_message(video(6, 400)))
+
+        # then
+        self.assertEqual(partial, [])
+        self.assertEqual(in_flight, 600)
+        self.assertEqual(len(connection.chunk_streams), 64)
+        self.assertEqual(list(connection.extended_chunk_streams), [65599])
+        stream = connection.extended_chunk_streams[65599]
+        self.assertEqual((len(stream.payload), stream.bytes_read), (600, 128))
+        self.assertEqual(messages[0].payload, b"v" * 400)
+        self.assertEqual(connection.reassembly_bytes, 600)
+        with self.assertRaises(ValueError):
+            # rejected with its first chunk, before the rest arrived
+            connection.receive_bytes(client_message(video(6, 500))[: 12 + 128])
+        single = RTMPConnection(max_chunk_streams=1)
+        single.handshake_state = HandshakeState.DONE
+        with self.assertRaises(ValueError):
+            single.receive_bytes(client_message(video(6, 10)) + client_message(video(7, 10)))
+
+    def test_message_types_skip_other_messages(self):
+        # given
+        connection = RTMPConnection()
+        connection.message_types = frozenset({0x09})
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+        audio = Chunk(
+            chunk_type=0,
+            chunk_id=4,
+            timestamp=0,
+            msg_length=300,
+            msg_type_id=0x08,
+            msg_stream_id=1,
+            payload=b"a" * 300,
+        )
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=3000,
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=b"v" * 3000,
+        )
+        data = client_message(audio) + client_message(SetChunkSize(4096)) + client_message(video, 4096)
+
+        # when
+        messages = connection.receive_bytes(data)
+
+        # then
+        self.assertEqual([message.msg_type_id for message in messages], [0x01, 0x09])
+        self.assertEqual(connection.reader_chunk_size, 4096)
+        self.assertEqual(connection.skipped_messages, 1)
+        self.assertIsNone(connection.chunk_streams[4].payload)
+        self.assertEqual(messages[1].payload, b"v" * 3000)
+
+    def test_message_types_keep_aggregates(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=100,
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=b"v" * 100,
+        )
+
+        # when
+        connection.message_types = frozenset({0x09})
+        media = connection.message_types
+        messages = connection.receive_bytes(client_message(AggregateMessage.from_messages([video, video])))
+        connection.message_types = frozenset({0x14})
+
+        # then
+        self.assertIn(0x16, media)
+        self.assertEqual([message.msg_type_id for message in messages], [0x16])
+        self.assertNotIn(0x16, connection.message_types)
+
+    def test_discard_queued(self):
+        # given
+        writer = RTMPConnection()
+        reader = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        reader.receive_bytes(c0c1 + c2)
+
+        def video(timestamp: int, frame_type: int) -> Chunk:
+            return Chunk(
+                chunk_type=0,
+                chunk_id=6,
+                timestamp=timestamp,
+                msg_length=300,
+                msg_type_id=0x09,
+                msg_stream_id=1,
+                payload=bytes([frame_type << 4 | 7]) + os.urandom(299),
+            )
+
+        frames = [video(0, 1), video(33, 2), video(66, 2), video(99, 1), video(132, 2)]
+
+        # when
+        for frame in frames[:4]:
+            writer.send_message(frame)
+        first = writer.buffers_to_send(100)
+        dropped = writer.discard_queued(lambda message: message.chunk.payload[0] >> 4 == 2)
+        writer.send_message(frames[4])
+        messages = reader.receive_bytes(b"".join(first + writer.buffers_to_send()))
+
+        # then
+        self.assertEqual([message.chunk for message in dropped], frames[1:3])
+        self.assertEqual(writer.outgoing_bytes, 0)
+        self.assertEqual([message.timestamp for message in messages], [0, 99, 132])
+        self.assertEqual(
+            [message.payload for message in messages], [frames[0].payload, *(f.payload for f in frames[3:])]
+        )
+
+    def test_acknowledgement_window(self):
+        # given
+        connection = RTMPConnection()
+        connection.message_types = frozenset({0x14})
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+        connection.data_to_send()
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=1000,
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=os.urandom(1000),
+        )
+        reader = RTMPConnection()
+        reader.handshake_state = HandshakeState.DONE
+
+        # when
+        messages = connection.receive_bytes(client_message(WindowAcknowledgementSize(5000)))
+        first = connection.data_to_send()
+        connection.receive_bytes(client_message(video))
+        connection.receive_bytes(client_message(video))
+        second = reader.receive_bytes(connection.data_to_send())
+        connection.receive_bytes(client_message(video))
+        third = connection.data_to_send()
+
+        # then
+        self.assertEqual([message.msg_type_id for message in messages], [0x05])
+        self.assertEqual(connection.peer_ack_window_size, 5000)
+        # the handshake counts as well: 3073 + 16 bytes, then 1019 per video message
+        self.assertEqual(first, b"")
+        self.assertEqual([message.msg_type_id for message in second], [0x03])
+        self.assertEqual(Acknowledgement.from_chunk(second[0]).seq_number, 3073 + 16 + 2 * 1019)
+        self.assertEqual(third, b"")
+        self.assertEqual(connection.acknowledgements_sent, 1)
+
+    def test_unacknowledged_bytes(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+        connection.send_message(WindowAcknowledgementSize(2500000))
+
+        # when
+        sent = len(connection.data_to_send())
+        before = connection.unacknowledged_bytes
+        connection.receive_bytes(client_message(Acknowledgement(seq_number=3000)))
+        after = connection.unacknowledged_bytes
+
+        # then
+        self.assertEqual(connection.ack_window_size, 2500000)
+        self.assertEqual(before, sent)
+        self.assertEqual(connection.acknowledged_bytes, 3000)
+        self.assertEqual(after, sent - 3000)
+
+    def test_peer_bandwidth(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+        handshake = connection.data_to_send()
+
+        # when
+        unlimited = connection.send_window
+        connection.send_message(WindowAcknowledgementSize(1000))
+        messages = connection.receive_bytes(client_message(SetPeerBandwidth(8000, LimitType.SOFT)))
+        received = connection.peer_bandwidth
+        connection.apply_peer_bandwidth(9000, LimitType.SOFT)
+        soft_larger = connection.peer_bandwidth
+        connection.apply_peer_bandwidth(9000, LimitType.DYNAMIC)
+        dynamic_after_soft = connection.peer_bandwidth
+        connection.apply_peer_bandwidth(2000, LimitType.HARD)
+        connection.apply_peer_bandwidth(3000, LimitType.DYNAMIC)
+        dynamic_after_hard = connection.peer_bandwidth
+        connection.receive_bytes(client_message(SetPeerBandwidth(500, 7)))
+        data = connection.data_to_send()
+        reader = RTMPConnection()
+        reader.handshake_state = HandshakeState.DONE
+        advertised = [
+            WindowAcknowledgementSize.from_chunk(chunk).ack_window_size for chunk in reader.receive_bytes(data)
+        ]
+
+        # then
+        self.assertIsNone(unlimited)
+        self.assertEqual([message.msg_type_id for message in messages], [0x06])
+        self.assertEqual(received, 8000)
+        self.assertEqual(soft_larger, 8000)
+        self.assertEqual(dynamic_after_soft, 8000)
+        self.assertEqual(dynamic_after_hard, 3000)
+        # unknown limit type ignored
+        self.assertEqual(connection.peer_bandwidth, 3000)
+        self.assertEqual(connection.peer_limit_type, LimitType.HARD)
+        # the initial window, then every change of the peer bandwidth
+        self.assertEqual(advertised, [1000, 8000, 2000, 3000])
+        self.assertEqual(connection.ack_window_size, 3000)
+        self.assertEqual(connection.send_window, 3000 - len(handshake) - len(data))
+
+    def test_encode_message(self):
+        # given
+        connection = RTMPConnection(writer_chunk_size=128)
+        payload = os.urandom(300)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0x1000000,
+            msg_length=len(payload),
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=payload,
+        )
+
+        # when
+        connection.send_message(video)
+        data = connection.data_to_send()
+
+        # then
+        extended = b"\x01\x00\x00\x00"
+        self.assertEqual(
+            data,
+            b"\x06\xff\xff\xff\x00\x01\x2c\x09\x01\x00\x00\x00"
+            + extended
+            + payload[:128]
+            + b"\xc6"
+            + extended
+            + payload[128:256]
+            + b"\xc6"
+            + extended
+            + payload[256:],
+        )
+
+    def test_encode_message_round_trip(self):
+        # given
+        connection = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        connection.receive_bytes(c0c1 + c2)
+        payload = os.urandom(5000)
+        messages = [
+            Chunk(
+                chunk_type=0,
+                chunk_id=chunk_id,
+                timestamp=timestamp,
+                msg_length=len(payload),
+                msg_type_id=0x09,
+                msg_stream_id=1,
+                payload=payload,
+            )
+            for chunk_id, timestamp in ((6, 0), (100, 40), (1000, 0xFFFFFF + 80))
+        ]
+
+        # when
+        received = connection.receive_bytes(b"".join(client_message(message) for message in messages))
+
+        # then
+        self.assertEqual([message.chunk_id for message in received], [6, 100, 1000])
+        self.assertEqual([message.timestamp for message in received], [0, 40, 0xFFFFFF + 80])
+        self.assertTrue(all(message.payload == payload for message in received))
+
+    def test_encode_message_header_compression(self):
+        # given
+        writer = RTMPConnection()
+        reader = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        reader.receive_bytes(c0c1 + c2)
+        frames = [
+            # timestamp, payload
+            (1000, b"a" * 10),
+            (1023, b"b" * 10),
+            (1046, b"c" * 10),
+            (1069, b"d" * 12),
+            (1092, b"e" * 12),
+            (500, b"f" * 12),
+        ]
+
+        # when
+        encoded = []
+        for timestamp, payload in frames:
+            audio = Chunk(
+                chunk_type=0,
+                chunk_id=4,
+                timestamp=timestamp,
+                msg_length=len(payload),
+                msg_type_id=0x08,
+                msg_stream_id=1,
+                payload=payload,
+            )
+            encoded.append(bytes(writer.encode_message(audio)))
+        messages = reader.receive_bytes(b"".join(encoded))
+
+        # then
+        self.assertEqual([data[0] >> 6 for data in encoded], [0, 2, 3, 1, 3, 0])
+        self.assertEqual(
+            [len(data) - len(payload) for data, (_, payload) in zip(encoded, frames)], [12, 4, 1, 8, 1, 12]
+        )
+        self.assertEqual([message.timestamp for message in messages], [timestamp for timestamp, _ in frames])
+        self.assertEqual([bytes(message.payload) for message in messages], [payload for _, payload in frames])
+
+    def test_encode_message_extended_delta(self):
+        # given
+        writer = RTMPConnection()
+        reader = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        reader.receive_bytes(c0c1 + c2)
+        payload = os.urandom(300)
+        video = [
+            Chunk(
+                chunk_type=0,
+                chunk_id=6,
+                timestamp=timestamp,
+                msg_length=len(payload),
+                msg_type_id=0x09,
+                msg_stream_id=1,
+                payload=payload,
+            )
+            for timestamp in (0, 0x1000000, 0x2000000, 0x2000040)
+        ]
+
+        # when
+        messages = reader.receive_bytes(b"".join(writer.encode_message(message) for message in video))
+
+        # then
+        self.assertEqual([message.timestamp for message in messages], [0, 0x1000000, 0x2000000, 0x2000040])
+        self.assertTrue(all(message.payload == payload for message in messages))
+
+    def test_send_set_chunk_size(self):
+        # given
+        connection = RTMPConnection()
+
+        # when
+        connection.send_message(SetChunkSize(4096))
+
+        # then
+        self.assertEqual(connection.writer_chunk_size, 4096)
+
+    def test_set_chunk_size_does_not_overtake(self):
+        # given
+        writer = RTMPConnection()
+        reader = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        reader.receive_bytes(c0c1 + c2)
+        payload = os.urandom(1000)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=len(payload),
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=payload,
+        )
+
+        # when
+        writer.send_message(video)
+        writer.send_message(SetChunkSize(256))
+        writer.send_message(video)
+        messages = reader.receive_bytes(writer.data_to_send())
+
+        # then
+        self.assertEqual([message.msg_type_id for message in messages], [0x09, 0x01, 0x09])
+        self.assertTrue(all(message.payload == payload for message in messages[::2]))
+
+    def test_buffers_to_send_priority(self):
+        # given
+        writer = RTMPConnection()
+        reader = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        reader.receive_bytes(c0c1 + c2)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=3000,
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=os.urandom(3000),
+        )
+        audio = Chunk(
+            chunk_type=0,
+            chunk_id=4,
+            timestamp=0,
+            msg_length=200,
+            msg_type_id=0x08,
+            msg_stream_id=1,
+            payload=os.urandom(200),
+        )
+
+        # when
+        writer.send_message(video)
+        first = writer.buffers_to_send(300)
+        writer.send_message(audio)
+        writer.send_message(AbortMessage(chunk_stream_id=8))
+        rest = writer.buffers_to_send()
+        messages = reader.receive_bytes(b"".join(first + rest))
+
+        # then
+        self.assertEqual(sum(len(data) for data in first), 12 + 128 + 1 + 128 + 1 + 128)
+        self.assertEqual(writer.outgoing_bytes, 0)
+        self.assertEqual([message.msg_type_id for message in messages], [0x02, 0x08, 0x09])
+        self.assertEqual(messages[1].payload, audio.payload)
+        self.assertEqual(messages[2].payload, video.payload)
+
+    def test_buffers_to_send_keeps_commands_in_order(self):
+        # given
+        writer = RTMPConnection()
+        reader = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        reader.receive_bytes(c0c1 + c2)
+
+        def command(name: str, transaction_id: int) -> Chunk:
+            payload = bytearray()
+            for value in (name, transaction_id, None):
+                AMF0Serializer.create_object(payload, value)
+            return Chunk(
+                chunk_type=0,
+                chunk_id=3,
+                timestamp=0,
+                msg_length=len(payload),
+                msg_type_id=0x14,
+                msg_stream_id=0,
+                payload=payload,
+            )
+
+        audio = Chunk(
+            chunk_type=0,
+            chunk_id=4,
+            timestamp=0,
+            msg_length=200,
+            msg_type_id=0x08,
+            msg_stream_id=1,
+            payload=os.urandom(200),
+        )
+
+        # when
+        writer.send_message(audio)
+        writer.send_message(command("_result", 1))
+        writer.send_message(StreamBegin(stream_id=0))
+        writer.send_message(command("_result", 2))
+        writer.send_message(StreamBegin(stream_id=1))
+        messages = reader.receive_bytes(writer.data_to_send())
+
+        # then
+        self.assertEqual([message.msg_type_id for message in messages], [0x14, 0x04, 0x14, 0x04, 0x08])
+        self.assertEqual([message.payload[-1] for message in messages[:4]], [0x05, 0x00, 0x05, 0x01])
+
+    def test_buffers_to_send_stream_budgets(self):
+        # given
+        writer = RTMPConnection()
+        reader = RTMPConnection()
+        c0c1, c2 = client_handshake()
+        reader.receive_bytes(c0c1 + c2)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=1000,
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=os.urandom(1000),
+        )
+        budgets = {1: 200}
+
+        # when
+        writer.send_message(video)
+        writer.send_message(AbortMessage(chunk_stream_id=8))
+        first = writer.buffers_to_send(stream_budgets=budgets)
+        second = writer.buffers_to_send(stream_budgets=budgets)
+        rest = writer.buffers_to_send()
+        messages = reader.receive_bytes(b"".join(first + second + rest))
+
+        # then
+        # control messages are not held back, media up to the budget in whole chunks
+        self.assertEqual(sum(len(data) for data in first), 16 + 12 + 128 + 1 + 128)
+        self.assertEqual(budgets[1], 200 - (12 + 128 + 1 + 128))
+        self.assertEqual(second, [])
+        self.assertEqual([message.msg_type_id for message in messages], [0x02, 0x09])
+        self.assertEqual(messages[1].payload, video.payload)
+
+
+class TestRTMPBufferedProtocol(unittest.IsolatedAsyncioTestCase):
+    async def test_connect(self):
+        # given
+        server = SimpleRTMPServer()
+        await server.create(host="127.0.0.1", port=0, protocol_class=RTMPBufferedProtocol)
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        c0c1, c2 = client_handshake()
+        data = BitStream()
+        AMF0Serializer.create_object(data, "connect")
+        AMF0Serializer.create_object(data, 1)
+        AMF0Serializer.create_object(data, {"app": "live"})
+        connect = Chunk(
+            chunk_type=0,
+            chunk_id=3,
+            timestamp=0,
+            msg_length=len(data.bytes),
+            msg_type_id=0x14,
+            msg_stream_id=0,
+            payload=data.bytes,
+        )
+
+        # when
+        writer.write(c0c1)
+        s0s1s2 = await reader.readexactly(1 + 1536 + 1536)
+        writer.write(c2 + client_message(connect))
+        response = b""
+        while b"NetConnection.Connect.Success" not in response:
+            response += await asyncio.wait_for(reader.read(4096), timeout=5)
+        writer.close()
+        await server.stop()
+
+        # then
+        self.assertEqual(s0s1s2[0], 3)
+        self.assertIn(b"_result", response)
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+
+from pyrtmp.flv import AsyncFLVFileWriter, FLVFileWriter, FLVMediaType, FLVWriter, write_buffers
+
+
+class TestFLVWriter(unittest.TestCase):
+    def test_write_tag(self):
+        # given
+        writer = FLVWriter()
+        payload = memoryview(b"\x17\x01frame")
+
+        # when
+        header = writer.write_header()
+        header_tag, data, tag_size = writer.write_tag(0x12345678, payload, FLVMediaType.VIDEO)
+
+        # then
+        self.assertEqual(header, b"FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00")
+        self.assertEqual(header_tag, b"\x09\x00\x00\x07\x34\x56\x78\x12\x00\x00\x00")
+        self.assertIs(data, payload)
+        self.assertEqual(tag_size, b"\x00\x00\x00\x12")
+        self.assertEqual(writer.write(0, b"\xaf\x01", FLVMediaType.AUDIO)[-4:], b"\x00\x00\x00\x0d")
+
+    def test_write_buffers(self):
+        # given, more buffers than a single os.writev call takes
+        buffers = [os.urandom(size % 7 + 1) for size in range(5000)]
+
+        # when
+        with tempfile.TemporaryFile(buffering=0) as file:
+            write_buffers(file, buffers)
+            file.seek(0)
+            data = file.read()
+
+        # then
+        self.assertEqual(data, b"".join(buffers))
+
+
+class TestFLVFileWriter(unittest.TestCase):
+    def test_write(self):
+        # given
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "stream.flv")
+            writer = FLVFileWriter(output=path)
+
+            # when
+            writer.write(0, b"\x17\x00\x00\x00\x00", FLVMediaType.VIDEO)
+            writer.write(20, b"\xaf\x01aac", FLVMediaType.AUDIO)
+            writer.close()
+            with open(path, "rb") as file:
+                data = file.read()
+
+        # then
+        self.assertEqual(len(data), 13 + 15 + 5 + 15 + 5)
+        self.assertEqual(data[13:24], b"\x09\x00\x00\x05\x00\x00\x00\x00\x00\x00\x00")
+        self.assertEqual(data[-9:], b"\xaf\x01aac\x00\x00\x00\x10")
+
+
+class TestAsyncFLVFileWriter(unittest.IsolatedAsyncioTestCase):
+    async def test_write(self):
+        # given
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "stream.flv")
+            sink = AsyncFLVFileWriter(output=path)
+
+            # when
+            sink.write(0, b"\x17\x00\x00\x00\x00", FLVMediaType.VIDEO)
+            sink.write(20, b"\xaf\x01aac", FLVMediaType.AUDIO)
+            buffered = sink.write_buffer_size()
+            await sink.close()
+            with open(path, "rb") as file:
+                data = file.read()
+
+        # then
+        self.assertEqual(buffered, 15 + 5 + 15 + 5)
+        self.assertEqual(sink.write_buffer_size(), 0)
+        self.assertEqual(len(data), 13 + 15 + 5 + 15 + 5)
+        self.assertEqual(data[13:24], b"\x09\x00\x00\x05\x00\x00\x00\x00\x00\x00\x00")
+        self.assertEqual(data[-9:], b"\xaf\x01aac\x00\x00\x00\x10")
+
+    async def test_write_error(self):
+        # given
+        with tempfile.TemporaryDirectory() as tempdir:
+            sink = AsyncFLVFileWriter(output=os.path.join(tempdir, "stream.flv"))
+            sink.file.buffer.close()
+
+            # when
+            sink.write(0, b"\x17\x00\x00\x00\x00", FLVMediaType.VIDEO)
+            with self.assertRaises(ValueError):
+                await sink.drain()
+
+            # then
+            self.assertEqual(sink.write_buffer_size(), 0)
+            with self.assertRaises(ValueError):
+                sink.write(20, b"\xaf\x01aac", FLVMediaType.AUDIO)
+            with self.assertRaises(ValueError):
+                await sink.close()
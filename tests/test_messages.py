@@ -0,0 +1,353 @@
+import unittest
+
+from bitstring import BitStream
+
+from pyrtmp.amf.serializers import AMF0Deserializer, AMF0Reader, AMF0Serializer
+from pyrtmp.messages import Chunk
+from pyrtmp.messages.aggregate import AggregateMessage
+from pyrtmp.messages.audio import AudioMessage
+from pyrtmp.messages.command import (
+    CommandMessage,
+    NCConnect,
+    NCCreateStream,
+    NetConnectionCommand,
+    NetStreamCommand,
+    NSPublish,
+)
+from pyrtmp.messages.data import MetaDataMessage
+from pyrtmp.messages.factory import MessageFactory
+from pyrtmp.messages.user_control import StreamBegin
+from pyrtmp.messages.video import VideoFrameType, VideoMessage, VideoPacketType
+
+
+def make_chunk(msg_type_id: int, payload: bytes, timestamp: int = 0, msg_stream_id: int = 1) -> Chunk:
+    return Chunk(
+        chunk_type=0,
+        chunk_id=6,
+        timestamp=timestamp,
+        msg_length=len(payload),
+        msg_type_id=msg_type_id,
+        msg_stream_id=msg_stream_id,
+        payload=payload,
+    )
+
+
+class TestMediaMessage(unittest.TestCase):
+    def test_video_message_views(self):
+        # given
+        payload = bytearray(b"\x17\x01\x00\x00\x00frame")
+        chunk = make_chunk(0x09, payload, timestamp=40)
+
+        # when
+        message = VideoMessage.from_chunk(chunk)
+
+        # then
+        self.assertEqual(message.timestamp, 40)
+        self.assertEqual(message.msg_length, len(payload))
+        self.assertEqual(message.control, b"\x17")
+        self.assertEqual(message.data, b"\x01\x00\x00\x00frame")
+        payload[-1] = ord("E")
+        self.assertEqual(message.data, b"\x01\x00\x00\x00framE")
+
+    def test_audio_message_views(self):
+        # given
+        chunk = make_chunk(0x08, b"\xaf\x01aac")
+
+        # when
+        message = AudioMessage.from_chunk(chunk)
+
+        # then
+        self.assertEqual(message.control, b"\xaf")
+        self.assertEqual(message.data, b"\x01aac")
+        self.assertEqual(bytes(message.payload), b"\xaf\x01aac")
+
+    def test_legacy_codec_fields(self):
+        # given, an AVC sequence header, an AVC inter frame with a -40 ms composition time and an AAC frame
+        sequence_header = VideoMessage.from_chunk(make_chunk(0x09, b"\x17\x00\x00\x00\x00\x01\x64"))
+        inter_frame = VideoMessage.from_chunk(make_chunk(0x09, b"\x27\x01\xff\xff\xd8nalu"))
+        audio = AudioMessage.from_chunk(make_chunk(0x08, b"\xaf\x01aac"))
+
+        # then
+        self.assertTrue(sequence_header.is_keyframe)
+        self.assertTrue(sequence_header.is_sequence_header)
+        self.assertEqual((sequence_header.codec_id, sequence_header.fourcc), (7, b"avc1"))
+        self.assertFalse(inter_frame.is_keyframe)
+        self.assertEqual(inter_frame.frame_type, VideoFrameType.INTER_FRAME)
+        self.assertEqual(inter_frame.packet_type, VideoPacketType.CODED_FRAMES)
+        self.assertEqual(inter_frame.composition_time, -40)
+        self.assertFalse(audio.is_enhanced)
+        self.assertEqual((audio.sound_format, audio.fourcc), (10, b"mp4a"))
+        self.assertFalse(audio.is_sequence_header)
+
+    def test_enhanced_codec_fields(self):
+        # given, an HEVC keyframe with a 33 ms composition time, an AV1 sequence start and an Opus sequence start
+        hevc = VideoMessage.from_chunk(make_chunk(0x09, b"\x91hvc1\x00\x00\x21nalu"))
+        av1 = VideoMessage.from_chunk(make_chunk(0x09, b"\x90av01\x81"))
+        opus = AudioMessage.from_chunk(make_chunk(0x08, b"\x90OpusHead"))
+
+        # then
+        self.assertTrue(hevc.is_enhanced)
+        self.assertTrue(hevc.is_keyframe)
+        self.assertFalse(hevc.is_sequence_header)
+        self.assertEqual((hevc.codec_id, hevc.fourcc, hevc.composition_time), (None, b"hvc1", 33))
+        self.assertTrue(av1.is_sequence_header)
+        self.assertEqual((av1.fourcc, av1.packet_type), (b"av01", VideoPacketType.SEQUENCE_START))
+        self.assertTrue(opus.is_enhanced)
+        self.assertTrue(opus.is_sequence_header)
+        self.assertEqual(opus.fourcc, b"Opus")
+
+
+def amf0_payload(*values) -> bytes:
+    data = BitStream()
+    for value in values:
+        AMF0Serializer.create_object(data, value)
+    return data.bytes
+
+
+class TestAggregateMessage(unittest.TestCase):
+    def test_split(self):
+        # given, sub-messages stamped 5000 and 5040 in an aggregate stamped 1000
+        payload = (
+            b"\x08\x00\x00\x02\x00\x13\x88\x00\x00\x00\x00\xaf\x01\x00\x00\x00\x0d"
+            + b"\x09\x00\x00\x03\x00\x13\xb0\x00\x00\x00\x00\x17\x01\x00\x00\x00\x00\x0e"
+        )
+
+        # when
+        message = MessageFactory.from_chunk(make_chunk(0x16, payload, timestamp=1000))
+        audio, video = (MessageFactory.from_chunk(chunk) for chunk in message.messages)
+
+        # then
+        self.assertIsInstance(message, AggregateMessage)
+        self.assertIsInstance(audio, AudioMessage)
+        self.assertIsInstance(video, VideoMessage)
+        self.assertEqual((audio.timestamp, video.timestamp), (1000, 1040))
+        self.assertEqual((audio.msg_stream_id, video.msg_stream_id), (1, 1))
+        self.assertEqual(bytes(audio.payload), b"\xaf\x01")
+        self.assertEqual(bytes(video.payload), b"\x17\x01\x00")
+        # views into the aggregate's payload
+        self.assertIs(video.payload.obj, payload)
+
+    def test_malformed(self):
+        # given
+        audio = b"\x08\x00\x00\x02\x00\x13\x88\x00\x00\x00\x00\xaf\x01"
+        payloads = (
+            # data and back pointer past the end
+            audio + b"\x00\x00",
+            # back pointer not matching the sub-message
+            audio + b"\x00\x00\x00\x0c",
+            # trailing bytes short of a header
+            audio + b"\x00\x00\x00\x0d\x09\x00",
+        )
+
+        # then
+        for payload in payloads:
+            with self.subTest(payload=payload), self.assertRaises(ValueError):
+                AggregateMessage.from_chunk(make_chunk(0x16, payload))
+
+    def test_from_messages(self):
+        # given
+        messages = [make_chunk(0x08, b"\xaf\x01", timestamp=5000), make_chunk(0x09, b"\x17\x01\x00", timestamp=5040)]
+
+        # when
+        message = AggregateMessage.from_messages(messages)
+
+        # then
+        self.assertEqual(message.msg_type_id, 0x16)
+        self.assertEqual(message.timestamp, 5000)
+        self.assertEqual(message.msg_length, len(message.payload))
+        split = AggregateMessage.from_chunk(message).messages
+        self.assertEqual(
+            [(chunk.timestamp, bytes(chunk.payload)) for chunk in split], [(5000, b"\xaf\x01"), (5040, b"\x17\x01\x00")]
+        )
+
+
+class TestAMFMessage(unittest.TestCase):
+    def test_connect(self):
+        # given
+        chunk = make_chunk(0x14, amf0_payload("connect", 1, {"app": "live"}, {"user": "x"}), msg_stream_id=0)
+
+        # when
+        message = MessageFactory.from_chunk(chunk)
+
+        # then
+        self.assertIsInstance(message, NCConnect)
+        self.assertEqual(message.command_name, "connect")
+        self.assertEqual(message.transaction_id, 1)
+        self.assertEqual(message.command_object, {"app": "live"})
+        self.assertEqual(message.optional_user_arguments, {"user": "x"})
+
+    def test_publish(self):
+        # given
+        chunk = make_chunk(0x14, amf0_payload("publish", 5, None, "stream", "live"))
+
+        # when
+        message = NSPublish.from_chunk(chunk)
+
+        # then
+        self.assertEqual(message.transaction_id, 5)
+        self.assertIsNone(message.command_object)
+        self.assertEqual(message.publishing_name, "stream")
+        self.assertEqual(message.publishing_type, "live")
+
+    def test_command_classes(self):
+        # given
+        on_status = make_chunk(0x14, amf0_payload("onStatus", 0, None, {"code": "NetStream.Play.Start"}))
+        call = make_chunk(0x14, amf0_payload("call", 2, None), msg_stream_id=0)
+
+        # when
+        messages = [MessageFactory.from_chunk(chunk) for chunk in (on_status, call)]
+
+        # then
+        self.assertIs(messages[0].__class__, NetStreamCommand)
+        self.assertIs(messages[1].__class__, NetConnectionCommand)
+        self.assertEqual([message.command_name for message in messages], ["onStatus", "call"])
+
+    def test_unknown_command(self):
+        # given
+        chunk = make_chunk(0x14, amf0_payload("FCPublish", 3, None, "stream"))
+
+        # when
+        message = MessageFactory.from_chunk(chunk)
+
+        # then
+        self.assertIs(message.__class__, CommandMessage)
+        self.assertEqual(message.command_name, "FCPublish")
+        self.assertEqual(message.transaction_id, 3)
+
+    def test_register_command(self):
+        # given
+        chunk = make_chunk(0x14, amf0_payload("FCPublish", 3, None, "stream"))
+
+        def decoder(chunk, data, command_name, transaction_id):
+            return command_name, transaction_id, AMF0Deserializer.from_stream(data)
+
+        # when
+        MessageFactory.register_command("FCPublish", decoder)
+        try:
+            message = MessageFactory.from_chunk(chunk)
+        finally:
+            del CommandMessage.decoders["FCPublish"]
+
+        # then
+        self.assertEqual(message, ("FCPublish", 3, None))
+
+    def test_create_response(self):
+        # given
+        connect = MessageFactory.from_chunk(make_chunk(0x14, amf0_payload("connect", 1, {"app": "live"})))
+        create_stream = MessageFactory.from_chunk(make_chunk(0x14, amf0_payload("createStream", 4, None)))
+
+        # when
+        connect_response = connect.create_response()
+        create_stream_response = create_stream.create_response(stream_id=2)
+        second_response = create_stream.create_response()
+
+        # then
+        self.assertIsInstance(create_stream, NCCreateStream)
+        data = BitStream(create_stream_response.payload)
+        self.assertEqual([AMF0Deserializer.from_stream(data) for _ in range(4)], ["_result", 4, None, 2])
+        data = BitStream(second_response.payload)
+        self.assertEqual([AMF0Deserializer.from_stream(data) for _ in range(4)], ["_result", 4, None, 1])
+        data = BitStream(connect_response.payload)
+        self.assertEqual(AMF0Deserializer.from_stream(data), "_result")
+        self.assertEqual(AMF0Deserializer.from_stream(data), 1)
+        self.assertEqual(AMF0Deserializer.from_stream(data)["capabilities"], 31)
+        self.assertEqual(AMF0Deserializer.from_stream(data)["code"], "NetConnection.Connect.Success")
+
+    def test_amf3_connect(self):
+        # given, an AMF3 command message: a format byte, AMF0 values and an AMF3 command object
+        payload = bytearray(b"\x00")
+        AMF0Serializer.create_object(payload, "connect")
+        AMF0Serializer.create_object(payload, 1)
+        AMF0Serializer.write_avmplus_object(payload, {"app": "live", "objectEncoding": 3})
+        connect = MessageFactory.from_chunk(make_chunk(0x11, bytes(payload), msg_stream_id=0))
+        create_stream = MessageFactory.from_chunk(make_chunk(0x11, b"\x00" + amf0_payload("createStream", 4, None)))
+
+        # when
+        connect_response = connect.create_response()
+        create_stream_response = create_stream.create_response(stream_id=2)
+
+        # then
+        self.assertIsInstance(connect, NCConnect)
+        self.assertEqual(connect.command_object, {"app": "live", "objectEncoding": 3})
+        self.assertEqual(connect_response.msg_type_id, 0x11)
+        data = AMF0Reader(connect_response.payload, 1)
+        values = [AMF0Deserializer.from_stream(data) for _ in range(4)]
+        self.assertEqual(values[:2], ["_result", 1])
+        self.assertEqual(values[3]["objectEncoding"], 3)
+        data = AMF0Reader(create_stream_response.payload, 1)
+        self.assertEqual([AMF0Deserializer.from_stream(data) for _ in range(4)], ["_result", 4, None, 2])
+
+    def test_object_encoding(self):
+        # given, AMF3 asked for in an AMF0 connect
+        connect = MessageFactory.from_chunk(make_chunk(0x14, amf0_payload("connect", 1, {"objectEncoding": 3})))
+
+        # when
+        response = connect.create_response()
+
+        # then
+        self.assertEqual(response.msg_type_id, 0x14)
+        data = AMF0Reader(response.payload)
+        self.assertEqual([AMF0Deserializer.from_stream(data) for _ in range(4)][3]["objectEncoding"], 3)
+
+    def test_metadata(self):
+        # given
+        meta = [{"width": 1280.0}, {"height": 720.0}]
+        chunk = make_chunk(0x12, amf0_payload("@setDataFrame", "onMetaData", meta))
+
+        # when
+        message = MessageFactory.from_chunk(chunk)
+
+        # then
+        self.assertIsInstance(message, MetaDataMessage)
+        self.assertEqual(message.command_name, "@setDataFrame")
+        self.assertEqual(message.event, "onMetaData")
+        self.assertEqual(message.meta, meta)
+
+
+class TestMessageFactory(unittest.TestCase):
+    def test_register(self):
+        # given
+        chunk = make_chunk(0x7F, b"custom")
+
+        # when
+        MessageFactory.register(0x7F, lambda c: ("decoded", c))
+        try:
+            message = MessageFactory.from_chunk(chunk)
+        finally:
+            del MessageFactory.decoders[0x7F]
+
+        # then
+        self.assertEqual(message, ("decoded", chunk))
+
+    def test_unknown_type(self):
+        with self.assertRaises(NotImplementedError):
+            MessageFactory.from_chunk(make_chunk(0x7F, b""))
+
+
+class TestSlots(unittest.TestCase):
+    def test_no_instance_dict(self):
+        # given
+        chunk = make_chunk(0x09, b"\x17\x01")
+
+        # when
+        message = VideoMessage.from_chunk(chunk)
+
+        # then
+        self.assertFalse(hasattr(chunk, "__dict__"))
+        self.assertFalse(hasattr(message, "__dict__"))
+        with self.assertRaises(AttributeError):
+            message.extra = 1
+
+    def test_from_header(self):
+        # given
+        chunk = make_chunk(0x04, b"\x00\x00\x00\x00\x00\x01", timestamp=7)
+
+        # when
+        message = StreamBegin.from_chunk(chunk)
+
+        # then
+        self.assertIsInstance(message, StreamBegin)
+        self.assertEqual(message.timestamp, 7)
+        self.assertEqual(message.chunk_id, 6)
+        self.assertEqual(message.event_type, 0)
+        self.assertEqual(message.stream_id, 1)
@@ -4,8 +4,15 @@ from asyncio import StreamReader
 
 from bitstring import BitArray, BitStream
 
-from pyrtmp import BitStreamReader
-from pyrtmp.amf.serializers import AMF0Serializer
+from pyrtmp import BitStreamReader, ByteBuffer, NotEnoughDataException
+from pyrtmp.amf.serializers import (
+    AMF0Deserializer,
+    AMF0Reader,
+    AMF0Serializer,
+    AMF3Deserializer,
+    AMF3Serializer,
+    TypedObject,
+)
 
 
 class MockStreamReader(StreamReader):
@@ -70,6 +77,51 @@ class TestBitStreamReader(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(int32, 8945883)
 
 
+class TestByteBuffer(unittest.TestCase):
+    def test_typed_reads(self):
+        # given
+        buffer = ByteBuffer()
+        buffer.feed(b"\xff\x00\x01\x00\x01\x02\x01\x00\x00\x00")
+
+        # when
+        uint8 = buffer.read_u8()
+        uint24 = buffer.read_u24()
+        uint16 = buffer.read_u16()
+        uint32le = buffer.read_u32le()
+
+        # then
+        self.assertEqual(uint8, 255)
+        self.assertEqual(uint24, 256)
+        self.assertEqual(uint16, 258)
+        self.assertEqual(uint32le, 1)
+        self.assertEqual(len(buffer), 0)
+        with self.assertRaises(NotEnoughDataException):
+            buffer.read_u8()
+
+    def test_compaction_reuses_buffer(self):
+        # given
+        buffer = ByteBuffer(capacity=8)
+        raw = buffer.raw
+        buffer.feed(b"abcdef")
+        buffer.read_exact(6)
+
+        # when
+        buffer.feed(b"ghijkl")
+        reset = buffer.tell()
+        buffer.read_exact(4)
+        buffer.feed(b"mnop")
+        compacted = bytes(buffer.raw[: buffer.end])
+        reused = buffer.raw is raw
+        buffer.feed(b"qrstuvwx")
+
+        # then
+        self.assertEqual(reset, 0)
+        self.assertEqual(compacted, b"klmnop")
+        self.assertTrue(reused)
+        self.assertIsNot(buffer.raw, raw)
+        self.assertEqual(bytes(buffer.read_exact(len(buffer))), b"klmnopqrstuvwx")
+
+
 class AMF0SerializerTestCase(unittest.TestCase):
     def test_write_boolean_object(self):
         # given
@@ -168,3 +220,99 @@ class AMF0SerializerTestCase(unittest.TestCase):
             + b"key2\x00@\x00\x00\x00\x00\x00\x00\x00\x00\x04"
             + b"key3\x01\x01\x00\x00\t",
         )
+
+
+class AMF0DeserializerTestCase(unittest.TestCase):
+    def test_nested_object(self):
+        # given
+        data = BitStream()
+        AMF0Serializer.create_object(data, {"app": "live", "tcUrl": {"port": 1935}})
+        AMF0Serializer.create_object(data, "next")
+
+        # when
+        obj = AMF0Deserializer.from_stream(data)
+        following = AMF0Deserializer.from_stream(data)
+
+        # then
+        self.assertEqual(obj, {"app": "live", "tcUrl": {"port": 1935}})
+        self.assertEqual(following, "next")
+
+    def test_bytearray_round_trip(self):
+        # given
+        data = bytearray()
+        meta = [{"width": 1280.0}, {"encoder": "obs-output module (libobs version 30.0.0)"}, {"stereo": True}]
+        AMF0Serializer.create_object(data, "@setDataFrame")
+        AMF0Serializer.create_object(data, {"app": "live/ü", "tcUrl": {"port": 1935}, "fpad": False})
+        AMF0Serializer.write_array_object(data, meta)
+        AMF0Serializer.write_null_object(data)
+        reader = AMF0Reader(memoryview(data))
+
+        # when
+        values = [AMF0Deserializer.from_stream(reader) for _ in range(4)]
+
+        # then
+        self.assertEqual(data[:16], b"\x02\x00\x0d@setDataFrame")
+        self.assertEqual(values[0], "@setDataFrame")
+        self.assertEqual(values[1], {"app": "live/ü", "tcUrl": {"port": 1935}, "fpad": False})
+        self.assertEqual(values[2], meta)
+        self.assertIsNone(values[3])
+        self.assertEqual(reader.remaining, 0)
+
+
+class AMF3TestCase(unittest.TestCase):
+    def test_references(self):
+        # given
+        data = bytearray()
+        cue = {"name": "cue", "time": 1.5}
+
+        # when
+        AMF3Serializer().create_object(data, ["cue", "cue", cue, cue, {"name": "end", "time": -2}])
+
+        # then
+        self.assertEqual(
+            data,
+            b"\x09\x0b\x01"
+            # string, then a reference to it
+            + b"\x06\x07cue\x06\x00"
+            # dynamic anonymous traits, the "name" key and "cue" value as references
+            + b"\x0a\x0b\x01\x09name\x06\x00\x09time\x05\x3f\xf8\x00\x00\x00\x00\x00\x00\x01"
+            # the same object, then a new one with the traits as a reference
+            + b"\x0a\x02\x0a\x01\x02\x06\x07end\x04\x04\xff\xff\xff\xfe\x01",
+        )
+
+    def test_round_trip(self):
+        # given
+        data = bytearray()
+        first = TypedObject("flex.Caption", {"text": "hello", "line": 1})
+        second = TypedObject("flex.Caption", {"text": "world", "line": 2})
+        value = {
+            "captions": [first, second],
+            "raw": b"\x00\x01",
+            "big": 1 << 40,
+            "offset": -2,
+            "flag": True,
+            "none": None,
+        }
+        AMF0Serializer.write_avmplus_object(data, value)
+        AMF0Serializer.create_object(data, "next")
+        reader = AMF0Reader(data)
+
+        # when
+        decoded = AMF0Deserializer.from_stream(reader)
+        following = AMF0Deserializer.from_stream(reader)
+
+        # then
+        self.assertEqual(decoded, value)
+        self.assertEqual(decoded["captions"][1].class_name, "flex.Caption")
+        self.assertEqual(following, "next")
+        self.assertEqual(reader.remaining, 0)
+
+    def test_associative_array(self):
+        # given, an array with a "mode" key and two dense items
+        data = b"\x09\x05\x09mode\x06\x07cue\x01\x04\x01\x04\x02"
+
+        # when
+        value = AMF3Deserializer().from_stream(AMF0Reader(data))
+
+        # then
+        self.assertEqual(value, {"mode": "cue", 0: 1, 1: 2})
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import unittest
+
+from pyrtmp.connection import RTMPConnection
+from pyrtmp.messages import Chunk
+from pyrtmp.messages.aggregate import AggregateMessage
+from pyrtmp.messages.data import MetaDataMessage
+from pyrtmp.messages.handshake import C0, C1, C2
+from pyrtmp.messages.protocol_control import SetChunkSize
+from pyrtmp.rtmp import SimpleRTMPController
+from pyrtmp.session_manager import SessionManager
+
+
+class CustomMetaDataMessage(MetaDataMessage):
+    pass
+
+
+class TestMessageHandlers(unittest.TestCase):
+    def test_builtin_handlers(self):
+        # given
+        controller = SimpleRTMPController()
+
+        # when
+        handlers = controller.bind_message_handlers()
+
+        # then
+        self.assertEqual(handlers[SetChunkSize], controller.on_set_chunk_size)
+        self.assertEqual(handlers[CustomMetaDataMessage], controller.on_metadata)
+        self.assertEqual(handlers[Chunk], controller.on_unknown_message)
+
+    def test_register_handler(self):
+        # given
+        class Controller(SimpleRTMPController):
+            pass
+
+        class ChildController(Controller):
+            pass
+
+        async def on_aggregate(controller, session, message):
+            pass
+
+        ChildController.resolve_message_handlers()
+
+        # when
+        Controller.register_handler(AggregateMessage, on_aggregate)
+        handlers = ChildController().bind_message_handlers()
+
+        # then
+        self.assertEqual(handlers[AggregateMessage].__func__, on_aggregate)
+        self.assertNotIn(AggregateMessage, SimpleRTMPController.resolve_message_handlers())
+
+
+class TestSessionCallback(unittest.IsolatedAsyncioTestCase):
+    async def test_aggregate_skips_unknown_messages(self):
+        # given
+        class Controller(SimpleRTMPController):
+            def __init__(self):
+                self.videos = []
+                super().__init__()
+
+            async def on_video_message(self, session, message):
+                self.videos.append(bytes(message.payload))
+
+        controller = Controller()
+        session = SessionManager(reader=None, writer=None, peer=("127.0.0.1", 1935))
+        task = asyncio.create_task(controller.session_callback(session))
+
+        def chunk(msg_type_id: int, payload: bytes) -> Chunk:
+            return Chunk(
+                chunk_type=0,
+                chunk_id=6,
+                timestamp=0,
+                msg_length=len(payload),
+                msg_type_id=msg_type_id,
+                msg_stream_id=1,
+                payload=payload,
+            )
+
+        aggregate = AggregateMessage.from_messages([chunk(0x07, b"\x00\x01"), chunk(0x09, b"\x27\x01\x00")])
+
+        # when
+        with self.assertLogs("pyrtmp.rtmp", level="WARNING") as logs:
+            session.receive_bytes(
+                C0(protocol_version=3).to_bytes()
+                + C1(time=0, zero=0, random=os.urandom(1528)).to_bytes()
+                + C2(time1=0, time2=0, random=os.urandom(1528)).to_bytes()
+                + bytes(RTMPConnection().encode_message(aggregate))
+            )
+            session.feed_eof()
+            await task
+
+        # then
+        self.assertEqual(controller.videos, [b"\x27\x01\x00"])
+        self.assertIn("unknown type 7", logs.output[0])
@@ -0,0 +1,459 @@
+import asyncio
+import os
+import socket
+import time
+import unittest
+
+from pyrtmp.chunk_size import FixedChunkSizePolicy
+from pyrtmp.connection import HandshakeState, RTMPConnection
+from pyrtmp.flv import FLVMediaType, MediaSink
+from pyrtmp.messages import Chunk
+from pyrtmp.messages.aggregate import AggregateMessage
+from pyrtmp.messages.handshake import C0, C1, C2
+from pyrtmp.messages.protocol_control import Acknowledgement, LimitType, WindowAcknowledgementSize
+from pyrtmp.session_manager import SessionManager, WriteMode
+from pyrtmp.shaping import EgressShaper
+
+
+class SlowSink(MediaSink):
+    def __init__(self) -> None:
+        self.buffered = 0
+        self.drained = asyncio.Event()
+        super().__init__()
+
+    def write(self, timestamp: int, payload: bytes, media_type: FLVMediaType) -> None:
+        self.buffered += len(payload)
+
+    def write_buffer_size(self) -> int:
+        return self.buffered
+
+    async def drain(self) -> None:
+        await self.drained.wait()
+        self.buffered = 0
+
+    async def close(self) -> None:
+        pass
+
+
+class TestSessionManager(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        accepted = asyncio.get_running_loop().create_future()
+
+        async def on_client(reader, writer):
+            accepted.set_result(writer)
+
+        self.server = await asyncio.start_server(on_client, host="127.0.0.1", port=0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", port)
+        self.server_writer = await accepted
+
+    async def asyncTearDown(self):
+        self.writer.close()
+        self.server_writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def test_low_latency(self):
+        # given
+        session = SessionManager(reader=None, writer=self.server_writer, write_mode=WriteMode.LOW_LATENCY)
+
+        # when
+        for _ in range(5):
+            session.write_chunk_to_stream(WindowAcknowledgementSize(ack_window_size=5000000))
+
+        # then
+        sock = self.server_writer.get_extra_info("socket")
+        self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 1)
+        # headers of 12, 4 then 1 byte
+        self.assertEqual(session.writelines_calls, 5)
+        self.assertEqual(session.bytes_written, 16 + 8 + 3 * 5)
+        self.assertEqual(session.bytes_per_writelines, 39 / 5)
+
+    async def test_without_writer(self):
+        # given
+        session = SessionManager(reader=None, writer=None, peer=("127.0.0.1", 1935))
+        c1 = C1(time=0, zero=0, random=os.urandom(1528))
+        c2 = C2(time1=0, time2=0, random=os.urandom(1528))
+        handshake = asyncio.create_task(session.handshake())
+
+        # when
+        session.receive_bytes(C0(protocol_version=3).to_bytes() + c1.to_bytes())
+        s0s1s2 = session.connection.data_to_send()
+        session.receive_bytes(c2.to_bytes())
+        await handshake
+        session.write_chunk_to_stream(WindowAcknowledgementSize(ack_window_size=5000000))
+        await session.drain()
+
+        # then
+        self.assertEqual(len(s0s1s2), 1 + 1536 + 1536)
+        self.assertEqual(session.peername, "127.0.0.1:1935")
+        self.assertEqual(session.backlog, 16)
+        self.assertEqual(session.writelines_calls, 0)
+        self.assertEqual(len(session.connection.data_to_send()), 16)
+
+    async def test_throughput(self):
+        # given
+        session = SessionManager(reader=None, writer=self.server_writer, write_mode=WriteMode.THROUGHPUT)
+
+        # when
+        for _ in range(5):
+            session.write_chunk_to_stream(WindowAcknowledgementSize(ack_window_size=5000000))
+        writelines_calls = session.writelines_calls
+        await asyncio.sleep(0)
+        data = await asyncio.wait_for(self.reader.readexactly(16 + 8 + 3 * 5), timeout=5)
+
+        # then
+        sock = self.server_writer.get_extra_info("socket")
+        self.assertEqual(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 0)
+        self.assertEqual(writelines_calls, 0)
+        self.assertEqual(session.writelines_calls, 1)
+        self.assertEqual(session.bytes_written, len(data))
+
+    async def test_throughput_flush_bytes(self):
+        # given
+        session = SessionManager(
+            reader=None,
+            writer=self.server_writer,
+            write_mode=WriteMode.THROUGHPUT,
+            flush_bytes=20,
+        )
+
+        # when
+        for _ in range(5):
+            session.write_chunk_to_stream(WindowAcknowledgementSize(ack_window_size=5000000))
+        writelines_calls = session.writelines_calls
+        await session.drain()
+
+        # then
+        self.assertEqual(writelines_calls, 1)
+        self.assertEqual(session.writelines_calls, 2)
+        self.assertEqual(session.bytes_written, 16 + 8 + 3 * 5)
+
+    async def test_write_buffer_limit(self):
+        # given
+        session = SessionManager(reader=None, writer=self.server_writer, write_buffer_limit=1024)
+        payload = os.urandom(256 * 1024)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=len(payload),
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=payload,
+        )
+        size = 12 + len(payload) + (len(payload) // 128 - 1)
+
+        # when
+        session.write_chunk_to_stream(video)
+        queued = session.connection.outgoing_bytes
+        received, _ = await asyncio.gather(
+            asyncio.wait_for(self.reader.readexactly(size), timeout=5),
+            session.drain(),
+        )
+
+        # then
+        self.assertGreater(queued, 0)
+        self.assertEqual(session.connection.outgoing_bytes, 0)
+        self.assertEqual(session.bytes_written, size)
+        self.assertEqual(received[12:140], payload[:128])
+
+    async def test_chunk_size_policy(self):
+        # given
+        session = SessionManager(
+            reader=None,
+            writer=self.server_writer,
+            chunk_size_policy=FixedChunkSizePolicy(chunk_size=4096),
+        )
+        peer = RTMPConnection()
+        peer.handshake_state = HandshakeState.DONE
+        payload = os.urandom(10000)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=len(payload),
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=payload,
+        )
+
+        # when
+        session.write_chunk_to_stream(video)
+        session.write_chunk_to_stream(video)
+        await session.drain()
+        size = session.bytes_written
+        messages = peer.receive_bytes(await asyncio.wait_for(self.reader.readexactly(size), timeout=5))
+
+        # then
+        self.assertEqual(session.writer_chunk_size, 4096)
+        self.assertEqual([message.msg_type_id for message in messages], [0x01, 0x09, 0x09])
+        self.assertEqual(peer.reader_chunk_size, 4096)
+        self.assertEqual(messages[2].payload, payload)
+
+    async def test_shaper(self):
+        # given
+        session = SessionManager(
+            reader=None,
+            writer=self.server_writer,
+            shaper=EgressShaper(session_rate=100000),
+        )
+        payload = os.urandom(30000)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=len(payload),
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=payload,
+        )
+
+        # when
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(5):
+            session.write_chunk_to_stream(video)
+        await session.drain()
+        elapsed = loop.time() - start
+        received = await asyncio.wait_for(self.reader.readexactly(session.bytes_written), timeout=5)
+
+        # then
+        # a second's burst, then 100000 bytes per second
+        self.assertEqual(session.connection.outgoing_bytes, 0)
+        self.assertEqual(received[12:140], payload[:128])
+        self.assertGreater(elapsed, 0.4)
+        self.assertGreater(session.writelines_calls, 1)
+
+    async def test_peer_bandwidth(self):
+        # given
+        session = SessionManager(reader=None, writer=self.server_writer, writer_chunk_size=4096)
+        session.connection.handshake_state = HandshakeState.DONE
+        session.write_chunk_to_stream(WindowAcknowledgementSize(ack_window_size=1000))
+        session.connection.apply_peer_bandwidth(5000, LimitType.HARD)
+        payload = os.urandom(20000)
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=len(payload),
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=payload,
+        )
+
+        def acknowledge(nbytes: int) -> None:
+            data = RTMPConnection().encode_message(Acknowledgement(seq_number=nbytes))
+            session.get_buffer(len(data))[: len(data)] = data
+            session.buffer_updated(len(data))
+
+        # when
+        session.write_chunk_to_stream(video)
+        await session.drain()
+        batches = [session.bytes_written]
+        while session.connection.outgoing_bytes:
+            acknowledge(session.bytes_written)
+            await session.drain()
+            batches.append(session.bytes_written - sum(batches))
+
+        # then
+        # each batch up to a chunk past the window, once the previous one was acknowledged
+        self.assertEqual(len(batches), 3)
+        self.assertTrue(all(size < 5000 + 4096 + 1 for size in batches))
+        # both window acknowledgement sizes, the second one advertising the peer bandwidth
+        self.assertEqual(session.bytes_written, 16 + 8 + 12 + 20000 + 4)
+        self.assertEqual(session.connection.ack_window_size, 5000)
+
+    async def test_high_water_drops_media(self):
+        # given
+        session = SessionManager(
+            reader=None,
+            writer=self.server_writer,
+            write_buffer_limit=1024,
+            high_water=20000,
+            low_water=10000,
+        )
+        peer = RTMPConnection()
+        peer.handshake_state = HandshakeState.DONE
+
+        def media(msg_type_id: int, first: int, size: int) -> Chunk:
+            return Chunk(
+                chunk_type=0,
+                chunk_id=6 if msg_type_id == 0x09 else 4,
+                timestamp=0,
+                msg_length=size,
+                msg_type_id=msg_type_id,
+                msg_stream_id=1,
+                # coded frames, never a sequence header
+                payload=bytes([first, 0x01]) + os.urandom(size - 2),
+            )
+
+        keyframe = media(0x09, 0x17, 10000)
+        audio = media(0x08, 0xAF, 500)
+        control = WindowAcknowledgementSize(ack_window_size=5000000)
+
+        # when
+        session.write_chunk_to_stream(keyframe)
+        session.write_chunk_to_stream(audio)
+        session.write_chunk_to_stream(media(0x09, 0x27, 10000))
+        session.write_chunk_to_stream(media(0x09, 0x27, 10000))
+        session.write_chunk_to_stream(control)
+        session.write_chunk_to_stream(media(0x09, 0x27, 10000))
+        session.write_chunk_to_stream(audio)
+        await session.drain()
+        messages = peer.receive_bytes(await asyncio.wait_for(self.reader.readexactly(session.bytes_written), timeout=5))
+
+        # then
+        # both inter frames were dropped, so is the one after them (its reference is gone)
+        self.assertEqual(session.dropped_video_messages, 3)
+        self.assertEqual(session.dropped_audio_messages, 0)
+        self.assertEqual(session.dropped_bytes, 30000)
+        # audio and control messages overtake the rest of the keyframe
+        self.assertEqual([message.msg_type_id for message in messages], [0x08, 0x05, 0x08, 0x09])
+        self.assertEqual(messages[3].payload, keyframe.payload)
+
+    async def test_high_water_keeps_sequence_headers(self):
+        # given
+        session = SessionManager(
+            reader=None,
+            writer=self.server_writer,
+            write_buffer_limit=1024,
+            high_water=20000,
+            low_water=10000,
+        )
+        peer = RTMPConnection()
+        peer.handshake_state = HandshakeState.DONE
+
+        def media(msg_type_id: int, header: bytes, size: int) -> Chunk:
+            return Chunk(
+                chunk_type=0,
+                chunk_id=6 if msg_type_id == 0x09 else 4,
+                timestamp=0,
+                msg_length=size,
+                msg_type_id=msg_type_id,
+                msg_stream_id=1,
+                payload=header + os.urandom(size - len(header)),
+            )
+
+        avc_sequence_header = media(0x09, b"\x17\x00\x00\x00\x00", 40)
+        aac_sequence_header = media(0x08, b"\xaf\x00", 4)
+        keyframe = media(0x09, b"\x17\x01", 10000)
+
+        # when, both sequence headers are queued when the backlog crosses high water
+        session.write_chunk_to_stream(media(0x09, b"\x17\x01", 10000))
+        session.write_chunk_to_stream(avc_sequence_header)
+        session.write_chunk_to_stream(aac_sequence_header)
+        session.write_chunk_to_stream(keyframe)
+        session.write_chunk_to_stream(media(0x09, b"\x27\x01", 10000))
+        await session.drain()
+        messages = peer.receive_bytes(await asyncio.wait_for(self.reader.readexactly(session.bytes_written), timeout=5))
+
+        # then
+        self.assertEqual(session.dropped_video_messages, 2)
+        self.assertEqual(session.dropped_audio_messages, 0)
+        payloads = [bytes(message.payload) for message in messages]
+        self.assertIn(avc_sequence_header.payload, payloads)
+        self.assertIn(aac_sequence_header.payload, payloads)
+        self.assertNotIn(keyframe.payload, payloads)
+
+    async def test_pending_messages_pause_reading(self):
+        # given
+        session = SessionManager(reader=None, writer=self.server_writer, read_buffer_limit=150000)
+        session.connection.handshake_state = HandshakeState.DONE
+        transport = self.server_writer.transport
+        video = Chunk(
+            chunk_type=0,
+            chunk_id=6,
+            timestamp=0,
+            msg_length=100000,
+            msg_type_id=0x09,
+            msg_stream_id=1,
+            payload=os.urandom(100000),
+        )
+        data = bytes(RTMPConnection().encode_message(video)) * 3
+        chunks = session.read_chunks_from_stream()
+
+        # when
+        session.get_buffer(len(data))[: len(data)] = data
+        session.buffer_updated(len(data))
+        received = transport.is_reading()
+        await chunks.__anext__()
+        await chunks.__anext__()
+        second = transport.is_reading()
+        await chunks.__anext__()
+        third = transport.is_reading()
+
+        # then
+        self.assertFalse(received)
+        self.assertFalse(second)
+        self.assertTrue(third)
+        self.assertEqual(session.read_buffer_pauses, 1)
+        self.assertEqual(session.pending_bytes, 100000)
+
+    async def test_sink_pauses_reading(self):
+        # given
+        session = SessionManager(reader=None, writer=self.server_writer, sink_buffer_limit=1000)
+        session.sink = SlowSink()
+        transport = self.server_writer.transport
+
+        # when
+        session.sink.write(0, bytes(800), FLVMediaType.VIDEO)
+        await session.wait_sink()
+        below_limit = transport.is_reading()
+        session.sink.write(0, bytes(800), FLVMediaType.VIDEO)
+        task = asyncio.create_task(session.wait_sink())
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        await asyncio.sleep(0.1)
+        slept = time.monotonic() - started
+        paused = transport.is_reading(), session.reading_paused
+        session.sink.drained.set()
+        await task
+
+        # then
+        self.assertTrue(below_limit)
+        self.assertEqual(paused, (False, True))
+        self.assertTrue(transport.is_reading())
+        self.assertFalse(session.reading_paused)
+        self.assertEqual(session.reading_pauses, 1)
+        self.assertGreaterEqual(session.reading_paused_time, slept)
+
+    async def test_aggregate_media(self):
+        # given
+        session = SessionManager(
+            reader=None,
+            writer=self.server_writer,
+            write_mode=WriteMode.THROUGHPUT,
+            aggregate_bytes=1024,
+        )
+        peer = RTMPConnection()
+        peer.handshake_state = HandshakeState.DONE
+
+        def media(msg_type_id: int, timestamp: int, size: int) -> Chunk:
+            return Chunk(
+                chunk_type=0,
+                chunk_id=6 if msg_type_id == 0x09 else 4,
+                timestamp=timestamp,
+                msg_length=size,
+                msg_type_id=msg_type_id,
+                msg_stream_id=1,
+                payload=bytes([0x27 if msg_type_id == 0x09 else 0xAF]) + os.urandom(size - 1),
+            )
+
+        small = [media(0x08, 100, 200), media(0x09, 120, 300), media(0x08, 123, 200)]
+        large = media(0x09, 160, 2000)
+
+        # when
+        session.write_chunks_to_stream([*small, large, WindowAcknowledgementSize(ack_window_size=5000000)])
+        await session.drain()
+        messages = peer.receive_bytes(await asyncio.wait_for(self.reader.readexactly(session.bytes_written), timeout=5))
+
+        # then
+        self.assertEqual(session.aggregated_messages, 3)
+        self.assertEqual([message.msg_type_id for message in messages], [0x05, 0x16, 0x09])
+        aggregate = AggregateMessage.from_chunk(messages[1])
+        self.assertEqual(
+            [(message.msg_type_id, message.timestamp, bytes(message.payload)) for message in aggregate.messages],
+            [(message.msg_type_id, message.timestamp, message.payload) for message in small],
+        )
+        self.assertEqual(messages[2].payload, large.payload)
@@ -0,0 +1,73 @@
+import unittest
+
+from pyrtmp.shaping import EgressShaper, TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refill(self):
+        # given
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1000, burst=500, clock=clock)
+
+        # when
+        bucket.consume(800)
+        debt = bucket.available()
+        wait = bucket.delay(100)
+        clock.now = 0.4
+        refilled = bucket.available()
+        clock.now = 10
+        full = bucket.available()
+
+        # then
+        self.assertEqual(debt, -300)
+        self.assertAlmostEqual(wait, 0.4)
+        self.assertAlmostEqual(refilled, 100)
+        self.assertEqual(full, 500)
+
+
+class TestEgressShaper(unittest.TestCase):
+    def test_unlimited(self):
+        # given
+        shaper = EgressShaper()
+
+        # then
+        self.assertIsNone(shaper.allowance())
+        self.assertIsNone(shaper.stream_budgets([1]))
+        self.assertEqual(shaper.delay(1000), 0.0)
+
+    def test_global_bucket(self):
+        # given
+        clock = FakeClock()
+        shared = TokenBucket(rate=1000, clock=clock)
+        first = EgressShaper(global_bucket=shared, clock=clock)
+        second = EgressShaper(session_rate=5000, global_bucket=shared, clock=clock)
+
+        # when
+        first.consume(700)
+
+        # then
+        self.assertEqual(second.allowance(), 300)
+        self.assertAlmostEqual(second.delay(500), 0.2)
+
+    def test_stream_budgets(self):
+        # given
+        clock = FakeClock()
+        shaper = EgressShaper(stream_rate=1000, clock=clock)
+
+        # when
+        budgets = shaper.stream_budgets([1, 3])
+        shaper.consume(1500, {1: 1500})
+
+        # then
+        self.assertEqual(budgets, {1: 1000, 3: 1000})
+        self.assertEqual(shaper.stream_budgets([1, 3]), {1: -500, 3: 1000})
+        self.assertAlmostEqual(shaper.delay(1, [1]), 0.501)
+        self.assertEqual(shaper.delay(1, [1, 3]), 0.0)